@@ -1,65 +1,150 @@
 import sqlite3
 import os
+import threading
+from typing import Iterable
+
+SCHEMA_VERSION = 1
+
 
 class Database:
     def __init__(self, db_path="data/bot.db"):
         self.db_path = db_path
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, cached_statements=256)
+        self.lock = threading.RLock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
         self.init_db()
 
     def init_db(self):
-        """Инициализирует базу данных и создает таблицу users."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
+        """Инициализирует базу данных: таблицы users и user_permissions, миграция старой схемы."""
+        with self.lock, self.conn:
+            self.conn.execute("""
                 CREATE TABLE IF NOT EXISTS users (
-                    chat_id INTEGER PRIMARY KEY,
-                    permissions TEXT
+                    chat_id INTEGER PRIMARY KEY
                 )
             """)
-            conn.commit()
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS user_permissions (
+                    chat_id INTEGER NOT NULL REFERENCES users(chat_id) ON DELETE CASCADE,
+                    permission TEXT NOT NULL,
+                    PRIMARY KEY (chat_id, permission)
+                ) WITHOUT ROWID
+            """)
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_user_permissions_permission ON user_permissions (permission, chat_id)")
+
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < 1:
+                self._migrate_permissions_column()
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _migrate_permissions_column(self):
+        """Переносит права из устаревшего столбца users.permissions в таблицу user_permissions."""
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(users)")]
+        if "permissions" not in columns:
+            return
+        rows = self.conn.execute("SELECT chat_id, permissions FROM users WHERE permissions IS NOT NULL").fetchall()
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO user_permissions (chat_id, permission) VALUES (?, ?)",
+            [(chat_id, p.strip()) for chat_id, permissions in rows for p in permissions.split(",") if p.strip()])
+        self.conn.execute("UPDATE users SET permissions = NULL")
+
+    def execute(self, sql: str, params: Iterable = ()) -> sqlite3.Cursor:
+        """Выполняет запрос на изменение данных в отдельной транзакции."""
+        with self.lock, self.conn:
+            return self.conn.execute(sql, params)
+
+    def executemany(self, sql: str, params: Iterable[Iterable]):
+        """Выполняет запрос для набора параметров в одной транзакции."""
+        with self.lock, self.conn:
+            self.conn.executemany(sql, params)
+
+    def executescript(self, script: str):
+        """Выполняет SQL-скрипт (создание таблиц модулей)."""
+        with self.lock:
+            self.conn.executescript(script)
+
+    def query(self, sql: str, params: Iterable = ()) -> list:
+        """Выполняет запрос на чтение и возвращает все строки."""
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
 
     def user_exists(self, chat_id: int) -> bool:
         """Проверяет, существует ли пользователь в базе."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT 1 FROM users WHERE chat_id = ?", (chat_id,))
-            return cursor.fetchone() is not None
+        return bool(self.query("SELECT 1 FROM users WHERE chat_id = ?", (chat_id,)))
 
-    def add_user(self, chat_id: int, permissions: str = ""):
+    def add_user(self, chat_id: int, permissions: Iterable[str] = ()):
         """Добавляет пользователя с указанными правами (по умолчанию без прав)."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("INSERT OR REPLACE INTO users (chat_id, permissions) VALUES (?, ?)",
-                          (chat_id, permissions))
-            conn.commit()
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO users (chat_id) VALUES (?)", (chat_id,))
+            self._set_permissions(chat_id, permissions)
 
     def remove_user(self, chat_id: int):
         """Удаляет пользователя из базы."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM users WHERE chat_id = ?", (chat_id,))
-            conn.commit()
-
-    def update_permissions(self, chat_id: int, permissions: str):
-        """Обновляет права пользователя."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("UPDATE users SET permissions = ? WHERE chat_id = ?",
-                          (permissions, chat_id))
-            conn.commit()
-
-    def get_user_permissions(self, chat_id: int) -> str:
+        self.execute("DELETE FROM users WHERE chat_id = ?", (chat_id,))
+
+    def update_permissions(self, chat_id: int, permissions: Iterable[str]):
+        """Заменяет права пользователя."""
+        with self.lock, self.conn:
+            self._set_permissions(chat_id, permissions)
+
+    def _set_permissions(self, chat_id: int, permissions: Iterable[str]):
+        self.conn.execute("DELETE FROM user_permissions WHERE chat_id = ?", (chat_id,))
+        self.conn.executemany("INSERT OR IGNORE INTO user_permissions (chat_id, permission) VALUES (?, ?)",
+                              [(chat_id, p) for p in permissions])
+
+    def grant_permission(self, permission: str, chat_ids: Iterable[int]):
+        """Выдает право сразу нескольким пользователям."""
+        self.executemany("INSERT OR IGNORE INTO user_permissions (chat_id, permission) VALUES (?, ?)",
+                         [(chat_id, permission) for chat_id in chat_ids])
+
+    def revoke_permission(self, permission: str, chat_ids: Iterable[int] | None = None):
+        """Отзывает право у указанных пользователей или у всех, если список не задан."""
+        if chat_ids is None:
+            self.execute("DELETE FROM user_permissions WHERE permission = ?", (permission,))
+        else:
+            self.executemany("DELETE FROM user_permissions WHERE permission = ? AND chat_id = ?",
+                             [(permission, chat_id) for chat_id in chat_ids])
+
+    def get_user_permissions(self, chat_id: int) -> set[str]:
         """Возвращает права пользователя."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT permissions FROM users WHERE chat_id = ?", (chat_id,))
-            result = cursor.fetchone()
-            return result[0] if result else ""
+        rows = self.query("SELECT permission FROM user_permissions WHERE chat_id = ?", (chat_id,))
+        return {row[0] for row in rows}
+
+    def users_with_permission(self, permission: str) -> list[int]:
+        """Возвращает chat_id всех пользователей с указанным правом."""
+        rows = self.query("SELECT chat_id FROM user_permissions WHERE permission = ? ORDER BY chat_id", (permission,))
+        return [row[0] for row in rows]
+
+    def all_permissions(self) -> dict[int, set[str]]:
+        """Возвращает права всех пользователей, включая пользователей без прав."""
+        result: dict[int, set[str]] = {}
+        rows = self.query("""
+            SELECT u.chat_id, p.permission FROM users u
+            LEFT JOIN user_permissions p ON p.chat_id = u.chat_id
+        """)
+        for chat_id, permission in rows:
+            permissions = result.setdefault(chat_id, set())
+            if permission:
+                permissions.add(permission)
+        return result
 
     def list_users(self) -> list:
         """Возвращает список всех пользователей и их прав."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT chat_id, permissions FROM users")
-            return cursor.fetchall()
\ No newline at end of file
+        return self.query("""
+            SELECT u.chat_id, group_concat(p.permission, ',') FROM users u
+            LEFT JOIN user_permissions p ON p.chat_id = u.chat_id
+            GROUP BY u.chat_id
+        """)
+
+
+_databases: dict[str, Database] = {}
+
+
+def get_database(db_path="data/bot.db") -> Database:
+    """Возвращает общее долгоживущее подключение к базе бота."""
+    if db_path not in _databases:
+        _databases[db_path] = Database(db_path)
+    return _databases[db_path]
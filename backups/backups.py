@@ -1,227 +1,375 @@
+import asyncio
+import logging
 import paramiko
 import os
+import re
+import shlex
+from collections import deque
 from datetime import datetime
 from telegram import Update
 from telegram.ext import ContextTypes
-from auth.auth import Auth
-from utils.ssh import connect_ssh, execute_ssh_command, download_file
-from utils.telegram import send_unauthorized_message, send_paginated_message
-from config import VPS_HOST, VPS_USERNAME, VPS_KEY_PATH, VPS_PASSWORD, BACKUP_DIR
+from auth.auth import get_auth
+from utils.ssh import ssh_pool, execute_ssh_command, download_file, SSHCommandStream
+from utils.telegram import reply, send_unauthorized_message, send_paginated_message, LiveMessage
+from config import BACKUP_DIR, BACKUP_FULL_INTERVAL_DAYS, BACKUP_MAX_CHAIN, BACKUP_TIMEOUT
+from .catalog import get_backup_catalog, BackupEntry
+
+logger = logging.getLogger(__name__)
+
+MISSING_SNAPSHOT_STATUS = 4
+TIMEOUT_STATUS = 124
+# tar отмечает прогресс каждые PROGRESS_RECORDS записей по 10 КиБ, т.е. каждые 10 МиБ несжатых данных
+PROGRESS_RECORDS = 1024
+PROGRESS_MARKER = "__backup_progress__"
+PROGRESS_PATTERN = re.compile(r"\(([^,]+), ([^)]+)\)")
+MAX_WARNING_LINES = 20
+# Инкрементные копии одной директории создаются строго по очереди: иначе две копии выберут одного родителя
+_backup_locks: dict[str, asyncio.Lock] = {}
 
 
 async def create_backup(ssh: paramiko.SSHClient, path: str, update: Update):
     """Создает архив указанной директории и сохраняет в BACKUP_DIR."""
     command = f'test -d {path} && echo "exists"'
-    stdout, stderr, exit_status = execute_ssh_command(ssh, command)
+    stdout, stderr, exit_status = await execute_ssh_command(ssh, command)
     if exit_status != 0 or stdout.strip() != "exists":
-        await update.message.reply_text(f"Директория {path} не существует на сервере.")
+        await reply(update, f"Директория {path} не существует на сервере.")
         return
 
     command = f'mkdir -p {BACKUP_DIR}'
-    execute_ssh_command(ssh, command)
+    await execute_ssh_command(ssh, command)
 
     dir_name = os.path.basename(path.rstrip("/"))
     timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
     backup_name = f"{dir_name}_{timestamp}.tar.gz"
     backup_path = f"{BACKUP_DIR}/{backup_name}"
 
-    await update.message.reply_text(f"Создаю резервную копию {path}...")
+    await reply(update, f"Создаю резервную копию {path}...")
     command = f'tar -czf {backup_path} -C {os.path.dirname(path)} {os.path.basename(path)}'
-    stdout, stderr, exit_status = execute_ssh_command(ssh, command)
+    stdout, stderr, exit_status = await execute_ssh_command(ssh, command)
+
+    if exit_status != 0:
+        await reply(update, f"Ошибка при создании резервной копии: {stderr}")
+        return
+
+    await reply(update, f"Резервная копия создана: {backup_name}")
+
+
+def snapshot_path(backup_name: str) -> str:
+    """Файл снимка GNU tar (--listed-incremental), сохраненный рядом с архивом."""
+    return f"{BACKUP_DIR}/{backup_name.removesuffix('.tar.gz')}.snar"
+
+
+def incremental_backup_command(path: str, backup_name: str, previous: str | None,
+                               timeout: int = BACKUP_TIMEOUT) -> str:
+    """Команда создания архива с файлом снимка. Для уровня 0 снимок создается заново, для следующих уровней
+    копируется снимок предыдущего архива, поэтому в архив попадает только изменившееся с его создания.
+    Прогресс tar печатает в stderr строками с PROGRESS_MARKER; через timeout секунд tar прерывается (код 124).
+    Печатает размер архива и длительность в мс; код 1 tar (файлы менялись во время чтения) не считается ошибкой."""
+    parent, base = os.path.dirname(path.rstrip("/")) or "/", os.path.basename(path.rstrip("/"))
+    archive = shlex.quote(f"{BACKUP_DIR}/{backup_name}")
+    snapshot = shlex.quote(snapshot_path(backup_name))
+    if previous is None:
+        prepare = f"rm -f {snapshot}"
+    else:
+        prepare = (f"test -f {shlex.quote(snapshot_path(previous))} || exit {MISSING_SNAPSHOT_STATUS}; "
+                   f"cp {shlex.quote(snapshot_path(previous))} {snapshot}")
+    return f"""
+mkdir -p {shlex.quote(BACKUP_DIR)} || exit 1
+{prepare}
+start=$(date +%s%N)
+timeout --kill-after=10 {timeout} tar --checkpoint={PROGRESS_RECORDS} \\
+    --checkpoint-action={shlex.quote(f"echo={PROGRESS_MARKER} %T")} \\
+    --listed-incremental={snapshot} -czf {archive} -C {shlex.quote(parent)} {shlex.quote(base)}
+code=$?
+if [ "$code" -gt 1 ]; then rm -f {archive} {snapshot}; exit "$code"; fi
+echo "$(stat -c %s {archive}) $(( ($(date +%s%N) - start) / 1000000 ))"
+"""
+
+
+async def run_backup_command(ssh: paramiko.SSHClient, command: str, message: LiveMessage,
+                             title: str) -> tuple[str, str, int | None]:
+    """Выполняет команду архивации потоком, не занимая поток пула на время работы tar, и показывает
+    прогресс в сообщении. Возвращает stdout, последние MAX_WARNING_LINES строк stderr и код завершения."""
+    stdout, warnings = [], deque(maxlen=MAX_WARNING_LINES)
+    async with SSHCommandStream(ssh, command) as stream:
+        async for name, line in stream:
+            if name == "stdout":
+                stdout.append(line)
+            elif PROGRESS_MARKER in line:
+                match = PROGRESS_PATTERN.search(line)
+                progress = f"обработано {match.group(1)}, {match.group(2)}" if match else line
+                message.set(f"{title}: {progress}")
+            else:
+                warnings.append(line)
+    return "\n".join(stdout), "\n".join(warnings), stream.exit_status
+
+
+async def create_incremental_backup(ssh: paramiko.SSHClient, path: str, update: Update, full: bool = False):
+    """Создает инкрементный архив директории: полный (уровень 0) раз в BACKUP_FULL_INTERVAL_DAYS дней,
+    при длине цепочки BACKUP_MAX_CHAIN или по запросу, иначе - изменения с предыдущего архива цепочки."""
+    path = path.rstrip("/") or "/"
+    command = f'test -d {shlex.quote(path)} && echo "exists"'
+    stdout, stderr, exit_status = await execute_ssh_command(ssh, command)
+    if exit_status != 0 or stdout.strip() != "exists":
+        await reply(update, f"Директория {path} не существует на сервере.")
+        return
+
+    async with _backup_locks.setdefault(path, asyncio.Lock()):
+        await _create_incremental_backup(ssh, path, update, full)
+
+
+async def _create_incremental_backup(ssh: paramiko.SSHClient, path: str, update: Update, full: bool):
+    """Выбирает уровень и родителя, создает архив и записывает его в каталог (под блокировкой директории)."""
+    catalog = get_backup_catalog()
+    latest = catalog.latest(path)
+    if latest is not None and not full and latest.level + 1 < BACKUP_MAX_CHAIN \
+            and catalog.age_days(latest.chain) < BACKUP_FULL_INTERVAL_DAYS:
+        previous, level, chain = latest, latest.level + 1, latest.chain
+    else:
+        previous, level, chain = None, 0, None
+
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    backup_name = f"{os.path.basename(path) or 'root'}_{timestamp}_L{level}.tar.gz"
+    kind = "полную копию (уровень 0)" if level == 0 else f"инкрементную копию (уровень {level})"
+    title = f"Создаю {kind} {path}"
+    message = LiveMessage(update)
+    await message.start(f"{title}...")
+    stdout, stderr, exit_status = await run_backup_command(
+        ssh, incremental_backup_command(path, backup_name, previous.name if previous else None), message, title)
+
+    if exit_status == MISSING_SNAPSHOT_STATUS:
+        message.finish(f"Снимок архива {previous.name} не найден, начинаю новую цепочку.")
+        await _create_incremental_backup(ssh, path, update, full=True)
+        return
+    if exit_status == TIMEOUT_STATUS:
+        message.finish(f"Резервная копия {path} не создана: tar не завершился за {BACKUP_TIMEOUT} сек.")
+        return
+    if exit_status != 0:
+        message.finish(f"Ошибка при создании резервной копии: {stderr}")
+        return
+
+    size, duration_ms = (int(value) for value in stdout.split()[-2:])
+    catalog.add(backup_name, path, chain or backup_name, level, previous.name if previous else None, size,
+                duration_ms)
+    warning = f"\nПредупреждение tar: {stderr.strip()}" if stderr.strip() else ""
+    message.finish(f"Резервная копия создана: {backup_name} ({size / (1024 * 1024):.1f} МБ "
+                   f"за {duration_ms / 1000:.1f} сек, цепочка {chain or backup_name}){warning}")
+
 
+async def restore_chain(ssh: paramiko.SSHClient, entry: BackupEntry, target_dir: str, update: Update):
+    """Восстанавливает состояние на момент архива entry, распаковывая по порядку архивы его цепочки.
+    С --listed-incremental=/dev/null tar удаляет файлы, которых не было на момент очередного архива."""
+    chain = get_backup_catalog().chain(entry)
+    if chain[0].level != 0:
+        await reply(update, f"Цепочка {entry.chain} неполна: в каталоге нет архива {chain[0].parent}")
+        return
+    archives = " ".join(shlex.quote(f"{BACKUP_DIR}/{backup.name}") for backup in chain)
+    command = f"for a in {archives}; do test -f \"$a\" || {{ echo \"Нет архива $a\" >&2; exit 1; }}; done"
+    stdout, stderr, exit_status = await execute_ssh_command(ssh, command)
     if exit_status != 0:
-        await update.message.reply_text(f"Ошибка при создании резервной копии: {stderr}")
+        await reply(update, f"Цепочка {entry.chain} неполна: {stderr.strip()}")
         return
 
-    await update.message.reply_text(f"Резервная копия создана: {backup_name}")
+    if not target_dir.startswith("/"):
+        await reply(update, "Пожалуйста, используйте абсолютный путь для target_dir (начинающийся с /).")
+        return
+
+    await reply(update, f"Восстанавливаю {entry.name} в {target_dir}: архивов в цепочке {len(chain)}...")
+    target = shlex.quote(target_dir)
+    command = (f"mkdir -p {target} && for a in {archives}; do "
+               f"tar --listed-incremental=/dev/null -xzf \"$a\" -C {target} || exit; done")
+    stdout, stderr, exit_status = await execute_ssh_command(ssh, command)
+
+    if exit_status != 0:
+        await reply(update, f"Ошибка при восстановлении: {stderr}")
+        return
+
+    await reply(update, f"Архив {entry.name} (уровень {entry.level}) успешно восстановлен в {target_dir}.")
 
 
 async def restore_backup(ssh: paramiko.SSHClient, backup_name: str, target_dir: str, update: Update):
-    """Восстанавливает архив из BACKUP_DIR в указанную директорию."""
+    """Восстанавливает архив из BACKUP_DIR в указанную директорию; архив из каталога
+    инкрементных копий восстанавливается вместе с предшествующими архивами цепочки."""
+    entry = get_backup_catalog().get(backup_name)
+    if entry is not None:
+        await restore_chain(ssh, entry, target_dir, update)
+        return
+
     backup_path = f"{BACKUP_DIR}/{backup_name}"
     command = f'test -f {backup_path} && echo "exists"'
-    stdout, stderr, exit_status = execute_ssh_command(ssh, command)
-    await update.message.reply_text(
-        f"Проверка архива {backup_path}: stdout={stdout.strip()}, stderr={stderr.strip()}, exit_status={exit_status}")
+    stdout, stderr, exit_status = await execute_ssh_command(ssh, command)
+    logger.debug(f"Проверка архива {backup_path}: stdout={stdout.strip()}, stderr={stderr.strip()}, "
+                 f"exit_status={exit_status}")
     if exit_status != 0 or stdout.strip() != "exists":
-        await update.message.reply_text(f"Архив {backup_name} не найден в {BACKUP_DIR}.")
+        await reply(update, f"Архив {backup_name} не найден в {BACKUP_DIR}.")
         return
 
     if not target_dir.startswith("/"):
-        await update.message.reply_text("Пожалуйста, используйте абсолютный путь для target_dir (начинающийся с /).")
+        await reply(update, "Пожалуйста, используйте абсолютный путь для target_dir (начинающийся с /).")
         return
 
     command = f'mkdir -p {target_dir}'
-    stdout, stderr, exit_status = execute_ssh_command(ssh, command)
-    await update.message.reply_text(
-        f"Создание {target_dir}: stdout={stdout.strip()}, stderr={stderr.strip()}, exit_status={exit_status}")
+    stdout, stderr, exit_status = await execute_ssh_command(ssh, command)
+    logger.debug(f"Создание {target_dir}: stdout={stdout.strip()}, stderr={stderr.strip()}, exit_status={exit_status}")
     if exit_status != 0:
-        await update.message.reply_text(f"Ошибка при создании директории {target_dir}: {stderr}")
+        await reply(update, f"Ошибка при создании директории {target_dir}: {stderr}")
         return
 
-    await update.message.reply_text(f"Восстанавливаю {backup_name} в {target_dir}...")
+    await reply(update, f"Восстанавливаю {backup_name} в {target_dir}...")
     command = f'tar -xzf {backup_path} -C {target_dir}'
-    await update.message.reply_text(f"Выполняю команду: {command}")
-    stdout, stderr, exit_status = execute_ssh_command(ssh, command)
-    await update.message.reply_text(
-        f"Результат tar: stdout={stdout.strip()}, stderr={stderr.strip()}, exit_status={exit_status}")
+    logger.debug(f"Выполняю команду: {command}")
+    stdout, stderr, exit_status = await execute_ssh_command(ssh, command)
+    logger.debug(f"Результат tar: stdout={stdout.strip()}, stderr={stderr.strip()}, exit_status={exit_status}")
 
     if exit_status != 0:
-        await update.message.reply_text(f"Ошибка при восстановлении: {stderr}")
+        await reply(update, f"Ошибка при восстановлении: {stderr}")
         return
 
-    await update.message.reply_text(f"Архив {backup_name} успешно восстановлен в {target_dir}.")
+    await reply(update, f"Архив {backup_name} успешно восстановлен в {target_dir}.")
 
 
 async def list_backups(ssh: paramiko.SSHClient, update: Update):
     """Показывает список файлов в BACKUP_DIR."""
     command = f'ls -lh {BACKUP_DIR}'
-    stdout, stderr, exit_status = execute_ssh_command(ssh, command)
+    stdout, stderr, exit_status = await execute_ssh_command(ssh, command)
 
     if exit_status != 0:
-        await update.message.reply_text(f"Ошибка при получении списка резервных копий: {stderr}")
+        await reply(update, f"Ошибка при получении списка резервных копий: {stderr}")
         return
 
     backups = stdout.strip().split("\n")
     if not backups or backups == ['']:
-        await update.message.reply_text(f"Резервные копии в {BACKUP_DIR} не найдены.")
+        await reply(update, f"Резервные копии в {BACKUP_DIR} не найдены.")
         return
 
     response = f"Резервные копии в {BACKUP_DIR}:\n" + "\n".join(backups)
-    await send_paginated_message(update, response)
+    entries = get_backup_catalog().all()
+    if entries:
+        response += "\n\nЦепочки инкрементных копий (уровень, размер, время создания):\n" + "\n".join(
+            f"{entry.path}: {'  ' * entry.level}{entry.name} L{entry.level}, "
+            f"{entry.size / (1024 * 1024):.1f} МБ, {entry.created_at}" for entry in entries)
+    await send_paginated_message(update, response, name="backups")
 
 
 async def download_backup(ssh: paramiko.SSHClient, backup_name: str, update: Update):
     """Скачивает архив через SFTP и отправляет в Telegram."""
     backup_path = f"{BACKUP_DIR}/{backup_name}"
     command = f'test -f {backup_path} && echo "exists"'
-    stdout, stderr, exit_status = execute_ssh_command(ssh, command)
+    stdout, stderr, exit_status = await execute_ssh_command(ssh, command)
     if exit_status != 0 or stdout.strip() != "exists":
-        await update.message.reply_text(f"Архив {backup_name} не найден в {BACKUP_DIR}.")
+        await reply(update, f"Архив {backup_name} не найден в {BACKUP_DIR}.")
         return
 
     command = f'stat -c %s {backup_path}'
-    stdout, stderr, exit_status = execute_ssh_command(ssh, command)
+    stdout, stderr, exit_status = await execute_ssh_command(ssh, command)
     if exit_status != 0:
-        await update.message.reply_text(f"Ошибка при проверке размера файла: {stderr}")
+        await reply(update, f"Ошибка при проверке размера файла: {stderr}")
         return
 
     file_size = int(stdout.strip()) / (1024 * 1024)  # Размер в МБ
     if file_size > 50:
-        await update.message.reply_text("Файл слишком большой (>50 МБ). Telegram ограничивает размер файлов.")
+        await reply(update, "Файл слишком большой (>50 МБ). Telegram ограничивает размер файлов.")
         return
 
     local_path = f"/tmp/{backup_name}"
     try:
-        await update.message.reply_text(f"Скачиваю {backup_name}...")
-        download_file(ssh, backup_path, local_path)
+        await reply(update, f"Скачиваю {backup_name}...")
+        await download_file(ssh, backup_path, local_path)
         with open(local_path, "rb") as f:
             await update.message.reply_document(document=f, filename=backup_name)
         os.remove(local_path)
-        await update.message.reply_text(f"Архив {backup_name} успешно отправлен.")
+        await reply(update, f"Архив {backup_name} успешно отправлен.")
     except Exception as e:
-        await update.message.reply_text(f"Ошибка при скачивании: {str(e)}")
+        await reply(update, f"Ошибка при скачивании: {str(e)}")
         if os.path.exists(local_path):
             os.remove(local_path)
 
 
 async def handle_backup(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обрабатывает команду /backup <path>."""
-    auth = Auth()
+    """Обрабатывает команду /backup <path> [--incremental|--full]."""
+    auth = get_auth()
     if not auth.is_authorized_user(update.message.from_user.id):
-        await update.message.reply_text("Вы не авторизованы. Обратитесь к администратору.")
+        await reply(update, "Вы не авторизованы. Обратитесь к администратору.")
         return
     if not auth.check_permission(update.message.from_user.id, "backups_create"):
         await send_unauthorized_message(update)
         return
 
-    if len(context.args) != 1:
-        await update.message.reply_text("Использование: /backup <path>")
+    if len(context.args) not in (1, 2) or context.args[1:] not in ([], ["--incremental"], ["--full"]):
+        await reply(update, "Использование: /backup <path> [--incremental|--full]\n"
+                            "--incremental - изменения с прошлого архива, --full - новая цепочка инкрементных копий")
         return
 
     path = context.args[0]
-    await update.message.reply_text(f"{path}")
-    ssh = None
+    mode = context.args[1] if len(context.args) > 1 else None
     try:
-        ssh = connect_ssh(VPS_HOST, VPS_USERNAME, VPS_PASSWORD, VPS_KEY_PATH)
-        await create_backup(ssh, path, update)
+        async with ssh_pool.connection() as ssh:
+            if mode is None:
+                await create_backup(ssh, path, update)
+            else:
+                await create_incremental_backup(ssh, path, update, full=mode == "--full")
     except Exception as e:
-        await update.message.reply_text(f"Произошла ошибка: {str(e)}")
-    finally:
-        if ssh:
-            ssh.close()
+        await reply(update, f"Произошла ошибка: {str(e)}")
 
 
 async def handle_restore(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обрабатывает команду /restore <backup_name> [<target_dir>]."""
-    auth = Auth()
+    auth = get_auth()
     if not auth.is_authorized_user(update.message.from_user.id):
-        await update.message.reply_text("Вы не авторизованы. Обратитесь к администратору.")
+        await reply(update, "Вы не авторизованы. Обратитесь к администратору.")
         return
     if not auth.check_permission(update.message.from_user.id, "backups_restore"):
         await send_unauthorized_message(update)
         return
 
     if len(context.args) != 2:
-        await update.message.reply_text("Использование: /restore <backup_name> [<target_dir>]")
+        await reply(update, "Использование: /restore <backup_name> [<target_dir>]")
         return
 
     backup_name = context.args[0]
     target_dir = context.args[1]
 
-    ssh = None
     try:
-        ssh = connect_ssh(VPS_HOST, VPS_USERNAME, VPS_PASSWORD, VPS_KEY_PATH)
-        await restore_backup(ssh, backup_name, target_dir, update)
+        async with ssh_pool.connection() as ssh:
+            await restore_backup(ssh, backup_name, target_dir, update)
     except Exception as e:
-        await update.message.reply_text(f"Произошла ошибка: {str(e)}")
-    finally:
-        if ssh:
-            ssh.close()
+        await reply(update, f"Произошла ошибка: {str(e)}")
 
 
 async def handle_list_backups(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обрабатывает команду /list_backups."""
-    auth = Auth()
+    auth = get_auth()
     if not auth.is_authorized_user(update.message.from_user.id):
-        await update.message.reply_text("Вы не авторизованы. Обратитесь к администратору.")
+        await reply(update, "Вы не авторизованы. Обратитесь к администратору.")
         return
     if not auth.check_permission(update.message.from_user.id, "backups_download"):
         await send_unauthorized_message(update)
         return
 
-    ssh = None
     try:
-        ssh = connect_ssh(VPS_HOST, VPS_USERNAME, VPS_PASSWORD, VPS_KEY_PATH)
-        await list_backups(ssh, update)
+        async with ssh_pool.connection() as ssh:
+            await list_backups(ssh, update)
     except Exception as e:
-        await update.message.reply_text(f"Произошла ошибка: {str(e)}")
-    finally:
-        if ssh:
-            ssh.close()
+        await reply(update, f"Произошла ошибка: {str(e)}")
 
 
 async def handle_download(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обрабатывает команду /download <backup_name>."""
-    auth = Auth()
+    auth = get_auth()
     if not auth.is_authorized_user(update.message.from_user.id):
-        await update.message.reply_text("Вы не авторизованы. Обратитесь к администратору.")
+        await reply(update, "Вы не авторизованы. Обратитесь к администратору.")
         return
     if not auth.check_permission(update.message.from_user.id, "backups_download"):
         await send_unauthorized_message(update)
         return
 
     if len(context.args) != 1:
-        await update.message.reply_text("Использование: /download <backup_name>")
+        await reply(update, "Использование: /download <backup_name>")
         return
 
     backup_name = context.args[0]
-    ssh = None
     try:
-        ssh = connect_ssh(VPS_HOST, VPS_USERNAME, VPS_PASSWORD, VPS_KEY_PATH)
-        await download_backup(ssh, backup_name, update)
+        async with ssh_pool.connection() as ssh:
+            await download_backup(ssh, backup_name, update)
     except Exception as e:
-        await update.message.reply_text(f"Произошла ошибка: {str(e)}")
-    finally:
-        if ssh:
-            ssh.close()
+        await reply(update, f"Произошла ошибка: {str(e)}")
@@ -0,0 +1,107 @@
+from auth.db import Database, get_database
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS backups (
+    name TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    chain TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    parent TEXT,
+    size INTEGER NOT NULL,
+    duration_ms INTEGER NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_backups_chain ON backups (chain, level);
+CREATE INDEX IF NOT EXISTS idx_backups_path ON backups (path, created_at);
+"""
+
+
+class BackupEntry:
+    """Архив в цепочке инкрементных копий: chain - имя полной копии (уровень 0), с которой начинается
+    цепочка, level - номер архива в ней, parent - имя архива, от снимка которого он сделан (None у полной)."""
+
+    def __init__(self, name: str, path: str, chain: str, level: int, parent: str | None, size: int,
+                 duration_ms: int, created_at: str):
+        self.name = name
+        self.path = path
+        self.chain = chain
+        self.level = level
+        self.parent = parent
+        self.size = size
+        self.duration_ms = duration_ms
+        self.created_at = created_at
+
+
+class BackupCatalog:
+    """Каталог инкрементных резервных копий в базе бота."""
+
+    def __init__(self, db: Database | None = None):
+        self.db = db or get_database()
+        with self.db.lock, self.db.conn:
+            self._migrate_parent_column()
+        self.db.executescript(SCHEMA)
+
+    def _migrate_parent_column(self):
+        """Добавляет столбец parent в каталог, созданный до его появления; родителем старых архивов
+        считается архив предыдущего уровня той же цепочки."""
+        columns = [row[1] for row in self.db.conn.execute("PRAGMA table_info(backups)")]
+        if not columns or "parent" in columns:
+            return
+        self.db.conn.execute("ALTER TABLE backups ADD COLUMN parent TEXT")
+        self.db.conn.execute("""
+            UPDATE backups SET parent = (
+                SELECT p.name FROM backups p WHERE p.chain = backups.chain AND p.level = backups.level - 1
+                ORDER BY p.created_at DESC, p.rowid DESC LIMIT 1
+            ) WHERE level > 0
+        """)
+
+    def _entries(self, where: str, params: tuple) -> list[BackupEntry]:
+        rows = self.db.query(f"""
+            SELECT name, path, chain, level, parent, size, duration_ms, created_at FROM backups WHERE {where}
+        """, params)
+        return [BackupEntry(*row) for row in rows]
+
+    def get(self, name: str) -> BackupEntry | None:
+        entries = self._entries("name = ?", (name,))
+        return entries[0] if entries else None
+
+    def latest(self, path: str) -> BackupEntry | None:
+        """Последний архив директории."""
+        entries = self._entries("path = ? ORDER BY created_at DESC, rowid DESC LIMIT 1", (path,))
+        return entries[0] if entries else None
+
+    def age_days(self, name: str) -> float:
+        """Сколько дней назад создан архив."""
+        rows = self.db.query("SELECT julianday('now') - julianday(created_at) FROM backups WHERE name = ?", (name,))
+        return rows[0][0] if rows else float("inf")
+
+    def chain(self, entry: BackupEntry) -> list[BackupEntry]:
+        """Архивы, которые нужно распаковать по порядку, чтобы получить состояние на момент entry:
+        entry и его предки по ссылкам parent. Если предка нет в каталоге, первым будет архив уровня выше 0."""
+        chain = [entry]
+        while chain[-1].parent is not None and len(chain) <= entry.level:
+            parent = self.get(chain[-1].parent)
+            if parent is None:
+                break
+            chain.append(parent)
+        return chain[::-1]
+
+    def add(self, name: str, path: str, chain: str, level: int, parent: str | None, size: int, duration_ms: int):
+        self.db.execute("""
+            INSERT OR REPLACE INTO backups (name, path, chain, level, parent, size, duration_ms, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
+        """, (name, path, chain, level, parent, size, duration_ms))
+
+    def all(self) -> list[BackupEntry]:
+        return self._entries("1 ORDER BY path, chain, level", ())
+
+
+_backup_catalog: BackupCatalog | None = None
+
+
+def get_backup_catalog() -> BackupCatalog:
+    """Возвращает общий каталог резервных копий."""
+    global _backup_catalog
+    if _backup_catalog is None:
+        _backup_catalog = BackupCatalog()
+    return _backup_catalog
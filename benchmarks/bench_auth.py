@@ -0,0 +1,45 @@
+"""Микро-бенчмарк проверки прав: кэш Auth против прямых запросов к SQLite.
+
+Запуск из корня репозитория: python -m benchmarks.bench_auth [число пользователей] [число проверок]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from auth.auth import Auth
+
+
+def measure(check, chat_ids: list[int], checks: int) -> float:
+    """Возвращает число проверок в секунду."""
+    started = time.perf_counter()
+    for i in range(checks):
+        check(chat_ids[i % len(chat_ids)], "deploy")
+    return checks / (time.perf_counter() - started)
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    checks = int(sys.argv[2]) if len(sys.argv) > 2 else 200_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        auth = Auth(os.path.join(tmp, "bench.db"))
+        for chat_id in range(users):
+            auth.db.add_user(chat_id, ["logs_view", "deploy"] if chat_id % 2 else ["containers_list"])
+        auth.reload_permissions()
+        chat_ids = list(range(users + users // 10))
+
+        def uncached_check(chat_id: int, permission: str) -> bool:
+            permissions = auth.db.get_user_permissions(chat_id)
+            return permission in permissions or "admin" in permissions
+
+        cached = measure(auth.check_permission, chat_ids, checks)
+        uncached = measure(uncached_check, chat_ids, max(checks // 100, 1))
+
+    print(f"Пользователей: {users}")
+    print(f"Кэш Auth:      {cached:,.0f} проверок/сек")
+    print(f"Запрос к базе: {uncached:,.0f} проверок/сек")
+
+
+if __name__ == "__main__":
+    main()
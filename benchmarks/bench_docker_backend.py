@@ -0,0 +1,263 @@
+"""Бенчмарк бэкендов операций с контейнерами: Docker Engine API с keep-alive против процесса на каждую команду.
+
+Оба бэкенда (EngineBackend и CLIBackend) работают через одно и то же SSH-соединение с локальным поддельным
+sshd на paramiko. Команды выполняются на нем через bash, а вместо docker в PATH лежит поддельный CLI,
+который обращается к поддельному демону на unix-сокете, отвечающему как Engine API: команды CLI выполняет
+сам, а docker system dial-stdio проксирует на сокет. Так CLI платит за канал SSH и процесс на каждую
+операцию, а API - только за запрос в уже открытом канале. Сетевая задержка до хоста не учитывается,
+поэтому на реальном хосте разница будет больше.
+
+Запуск из корня репозитория: python -m benchmarks.bench_docker_backend [число контейнеров] [повторов]
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import socketserver
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+import paramiko
+
+from containers.backend import CLIBackend, EngineBackend
+
+FAKE_DOCKER = r'''
+import http.client, json, os, socket, sys, threading
+args = sys.argv[1:]
+sock = socket.socket(socket.AF_UNIX)
+sock.connect(os.environ["FAKE_DOCKER_SOCK"])
+if args[:2] == ["system", "dial-stdio"]:
+    def pump():
+        for chunk in iter(lambda: os.read(0, 65536), b""):
+            sock.sendall(chunk)
+        sock.shutdown(socket.SHUT_WR)
+    threading.Thread(target=pump, daemon=True).start()
+    for chunk in iter(lambda: sock.recv(65536), b""):
+        os.write(1, chunk)
+    sys.exit(0)
+conn = http.client.HTTPConnection("docker")
+conn.sock = sock
+op, arg = args[0], args[-1]
+method, url = {"ps": ("GET", "/containers/json?all=1"), "inspect": ("GET", f"/containers/{arg}/json"),
+               "start": ("POST", f"/containers/{arg}/start"), "stop": ("POST", f"/containers/{arg}/stop"),
+               "rm": ("DELETE", f"/containers/{arg}")}[op]
+conn.request(method, url)
+data = conn.getresponse().read()
+if op == "ps":
+    for row in json.loads(data):
+        print(json.dumps({"ID": row["Id"], "Names": row["Names"][0][1:], "Image": row["Image"],
+                          "Ports": "", "Status": row["Status"], "State": row["State"]}))
+elif op == "inspect":
+    print(str(json.loads(data)["State"]["Running"]).lower())
+else:
+    print(arg)
+'''
+
+
+def make_containers(count: int) -> list[dict]:
+    return [{"Id": f"{i:064x}", "Names": [f"/app-{i}"], "Image": f"app-{i}:latest", "State": "running",
+             "Status": "Up 3 hours", "Ports": [{"IP": "0.0.0.0", "PrivatePort": 8000 + i, "PublicPort": 8000 + i,
+                                               "Type": "tcp"}]}
+            for i in range(count)]
+
+
+class FakeDockerHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    containers: list[dict] = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def address_string(self):
+        return "unix"
+
+    def _send(self, status: int, body: object | None = None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        if data:
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if data:
+            self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.endswith("/_ping"):
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"OK")
+        elif self.path.startswith("/containers/json"):
+            self._send(200, self.containers)
+        elif self.path.endswith("/json"):
+            container_id = self.path.split("/")[-2]
+            self._send(200, {"Id": container_id, "State": {"Running": True, "Status": "running"}})
+        else:
+            self._send(404, {"message": "page not found"})
+
+    def do_POST(self):
+        self._send(204)
+
+    def do_DELETE(self):
+        self._send(204)
+
+
+class FakeDockerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class FakeSSHServer(paramiko.ServerInterface):
+    """sshd, выполняющий команды каналов через локальный bash с поддельным docker в PATH."""
+
+    def __init__(self, env: dict):
+        self.env = env
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self._run, args=(channel, command.decode()), daemon=True).start()
+        return True
+
+    def _run(self, channel: paramiko.Channel, command: str):
+        process = subprocess.Popen(["bash", "-c", command], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, env=self.env)
+
+        def pump_stdin():
+            try:
+                for chunk in iter(lambda: channel.recv(65536), b""):
+                    process.stdin.write(chunk)
+                    process.stdin.flush()
+            except (OSError, EOFError):
+                pass
+            finally:
+                try:
+                    process.stdin.close()
+                except OSError:
+                    pass
+
+        def pump_output(source, send):
+            for chunk in iter(lambda: source.read1(65536), b""):
+                try:
+                    send(chunk)
+                except (OSError, EOFError):
+                    pass
+
+        threading.Thread(target=pump_stdin, daemon=True).start()
+        stderr = threading.Thread(target=pump_output, args=(process.stderr, channel.sendall_stderr))
+        stderr.start()
+        pump_output(process.stdout, channel.sendall)
+        stderr.join()
+        try:
+            channel.send_exit_status(process.wait())
+            channel.close()
+        except (OSError, EOFError):
+            pass
+
+
+def serve_ssh(env: dict) -> tuple[socket.socket, int]:
+    """Запускает поддельный sshd на случайном локальном порту."""
+    key = paramiko.RSAKey.generate(2048)
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(8)
+
+    def accept():
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(conn)
+            transport.add_server_key(key)
+            transport.start_server(server=FakeSSHServer(env))
+    threading.Thread(target=accept, daemon=True).start()
+    return listener, listener.getsockname()[1]
+
+
+async def measure(operation, repeats: int) -> tuple[float, float]:
+    """Возвращает медиану и 95-й перцентиль задержки операции в миллисекундах."""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        await operation()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[max(int(len(timings) * 0.95) - 1, 0)]
+
+
+async def run(ssh: paramiko.SSHClient, container_id: str, repeats: int):
+    keepalive = EngineBackend()
+    reconnect = EngineBackend(max_idle=0)
+    backends = {
+        "API, keep-alive": keepalive,
+        "API, новый канал": reconnect,
+        "CLI": CLIBackend(),
+    }
+    print(f"{'Бэкенд':<20}{'операция':<10}{'медиана, мс':>14}{'p95, мс':>10}")
+    for name, backend in backends.items():
+        operations = {
+            "list": lambda: backend.list(ssh),
+            "inspect": lambda: backend.is_running(ssh, container_id),
+            "stop": lambda: backend.stop(ssh, container_id),
+        }
+        for operation, call in operations.items():
+            await call()
+            median, p95 = await measure(call, repeats)
+            print(f"{name:<20}{operation:<10}{median:>14.3f}{p95:>10.3f}")
+    for backend in (keepalive, reconnect):
+        engine = backend.engine(ssh)
+        if engine is None or not engine.verified:
+            raise RuntimeError("EngineBackend перешел на CLI: поддельный dial-stdio не работает")
+        engine.close()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    # Разрыв соединения при завершении поддельный sshd иначе печатает как ошибку сокета
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "docker.sock")
+        bin_dir = os.path.join(tmp, "bin")
+        os.mkdir(bin_dir)
+        docker = os.path.join(bin_dir, "docker")
+        with open(docker, "w") as f:
+            f.write(f"#!{sys.executable}\n{FAKE_DOCKER}")
+        os.chmod(docker, 0o755)
+
+        FakeDockerHandler.containers = make_containers(count)
+        server = FakeDockerServer(path, FakeDockerHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        env = dict(os.environ, PATH=f"{bin_dir}:{os.environ.get('PATH', '')}", FAKE_DOCKER_SOCK=path)
+        listener, port = serve_ssh(env)
+
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh.connect("127.0.0.1", port, username="bench", password="bench", look_for_keys=False,
+                    allow_agent=False)
+        print(f"Контейнеров: {count}, повторов: {repeats}, одно SSH-соединение на 127.0.0.1:{port}")
+        try:
+            asyncio.run(run(ssh, FakeDockerHandler.containers[0]["Id"], repeats))
+        finally:
+            ssh.close()
+            listener.close()
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main()
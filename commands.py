@@ -1,27 +1,27 @@
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from auth.auth import Auth
+from auth.auth import get_auth
 from backups.backups import handle_backup, handle_restore, handle_list_backups, handle_download
 from containers.containers import handle_containers, handle_start, handle_stop, handle_remove, handle_container_logs, \
-    handle_stats
-from deploy.deploy import handle_deploy
+    handle_stats, handle_alert_add, handle_alert_list, handle_alert_rm, handle_logs_stop
+from deploy.deploy import handle_deploy, handle_deploy_status, handle_deploy_cancel, handle_rollback
 from files.files import handle_upload, handle_download_file
-from logs.logs import handle_logs, handle_tail, handle_monitor_logs, handle_stop_monitoring
-from utils.telegram import send_unauthorized_message
+from logs.logs import handle_logs, handle_tail, handle_logs_between, handle_monitor_logs, handle_stop_monitoring
+from utils.telegram import reply, send_unauthorized_message
 
 
 def register_commands(application: Application):
     """Регистрирует все команды бота."""
-    auth = Auth()
+    auth = get_auth()
 
     async def check_auth(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not auth.is_authorized_user(update.message.from_user.id):
-            await update.message.reply_text("Вы не авторизованы. Обратитесь к администратору.")
+            await reply(update, "Вы не авторизованы. Обратитесь к администратору.")
             return False
         return True
 
     async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        await update.message.reply_text(
+        await reply(update,
             'Отправьте SSH ссылку на GitHub репозиторий или используйте команды: /containers, /backup, /logs')
 
     async def whoami(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -66,18 +66,26 @@ def register_commands(application: Application):
     application.add_handler(CommandHandler('update_permissions', update_permissions))
     application.add_handler(CommandHandler('list_users', list_users))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, deploy))
+    application.add_handler(CommandHandler('deploy_status', handle_deploy_status))
+    application.add_handler(CommandHandler('deploy_cancel', handle_deploy_cancel))
+    application.add_handler(CommandHandler('rollback', handle_rollback))
     application.add_handler(CommandHandler('containers', handle_containers))
     application.add_handler(CommandHandler('start_container', handle_start))
     application.add_handler(CommandHandler('stop', handle_stop))
     application.add_handler(CommandHandler('remove', handle_remove))
     application.add_handler(CommandHandler('logs', handle_container_logs))
+    application.add_handler(CommandHandler('logs_stop', handle_logs_stop))
     application.add_handler(CommandHandler('stats', handle_stats))
+    application.add_handler(CommandHandler('alert_add', handle_alert_add))
+    application.add_handler(CommandHandler('alert_list', handle_alert_list))
+    application.add_handler(CommandHandler('alert_rm', handle_alert_rm))
     application.add_handler(CommandHandler('backup', handle_backup))
     application.add_handler(CommandHandler('restore', handle_restore))
     application.add_handler(CommandHandler('list_backups', handle_list_backups))
     application.add_handler(CommandHandler('download', handle_download))
     application.add_handler(CommandHandler("log_logs", handle_logs))
     application.add_handler(CommandHandler("tail", handle_tail))
+    application.add_handler(CommandHandler("logs_between", handle_logs_between))
     application.add_handler(CommandHandler("monitor_logs", handle_monitor_logs))
     application.add_handler(CommandHandler("stop_monitoring", handle_stop_monitoring))
     application.add_handler(MessageHandler(filters.Document.ALL & filters.CaptionRegex(r'^/upload\s+\S+$'), handle_upload))
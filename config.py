@@ -11,4 +11,59 @@ VPS_KEY_PATH = os.getenv('VPS_KEY_PATH')
 TARGET_DIR = os.getenv('TARGET_DIR', '/home/users/repos')
 BACKUP_DIR = os.getenv('BACKUP_DIR', '/backups')
 ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'default_password')
-DEFAULT_PORT = 1234
\ No newline at end of file
+DEFAULT_PORT = 1234
+SSH_KEEPALIVE_INTERVAL = int(os.getenv('SSH_KEEPALIVE_INTERVAL', '30'))
+SSH_MAX_SESSIONS = int(os.getenv('SSH_MAX_SESSIONS', '8'))
+SSH_WORKERS = int(os.getenv('SSH_WORKERS', '16'))
+SSH_MAX_STREAMS = int(os.getenv('SSH_MAX_STREAMS', '8'))
+SSHD_MAX_SESSIONS = int(os.getenv('SSHD_MAX_SESSIONS', '10'))
+DEPLOY_TIMEOUT = int(os.getenv('DEPLOY_TIMEOUT', '300'))
+LOG_MAX_LINES = int(os.getenv('LOG_MAX_LINES', '500'))
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(512 * 1024)))
+LOG_MONITOR_MAX_BYTES = int(os.getenv('LOG_MONITOR_MAX_BYTES', str(256 * 1024)))
+LOG_MONITOR_MAX_MISSES = int(os.getenv('LOG_MONITOR_MAX_MISSES', '3'))
+LOG_STREAM_FLUSH_INTERVAL = float(os.getenv('LOG_STREAM_FLUSH_INTERVAL', '2'))
+LOG_STREAM_RETRY_DELAY = float(os.getenv('LOG_STREAM_RETRY_DELAY', '5'))
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '25'))
+TELEGRAM_CHAT_INTERVAL = float(os.getenv('TELEGRAM_CHAT_INTERVAL', '1'))
+TELEGRAM_SEND_ATTEMPTS = int(os.getenv('TELEGRAM_SEND_ATTEMPTS', '3'))
+OUTPUT_ATTACHMENT_THRESHOLD = int(os.getenv('OUTPUT_ATTACHMENT_THRESHOLD', '16000'))
+OUTPUT_COMPRESSION = os.getenv('OUTPUT_COMPRESSION', 'gzip')
+LOG_SEARCH_MAX_MATCHES = int(os.getenv('LOG_SEARCH_MAX_MATCHES', '200'))
+LOG_SEARCH_PARALLEL = int(os.getenv('LOG_SEARCH_PARALLEL', '4'))
+LOG_INDEX_STEP = int(os.getenv('LOG_INDEX_STEP', str(1024 * 1024)))
+GIT_CACHE_DIR = os.getenv('GIT_CACHE_DIR', '/home/users/git-cache')
+GIT_SSH_KEY = os.getenv('GIT_SSH_KEY', '~/.ssh/id_rsa')
+GIT_SHALLOW_CLONE = os.getenv('GIT_SHALLOW_CLONE', '0') == '1'
+DEPLOY_KEEP_RELEASES = int(os.getenv('DEPLOY_KEEP_RELEASES', '5'))
+LIVE_MESSAGE_INTERVAL = float(os.getenv('LIVE_MESSAGE_INTERVAL', '3'))
+DEPLOY_MAX_CONCURRENT = int(os.getenv('DEPLOY_MAX_CONCURRENT', '2'))
+DEPLOY_OUTPUT_LINES = int(os.getenv('DEPLOY_OUTPUT_LINES', '15'))
+DEPLOY_JOB_HISTORY = int(os.getenv('DEPLOY_JOB_HISTORY', '20'))
+INVENTORY_PATH = os.getenv('INVENTORY_PATH', 'data/inventory.json')
+DEPLOY_HOST_PARALLEL = int(os.getenv('DEPLOY_HOST_PARALLEL', '4'))
+DEPLOY_BLUEGREEN = os.getenv('DEPLOY_BLUEGREEN', '0') == '1'
+DEPLOY_HEALTH_CHECK = os.getenv('DEPLOY_HEALTH_CHECK', 'tcp')
+DEPLOY_HEALTH_TIMEOUT = float(os.getenv('DEPLOY_HEALTH_TIMEOUT', '60'))
+DEPLOY_HEALTH_INTERVAL = float(os.getenv('DEPLOY_HEALTH_INTERVAL', '0.5'))
+BLUEGREEN_PORT_OFFSET = int(os.getenv('BLUEGREEN_PORT_OFFSET', '10000'))
+PROXY_CONF_DIR = os.getenv('PROXY_CONF_DIR', '/etc/nginx/conf.d')
+PROXY_RELOAD_COMMAND = os.getenv('PROXY_RELOAD_COMMAND', 'nginx -t && nginx -s reload')
+CONTAINER_RESYNC_INTERVAL = float(os.getenv('CONTAINER_RESYNC_INTERVAL', '300'))
+CONTAINER_WATCH_RETRY_DELAY = float(os.getenv('CONTAINER_WATCH_RETRY_DELAY', '5'))
+DOCKER_BACKEND = os.getenv('DOCKER_BACKEND', 'api')
+DOCKER_API_VERSION = os.getenv('DOCKER_API_VERSION', '')
+DOCKER_API_TIMEOUT = float(os.getenv('DOCKER_API_TIMEOUT', '30'))
+DOCKER_API_RETRY_INTERVAL = float(os.getenv('DOCKER_API_RETRY_INTERVAL', '300'))
+DOCKER_API_MAX_IDLE = min(int(os.getenv('DOCKER_API_MAX_IDLE', '4')), max(SSHD_MAX_SESSIONS - SSH_MAX_SESSIONS, 0))
+CONTAINER_BULK_PARALLEL = int(os.getenv('CONTAINER_BULK_PARALLEL', '8'))
+METRICS_TIERS = [(float(resolution), int(size)) for resolution, size in
+                 (tier.split(':') for tier in os.getenv('METRICS_TIERS', '1:900,60:1440,3600:168').split(','))]
+METRICS_MAX_CONTAINERS = int(os.getenv('METRICS_MAX_CONTAINERS', '100'))
+METRICS_RETENTION = float(os.getenv('METRICS_RETENTION', '3600'))
+ALERT_INTERVAL = float(os.getenv('ALERT_INTERVAL', '5'))
+ALERT_DEFAULT_COOLDOWN = float(os.getenv('ALERT_DEFAULT_COOLDOWN', '1800'))
+CONTAINER_LOG_BATCH_LINES = int(os.getenv('CONTAINER_LOG_BATCH_LINES', '100'))
+BACKUP_FULL_INTERVAL_DAYS = float(os.getenv('BACKUP_FULL_INTERVAL_DAYS', '7'))
+BACKUP_MAX_CHAIN = int(os.getenv('BACKUP_MAX_CHAIN', '14'))
+BACKUP_TIMEOUT = int(os.getenv('BACKUP_TIMEOUT', '3600'))
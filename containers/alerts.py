@@ -0,0 +1,230 @@
+import asyncio
+import fnmatch
+import logging
+import re
+import time
+
+from telegram import Bot
+
+from auth.db import Database, get_database
+from utils.telegram import outbound_queue
+from config import ALERT_INTERVAL, ALERT_DEFAULT_COOLDOWN
+from .metrics import metrics_sampler, parse_duration, parse_size, format_size, ContainerSeries
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alert_rules (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    metric TEXT NOT NULL,
+    selector TEXT NOT NULL,
+    op TEXT NOT NULL,
+    threshold REAL NOT NULL,
+    duration REAL NOT NULL,
+    cooldown REAL NOT NULL,
+    created_at TEXT NOT NULL
+);
+"""
+METRIC_NAMES = {
+    "cpu": "CPU",
+    "mem": "память",
+    "mem_pct": "память от лимита",
+    "net_rx": "входящий трафик",
+    "net_tx": "исходящий трафик",
+}
+CONDITION_PATTERN = re.compile(r"^([<>])(.+)$")
+
+
+class AlertRule:
+    """Правило: метрика контейнеров, имена которых подходят под selector (glob), больше или меньше
+    threshold дольше duration секунд. Повторное уведомление - не раньше чем через cooldown секунд."""
+
+    def __init__(self, rule_id: int, chat_id: int, metric: str, selector: str, op: str, threshold: float,
+                 duration: float, cooldown: float):
+        self.id = rule_id
+        self.chat_id = chat_id
+        self.metric = metric
+        self.selector = selector
+        self.op = op
+        self.threshold = threshold
+        self.duration = duration
+        self.cooldown = cooldown
+        self._pattern = re.compile(fnmatch.translate(selector))
+        self._matches: dict[str, bool] = {}
+
+    def matches(self, name: str) -> bool:
+        matched = self._matches.get(name)
+        if matched is None:
+            matched = self._matches[name] = self._pattern.match(name) is not None
+        return matched
+
+    def breached(self, value: float) -> bool:
+        return value > self.threshold if self.op == ">" else value < self.threshold
+
+    def format_value(self, value: float) -> str:
+        if self.metric == "mem":
+            return format_size(value)
+        if self.metric in ("net_rx", "net_tx"):
+            return f"{format_size(value)}/с"
+        return f"{value:.1f}%"
+
+    def describe(self) -> str:
+        return (f"#{self.id}: {self.metric} {self.selector} {self.op}{self.format_value(self.threshold)} "
+                f"дольше {self.duration:.0f} сек, не чаще раза в {self.cooldown:.0f} сек")
+
+
+def parse_rule(args: list[str]) -> tuple[str, str, str, float, float, float]:
+    """Разбирает аргументы /alert_add: <метрика> <селектор> <условие> [длительность] [пауза].
+    Возвращает метрику, селектор, оператор, порог, длительность и паузу между уведомлениями в секундах."""
+    if not 3 <= len(args) <= 5:
+        raise ValueError("Нужно от 3 до 5 аргументов")
+    metric, selector, condition = args[:3]
+    if metric not in METRIC_NAMES:
+        raise ValueError(f"Неизвестная метрика: {metric}. Доступные: {', '.join(METRIC_NAMES)}")
+    match = CONDITION_PATTERN.match(condition)
+    if not match:
+        raise ValueError(f"Неверное условие: {condition}. Пример: >90 или <1MiB")
+    op, value = match.groups()
+    if metric in ("mem", "net_rx", "net_tx"):
+        threshold = parse_size(value.removesuffix("/s"))
+    else:
+        threshold = float(value.rstrip("%"))
+    duration = parse_duration(args[3]) if len(args) > 3 else 0.0
+    cooldown = parse_duration(args[4]) if len(args) > 4 else ALERT_DEFAULT_COOLDOWN
+    return metric, selector, op, threshold, duration, cooldown
+
+
+class AlertState:
+    """Состояние правила для одного контейнера: с какого момента условие выполняется (или перестало
+    выполняться, пока тревога активна), активна ли тревога и когда было последнее уведомление."""
+
+    __slots__ = ("since", "firing", "notified", "last_notified")
+
+    def __init__(self):
+        self.since: float | None = None
+        self.firing = False
+        self.notified = False
+        self.last_notified = float("-inf")
+
+
+class AlertEngine:
+    """Проверяет правила по последним значениям сборщика метрик каждые interval секунд и отправляет
+    уведомления в чаты, создавшие правила. Тревога срабатывает, когда условие держится duration секунд,
+    и снимается, когда условие не выполняется столько же. Уведомления о срабатывании одного правила для
+    одного контейнера приходят не чаще cooldown; если срабатывание было подавлено, о снятии тоже не пишем."""
+
+    def __init__(self, db: Database | None = None, interval: float = ALERT_INTERVAL):
+        self.db = db or get_database()
+        self.db.executescript(SCHEMA)
+        self.interval = interval
+        self.rules: list[AlertRule] = []
+        self._states: dict[tuple[int, str], AlertState] = {}
+        self._bot: Bot | None = None
+        self._task: asyncio.Task | None = None
+        self.reload()
+
+    def reload(self):
+        rows = self.db.query("""
+            SELECT id, chat_id, metric, selector, op, threshold, duration, cooldown FROM alert_rules ORDER BY id
+        """)
+        self.rules = [AlertRule(*row) for row in rows]
+        ids = {rule.id for rule in self.rules}
+        self._states = {key: state for key, state in self._states.items() if key[0] in ids}
+
+    def add(self, chat_id: int, metric: str, selector: str, op: str, threshold: float, duration: float,
+            cooldown: float) -> AlertRule:
+        cursor = self.db.execute("""
+            INSERT INTO alert_rules (chat_id, metric, selector, op, threshold, duration, cooldown, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
+        """, (chat_id, metric, selector, op, threshold, duration, cooldown))
+        self.reload()
+        return next(rule for rule in self.rules if rule.id == cursor.lastrowid)
+
+    def remove(self, chat_id: int, rule_id: int) -> bool:
+        """Удаляет правило чата."""
+        cursor = self.db.execute("DELETE FROM alert_rules WHERE id = ? AND chat_id = ?", (rule_id, chat_id))
+        self.reload()
+        return cursor.rowcount > 0
+
+    def chat_rules(self, chat_id: int) -> list[AlertRule]:
+        return [rule for rule in self.rules if rule.chat_id == chat_id]
+
+    def evaluate(self, containers: list[ContainerSeries], now: float) -> list[tuple[AlertRule, str]]:
+        """Один проход по правилам и контейнерам; возвращает пары (правило, текст уведомления)."""
+        notifications = []
+        seen = set()
+        for rule in self.rules:
+            for series in containers:
+                value = series.latest.get(rule.metric)
+                if value is None or not rule.matches(series.name):
+                    continue
+                key = (rule.id, series.name)
+                state = self._states.get(key)
+                breached = rule.breached(value)
+                if state is None:
+                    if not breached:
+                        continue
+                    state = self._states[key] = AlertState()
+                seen.add(key)
+                if breached != state.firing:
+                    if state.since is None:
+                        state.since = now
+                    if now - state.since >= rule.duration:
+                        state.firing, state.since = breached, None
+                        if not breached and state.notified:
+                            state.notified = False
+                            notifications.append((rule, f"Тревога #{rule.id} снята: {series.name} - "
+                                                        f"{METRIC_NAMES[rule.metric]} {rule.format_value(value)}"))
+                else:
+                    state.since = None
+                if state.firing and not state.notified and now - state.last_notified >= rule.cooldown:
+                    # Срабатывание, подавленное паузой, сообщается, если тревога держится и после паузы
+                    state.notified, state.last_notified = True, now
+                    notifications.append((rule, f"Тревога #{rule.id}: {series.name} - {METRIC_NAMES[rule.metric]} "
+                                                f"{rule.format_value(value)}, порог {rule.op}"
+                                                f"{rule.format_value(rule.threshold)}"))
+                if not state.firing and state.since is None and not state.notified \
+                        and now - state.last_notified >= rule.cooldown:
+                    del self._states[key]
+        # Контейнер пропал (остановлен или удален) - тревога по нему больше не актуальна, но время последнего
+        # уведомления хранится до конца паузы: иначе контейнер в цикле перезапусков уведомлял бы на каждом круге
+        rules = {rule.id: rule for rule in self.rules}
+        for key in [key for key in self._states if key not in seen]:
+            state, rule = self._states[key], rules.get(key[0])
+            if rule is None or now - state.last_notified >= rule.cooldown:
+                del self._states[key]
+            else:
+                state.since, state.firing, state.notified = None, False, False
+        return notifications
+
+    def start(self, bot: Bot):
+        self._bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                for rule, text in self.evaluate(metrics_sampler.running(), time.time()):
+                    outbound_queue.put(self._bot, rule.chat_id, text)
+            except Exception as e:
+                logger.warning(f"Ошибка при проверке правил тревог: {e}")
+
+
+_alert_engine: AlertEngine | None = None
+
+
+def get_alert_engine() -> AlertEngine:
+    """Возвращает общий движок правил тревог."""
+    global _alert_engine
+    if _alert_engine is None:
+        _alert_engine = AlertEngine()
+    return _alert_engine
@@ -0,0 +1,126 @@
+import json
+import logging
+import shlex
+import time
+import weakref
+
+import paramiko
+
+from utils.ssh import execute_ssh_command, run_blocking
+from config import DOCKER_BACKEND, DOCKER_API_RETRY_INTERVAL, DOCKER_API_MAX_IDLE
+from .engine import DockerEngine, EngineUnavailable, dial_stdio
+from .watcher import ContainerInfo, PS_FORMAT
+
+logger = logging.getLogger(__name__)
+
+
+class CLIBackend:
+    """Операции с контейнерами через docker CLI на хосте: по процессу docker на каждую операцию."""
+
+    async def _run(self, ssh: paramiko.SSHClient, command: str) -> str:
+        stdout, stderr, exit_status = await execute_ssh_command(ssh, command)
+        if exit_status != 0:
+            raise RuntimeError(stderr.strip())
+        return stdout
+
+    async def list(self, ssh: paramiko.SSHClient) -> list[ContainerInfo]:
+        stdout = await self._run(ssh, PS_FORMAT)
+        return [ContainerInfo.from_ps(json.loads(row)) for row in stdout.splitlines() if row.strip()]
+
+    async def is_running(self, ssh: paramiko.SSHClient, container_id: str) -> bool:
+        stdout = await self._run(ssh, f'docker inspect --format="{{{{.State.Running}}}}" {shlex.quote(container_id)}')
+        return stdout.strip() == "true"
+
+    async def start(self, ssh: paramiko.SSHClient, container_id: str):
+        await self._run(ssh, f'docker start {shlex.quote(container_id)}')
+
+    async def stop(self, ssh: paramiko.SSHClient, container_id: str):
+        await self._run(ssh, f'docker stop {shlex.quote(container_id)}')
+
+    async def remove(self, ssh: paramiko.SSHClient, container_id: str):
+        await self._run(ssh, f'docker rm {shlex.quote(container_id)}')
+
+
+class EngineBackend:
+    """Операции с контейнерами через Docker Engine API: на каждое SSH-соединение пула держится клиент
+    с постоянными каналами docker system dial-stdio. Если API недоступно (нет dial-stdio, поток не открылся),
+    операция выполняется через CLI, а API для этого соединения снова проверяется через retry_interval.
+    Операция, запрос которой уже ушел демону (таймаут, обрыв при ожидании ответа), через CLI не повторяется.
+    Канал выполняющегося запроса занимает слот сессии вызывающего обработчика, а простаивающие каналы -
+    нет, поэтому их не больше max_idle, чтобы вместе с SSH_MAX_SESSIONS не превысить MaxSessions sshd."""
+
+    def __init__(self, fallback: CLIBackend | None = None, retry_interval: float = DOCKER_API_RETRY_INTERVAL,
+                 max_idle: int = DOCKER_API_MAX_IDLE):
+        self.fallback = fallback or CLIBackend()
+        self.retry_interval = retry_interval
+        self.max_idle = max_idle
+        self._engines: weakref.WeakKeyDictionary[paramiko.SSHClient, DockerEngine] = weakref.WeakKeyDictionary()
+        self._disabled: weakref.WeakKeyDictionary[paramiko.SSHClient, float] = weakref.WeakKeyDictionary()
+
+    def engine(self, ssh: paramiko.SSHClient) -> DockerEngine | None:
+        """Клиент API для соединения или None, пока не истек интервал после неудачной проверки."""
+        if time.monotonic() < self._disabled.get(ssh, 0.0):
+            return None
+        engine = self._engines.get(ssh)
+        if engine is None:
+            engine = self._engines[ssh] = DockerEngine(dial_stdio(ssh), max_idle=self.max_idle)
+        return engine
+
+    def _invoke(self, engine: DockerEngine, method: str, *args):
+        if not engine.verified:
+            engine.ping()
+        return getattr(self, f"_{method}")(engine, *args)
+
+    async def _call(self, ssh: paramiko.SSHClient, method: str, *args):
+        """Выполняет метод клиента API; если запрос не удалось отправить - тот же метод CLI-бэкенда.
+        Ошибки демона (DockerAPIError) и операций с неизвестным результатом (EngineRequestError)
+        не перехватываются."""
+        engine = self.engine(ssh)
+        if engine is not None:
+            try:
+                return await run_blocking(self._invoke, engine, method, *args)
+            except EngineUnavailable as e:
+                logger.warning(f"Docker Engine API недоступно, используется docker CLI "
+                               f"(повторная проверка через {self.retry_interval:.0f} сек): {e}")
+                self._disabled[ssh] = time.monotonic() + self.retry_interval
+                self._engines.pop(ssh, None)
+                engine.close()
+        return await getattr(self.fallback, method)(ssh, *args)
+
+    @staticmethod
+    def _list(engine: DockerEngine) -> list[ContainerInfo]:
+        return [ContainerInfo.from_api(row) for row in engine.containers()]
+
+    @staticmethod
+    def _is_running(engine: DockerEngine, container_id: str) -> bool:
+        return engine.inspect(container_id)["State"]["Running"]
+
+    @staticmethod
+    def _start(engine: DockerEngine, container_id: str):
+        engine.start(container_id)
+
+    @staticmethod
+    def _stop(engine: DockerEngine, container_id: str):
+        engine.stop(container_id)
+
+    @staticmethod
+    def _remove(engine: DockerEngine, container_id: str):
+        engine.remove(container_id)
+
+    async def list(self, ssh: paramiko.SSHClient) -> list[ContainerInfo]:
+        return await self._call(ssh, "list")
+
+    async def is_running(self, ssh: paramiko.SSHClient, container_id: str) -> bool:
+        return await self._call(ssh, "is_running", container_id)
+
+    async def start(self, ssh: paramiko.SSHClient, container_id: str):
+        await self._call(ssh, "start", container_id)
+
+    async def stop(self, ssh: paramiko.SSHClient, container_id: str):
+        await self._call(ssh, "stop", container_id)
+
+    async def remove(self, ssh: paramiko.SSHClient, container_id: str):
+        await self._call(ssh, "remove", container_id)
+
+
+container_backend = EngineBackend() if DOCKER_BACKEND == "api" else CLIBackend()
@@ -0,0 +1,120 @@
+import re
+import shlex
+
+import paramiko
+
+from utils.ssh import execute_ssh_command
+from config import CONTAINER_BULK_PARALLEL, DEPLOY_TIMEOUT
+
+ACTIONS = {
+    "start": 'docker start "$id"',
+    "stop": 'docker stop "$id"',
+    "remove": '{ [ "$state" != running ] && [ "$state" != restarting ] && [ "$state" != paused ] '
+              '|| docker stop "$id"; } && docker rm "$id"',
+}
+GLOB_CHARS = "*?["
+NAME_PATTERN = re.compile(r"^[A-Za-z0-9_.\-]+$")
+GLOB_PATTERN = re.compile(r"^[A-Za-z0-9_.\-*?\[\]!]+$")
+LABEL_PATTERN = re.compile(r"^label=[A-Za-z0-9_.\-/]+(=[^\s'\"`$\\]*)?$")
+
+
+class BulkResult:
+    """Итог операции над одним контейнером (или аргумента, которому ничего не соответствует)."""
+
+    def __init__(self, container_id: str, name: str, ok: bool, message: str = ""):
+        self.container_id = container_id
+        self.name = name
+        self.ok = ok
+        self.message = message
+
+
+def is_selector(ref: str) -> bool:
+    """Аргумент выбирает группу контейнеров (glob по имени или label=), а не один контейнер."""
+    return ref.startswith("label=") or any(char in ref for char in GLOB_CHARS)
+
+
+def validate_selector(ref: str):
+    """Проверяет аргумент, чтобы его можно было подставить в удаленный скрипт (glob в case - без кавычек)."""
+    if ref.startswith("label="):
+        valid = LABEL_PATTERN.match(ref)
+    elif is_selector(ref):
+        valid = GLOB_PATTERN.match(ref)
+    else:
+        valid = NAME_PATTERN.match(ref)
+    if not valid:
+        raise ValueError(f"Недопустимый контейнер или селектор: {ref}")
+
+
+def _resolve_script(refs: list[str]) -> str:
+    """Часть скрипта, которая печатает "id name state" выбранных контейнеров (возможно, с повторами)
+    и "- ref -" для аргументов, которым ничего не соответствует."""
+    each = 'printf "%s\\n" "$all" | while read id name state; do'
+    lines = []
+    for ref in refs:
+        if ref.startswith("label="):
+            lines.append(f'found=$(docker ps -aq --no-trunc --filter {shlex.quote(ref)} | '
+                         f'while read id; do printf "%s\\n" "$all" | grep "^$id "; done)')
+        elif is_selector(ref):
+            lines.append(f'found=$({each} case "$name" in {ref}) echo "$id $name $state";; esac; done)')
+        else:
+            # Как docker CLI: сначала точное имя, затем префикс ID
+            lines.append(f'found=$({each} [ "$name" = {ref} ] && echo "$id $name $state"; done)')
+            lines.append(f'[ -n "$found" ] || found=$({each} case "$id" in {ref}*) echo "$id $name $state";; '
+                         f'esac; done)')
+        lines.append(f'if [ -n "$found" ]; then echo "$found"; else echo "- {ref} -"; fi')
+    return "\n".join(lines)
+
+
+def bulk_command(action: str, refs: list[str], parallel: int = CONTAINER_BULK_PARALLEL) -> str:
+    """Скрипт, который на хосте разрешает аргументы в контейнеры и выполняет над ними действие параллельно
+    (не больше parallel одновременно). Печатает по строке на контейнер: "id<TAB>имя<TAB>код<TAB>сообщение"."""
+    if action not in ACTIONS:
+        raise ValueError(f"Неизвестное действие: {action}")
+    for ref in refs:
+        validate_selector(ref)
+    return f"""
+all=$(docker ps -a --no-trunc --format '{{{{.ID}}}} {{{{.Names}}}} {{{{.State}}}}') || exit 1
+act() {{
+    id=$1; name=$2; state=$3
+    out=$({{ {ACTIONS[action]}; }} 2>&1 >/dev/null)
+    code=$?
+    printf '%s\\t%s\\t%s\\t%s\\n' "$id" "$name" "$code" "$(printf '%s' "$out" | tail -n 1)"
+}}
+jobs=0
+while read id name state; do
+    if [ "$id" = - ]; then printf -- '-\\t%s\\tnot_found\\t\\n' "$name"; continue; fi
+    act "$id" "$name" "$state" &
+    jobs=$((jobs + 1))
+    if [ "$jobs" -ge {parallel} ]; then wait -n; jobs=$((jobs - 1)); fi
+done < <({{
+{_resolve_script(refs)}
+}} | awk '!seen[$1 " " $2]++')
+wait
+"""
+
+
+async def bulk_action(ssh: paramiko.SSHClient, action: str, refs: list[str],
+                      timeout: float = DEPLOY_TIMEOUT) -> list[BulkResult]:
+    """Выполняет действие над всеми контейнерами, выбранными аргументами, за один вызов на хосте."""
+    command = f"bash -c {shlex.quote(bulk_command(action, refs))}"
+    stdout, stderr, exit_status = await execute_ssh_command(ssh, command, timeout=timeout)
+    if exit_status != 0:
+        raise RuntimeError(f"Не удалось получить список контейнеров: {stderr.strip()}")
+    results = []
+    for line in stdout.splitlines():
+        container_id, name, code, message = (line.split("\t", 3) + [""] * 4)[:4]
+        if code == "not_found":
+            results.append(BulkResult("-", name, False, "не найден"))
+        elif container_id:
+            results.append(BulkResult(container_id[:12], name, code == "0", message.strip()))
+    return results
+
+
+def format_results(results: list[BulkResult], done: str, summary: str) -> str:
+    """Таблица результатов по контейнерам; первая строка - сводка, ошибки выводятся первыми.
+    done - итог для одного контейнера ("остановлен"), summary - для сводки ("Остановлено")."""
+    succeeded = sum(result.ok for result in results)
+    matched = sum(result.container_id != "-" for result in results)
+    rows = [f"{result.container_id}\t{result.name}\t{done if result.ok else 'ошибка: ' + result.message}"
+            for result in sorted(results, key=lambda r: (r.ok, r.name))]
+    return f"{summary}: {succeeded} из {matched}\nID\tИмя\tРезультат\n" + "\n".join(rows)
@@ -1,109 +1,203 @@
 import paramiko
 from telegram import Update
 from telegram.ext import ContextTypes
-from auth.auth import Auth
-from utils.ssh import connect_ssh, execute_ssh_command
-from utils.telegram import send_unauthorized_message, send_paginated_message
-from config import VPS_HOST, VPS_USERNAME, VPS_KEY_PATH, VPS_PASSWORD
+from auth.auth import get_auth
+from utils.ssh import ssh_pool, execute_ssh_command, read_ssh_lines
+from utils.telegram import reply, send_unauthorized_message, send_paginated_message
+from config import LOG_MAX_LINES, LOG_MAX_BYTES
+from .backend import container_backend
+from .follow import container_log_hub, container_logs_command, MISSING_CONTAINER_STATUS
+from .alerts import get_alert_engine, parse_rule, METRIC_NAMES
+from .metrics import metrics_sampler, parse_duration, format_size
+from .bulk import bulk_action, format_results, is_selector
+from .engine import DockerAPIError
+from .watcher import container_watcher
+
+
+def format_containers(containers: list) -> str:
+    """Таблица контейнеров для ответа /containers."""
+    return "Контейнеры:\nID\tИмя\tПорты\tСтатус\n" + "\n".join(
+        f"{c.id[:12]}\t{c.name}\t{c.ports}\t{c.status}" for c in containers)
 
 
 async def list_containers(ssh: paramiko.SSHClient, update: Update):
-    """Показывает список всех контейнеров."""
-    command = 'docker ps -a --format "{{.ID}}\t{{.Names}}\t{{.Ports}}\t{{.Status}}"'
-    stdout, stderr, exit_status = execute_ssh_command(ssh, command)
+    """Показывает список всех контейнеров; пока поток событий подключен, список берется из кэша."""
+    if container_watcher.ready:
+        containers = container_watcher.list()
+    else:
+        try:
+            containers = await container_backend.list(ssh)
+        except (RuntimeError, DockerAPIError) as e:
+            await reply(update, f"Ошибка при получении списка контейнеров: {e}")
+            return
 
-    if exit_status != 0:
-        await update.message.reply_text(f"Ошибка при получении списка контейнеров: {stderr}")
+    if not containers:
+        await reply(update, "Контейнеры не найдены.")
         return
 
-    containers = stdout.strip().split("\n")
-    if not containers or containers == ['']:
-        await update.message.reply_text("Контейнеры не найдены.")
-        return
-
-    response = "Контейнеры:\nID\tИмя\tПорты\tСтатус\n" + "\n".join(containers)
-    await send_paginated_message(update, response)
+    await send_paginated_message(update, format_containers(containers))
 
 
 async def start_container(ssh: paramiko.SSHClient, container_id: str, update: Update):
     """Запускает указанный контейнер."""
-    command = f'docker start {container_id}'
-    stdout, stderr, exit_status = execute_ssh_command(ssh, command)
-
-    if exit_status != 0:
-        await update.message.reply_text(f"Ошибка при запуске контейнера {container_id}: {stderr}")
+    try:
+        await container_backend.start(ssh, container_id)
+    except (RuntimeError, DockerAPIError) as e:
+        await reply(update, f"Ошибка при запуске контейнера {container_id}: {e}")
         return
 
-    await update.message.reply_text(f"Контейнер {container_id} успешно запущен.")
+    await reply(update, f"Контейнер {container_id} успешно запущен.")
 
 
 async def stop_container(ssh: paramiko.SSHClient, container_id: str, update: Update):
     """Останавливает указанный контейнер."""
-    command = f'docker stop {container_id}'
-    stdout, stderr, exit_status = execute_ssh_command(ssh, command)
-
-    if exit_status != 0:
-        await update.message.reply_text(f"Ошибка при остановке контейнера {container_id}: {stderr}")
+    try:
+        await container_backend.stop(ssh, container_id)
+    except (RuntimeError, DockerAPIError) as e:
+        await reply(update, f"Ошибка при остановке контейнера {container_id}: {e}")
         return
 
-    await update.message.reply_text(f"Контейнер {container_id} успешно остановлен.")
+    await reply(update, f"Контейнер {container_id} успешно остановлен.")
 
 
 async def remove_container(ssh: paramiko.SSHClient, container_id: str, update: Update):
-    """Останавливает и удаляет указанный контейнер."""
-    command = f'docker inspect --format="{{{{.State.Running}}}}" {container_id}'
-    stdout, stderr, exit_status = execute_ssh_command(ssh, command)
-
-    if exit_status != 0:
-        await update.message.reply_text(f"Ошибка при проверке статуса контейнера {container_id}: {stderr}")
+    """Останавливает и удаляет указанный контейнер. Состояние берется у демона, а не из кэша наблюдателя:
+    кэш может отставать от событий, и docker rm упал бы на только что запущенном контейнере."""
+    try:
+        running = await container_backend.is_running(ssh, container_id)
+    except (RuntimeError, DockerAPIError) as e:
+        await reply(update, f"Ошибка при проверке статуса контейнера {container_id}: {e}")
         return
 
-    if stdout.strip() == "true":
-        command = f'docker stop {container_id}'
-        stdout, stderr, exit_status = execute_ssh_command(ssh, command)
-        if exit_status != 0:
-            await update.message.reply_text(f"Ошибка при остановке контейнера {container_id}: {stderr}")
+    if running:
+        try:
+            await container_backend.stop(ssh, container_id)
+        except (RuntimeError, DockerAPIError) as e:
+            await reply(update, f"Ошибка при остановке контейнера {container_id}: {e}")
             return
 
-    command = f'docker rm {container_id}'
-    stdout, stderr, exit_status = execute_ssh_command(ssh, command)
-
-    if exit_status != 0:
-        await update.message.reply_text(f"Ошибка при удалении контейнера {container_id}: {stderr}")
+    try:
+        await container_backend.remove(ssh, container_id)
+    except (RuntimeError, DockerAPIError) as e:
+        await reply(update, f"Ошибка при удалении контейнера {container_id}: {e}")
         return
 
-    await update.message.reply_text(f"Контейнер {container_id} успешно удален.")
+    await reply(update, f"Контейнер {container_id} успешно удален.")
 
 
-async def container_logs(ssh: paramiko.SSHClient, container_id: str, update: Update):
-    """Показывает последние 50 строк логов указанного контейнера."""
-    command = f'docker logs --tail 50 {container_id}'
-    stdout, stderr, exit_status = execute_ssh_command(ssh, command)
+async def bulk_containers(ssh: paramiko.SSHClient, action: str, refs: list[str], update: Update, done: str,
+                          summary: str):
+    """Выполняет действие над всеми выбранными контейнерами одним вызовом на хосте и показывает таблицу итогов."""
+    try:
+        results = await bulk_action(ssh, action, refs)
+    except ValueError as e:
+        await reply(update, str(e))
+        return
 
-    if exit_status != 0:
-        await update.message.reply_text(f"Ошибка при получении логов контейнера {container_id}: {stderr}")
+    if not results:
+        await reply(update, "Контейнеры не найдены.")
         return
 
-    logs = stdout.strip()
+    await send_paginated_message(update, format_results(results, done, summary))
+
+
+def parse_logs_options(args: list[str]) -> dict:
+    """Разбирает опции /logs: --tail N, --since T, --until T, --grep PATTERN, --follow."""
+    options = {"tail": None, "since": None, "until": None, "grep": None, "follow": False}
+    i = 0
+    while i < len(args):
+        name = args[i]
+        if name == "--follow":
+            options["follow"] = True
+            i += 1
+            continue
+        if name not in ("--tail", "--since", "--until", "--grep") or i + 1 >= len(args):
+            raise ValueError(f"Неизвестная опция или нет значения: {name}")
+        value = args[i + 1]
+        if name == "--tail":
+            options["tail"] = min(int(value), LOG_MAX_LINES)
+            if options["tail"] < 0:
+                raise ValueError("--tail должен быть неотрицательным числом")
+        else:
+            options[name[2:]] = value
+        i += 2
+    if options["follow"] and options["until"] is not None:
+        raise ValueError("--until нельзя использовать вместе с --follow")
+    if options["tail"] is None and options["since"] is None:
+        # С --grep без ограничений ищем по всему логу, показывая последние совпадения
+        options["tail"] = 0 if options["follow"] else None if options["grep"] is not None else 50
+    return options
+
+
+async def container_logs(ssh: paramiko.SSHClient, container_id: str, update: Update, options: dict | None = None):
+    """Показывает логи указанного контейнера (по умолчанию последние 50 строк) с учетом фильтров.
+    Выводится не больше LOG_MAX_LINES последних строк и LOG_MAX_BYTES байт; об усечении сообщается."""
+    command = container_logs_command(container_id, **(options or {"tail": 50}))
+    # На строку больше лимита: если она пришла, старые строки были отброшены
+    stdout, stderr, exit_status, truncated = await read_ssh_lines(ssh, f"{command} | tail -n {LOG_MAX_LINES + 1}",
+                                                                  max_bytes=LOG_MAX_BYTES)
+
+    if exit_status == MISSING_CONTAINER_STATUS:
+        await reply(update, f"Ошибка при получении логов контейнера {container_id}: {stderr}")
+        return
+
+    lines = stdout.split("\n")
+    if len(lines) > LOG_MAX_LINES:
+        lines, truncated = lines[-LOG_MAX_LINES:], True
+    logs = "\n".join(lines).strip()
     if not logs:
-        await update.message.reply_text(f"Логи для контейнера {container_id} пусты.")
+        await reply(update, f"Логи для контейнера {container_id} пусты.")
         return
 
-    await send_paginated_message(update, f"Логи контейнера {container_id}:\n{logs}")
+    response = f"Логи контейнера {container_id}:\n{logs}"
+    if truncated:
+        response += f"\n... вывод обрезан по лимиту {LOG_MAX_LINES} строк или {LOG_MAX_BYTES} байт."
+    await send_paginated_message(update, response)
+
+
+def format_window_stats(window: str, seconds: float) -> str:
+    """Минимум, среднее, p95 и максимум метрик каждого контейнера за окно из истории сборщика."""
+    formats = {"cpu": ("CPU", lambda v: f"{v:.1f}%"), "mem": ("Память", format_size),
+               "net_rx": ("Сеть вх.", lambda v: f"{format_size(v)}/с"),
+               "net_tx": ("Сеть исх.", lambda v: f"{format_size(v)}/с")}
+    blocks = []
+    for series in sorted(metrics_sampler.series.values(), key=lambda series: series.name):
+        stats = series.window(seconds)
+        if not stats:
+            continue
+        lines = [series.name]
+        for metric, (title, fmt) in formats.items():
+            if metric in stats:
+                lines.append(f"  {title}: " + " / ".join(fmt(value) for value in stats[metric]))
+        blocks.append("\n".join(lines))
+    if not blocks:
+        return f"Нет данных за {window}."
+    return f"Статистика контейнеров за {window} (мин / сред / p95 / макс):\n" + "\n".join(blocks)
 
 
 async def container_stats(ssh: paramiko.SSHClient, update: Update):
-    """Показывает статистику использования ресурсов всеми контейнерами."""
+    """Показывает текущую статистику использования ресурсов всеми контейнерами; пока работает
+    сборщик метрик, ответ берется из памяти."""
+    if metrics_sampler.ready:
+        stats = [f"{series.name}\t{series.latest['cpu']:.2f}%\t{format_size(series.latest['mem'])}\t"
+                 f"{format_size(series.latest['net_rx_total'])} / {format_size(series.latest['net_tx_total'])}"
+                 for series in metrics_sampler.running()]
+        if not stats:
+            await reply(update, "Контейнеры не найдены.")
+            return
+        await send_paginated_message(update, "Статистика контейнеров:\nИмя\tCPU\tПамять\tСеть\n" + "\n".join(stats))
+        return
+
     command = 'docker stats --no-stream --format "{{.Name}}\t{{.CPUPerc}}\t{{.MemUsage}}\t{{.NetIO}}"'
-    stdout, stderr, exit_status = execute_ssh_command(ssh, command)
+    stdout, stderr, exit_status = await execute_ssh_command(ssh, command)
 
     if exit_status != 0:
-        await update.message.reply_text(f"Ошибка при получении статистики: {stderr}")
+        await reply(update, f"Ошибка при получении статистики: {stderr}")
         return
 
     stats = stdout.strip().split("\n")
     if not stats or stats == ['']:
-        await update.message.reply_text("Контейнеры не найдены.")
+        await reply(update, "Контейнеры не найдены.")
         return
 
     response = "Статистика контейнеров:\nИмя\tCPU\tПамять\tСеть\n" + "\n".join(stats)
@@ -112,145 +206,239 @@ async def container_stats(ssh: paramiko.SSHClient, update: Update):
 
 async def handle_containers(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обрабатывает команду /containers."""
-    auth = Auth()
+    auth = get_auth()
     if not auth.is_authorized_user(update.message.from_user.id):
-        await update.message.reply_text("Вы не авторизованы. Обратитесь к администратору.")
+        await reply(update, "Вы не авторизованы. Обратитесь к администратору.")
         return
     if not auth.check_permission(update.message.from_user.id, "containers_list"):
         await send_unauthorized_message(update)
         return
 
-    ssh = None
     try:
-        ssh = connect_ssh(VPS_HOST, VPS_USERNAME, VPS_PASSWORD, VPS_KEY_PATH)
-        await list_containers(ssh, update)
+        async with ssh_pool.connection() as ssh:
+            await list_containers(ssh, update)
     except Exception as e:
-        await update.message.reply_text(f"Произошла ошибка: {str(e)}")
-    finally:
-        if ssh:
-            ssh.close()
+        await reply(update, f"Произошла ошибка: {str(e)}")
 
 
 async def handle_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обрабатывает команду /start_container <container_id>."""
-    auth = Auth()
+    """Обрабатывает команду /start_container <container_id|имя|glob|label=...> ..."""
+    auth = get_auth()
     if not auth.is_authorized_user(update.message.from_user.id):
-        await update.message.reply_text("Вы не авторизованы. Обратитесь к администратору.")
+        await reply(update, "Вы не авторизованы. Обратитесь к администратору.")
         return
     if not auth.check_permission(update.message.from_user.id, "containers_start"):
         await send_unauthorized_message(update)
         return
 
-    if len(context.args) != 1:
-        await update.message.reply_text("Использование: /start_container <container_id>")
+    if not context.args:
+        await reply(update, "Использование: /start_container <container_id|имя|glob|label=ключ=значение> ...")
         return
 
-    container_id = context.args[0]
-    ssh = None
     try:
-        ssh = connect_ssh(VPS_HOST, VPS_USERNAME, VPS_PASSWORD, VPS_KEY_PATH)
-        await start_container(ssh, container_id, update)
+        async with ssh_pool.connection() as ssh:
+            if len(context.args) == 1 and not is_selector(context.args[0]):
+                await start_container(ssh, context.args[0], update)
+            else:
+                await bulk_containers(ssh, "start", context.args, update, "запущен", "Запущено")
     except Exception as e:
-        await update.message.reply_text(f"Произошла ошибка: {str(e)}")
-    finally:
-        if ssh:
-            ssh.close()
+        await reply(update, f"Произошла ошибка: {str(e)}")
 
 
 async def handle_stop(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обрабатывает команду /stop <container_id>."""
-    auth = Auth()
+    """Обрабатывает команду /stop <container_id|имя|glob|label=...> ..."""
+    auth = get_auth()
     if not auth.is_authorized_user(update.message.from_user.id):
-        await update.message.reply_text("Вы не авторизованы. Обратитесь к администратору.")
+        await reply(update, "Вы не авторизованы. Обратитесь к администратору.")
         return
     if not auth.check_permission(update.message.from_user.id, "containers_stop"):
         await send_unauthorized_message(update)
         return
 
-    if len(context.args) != 1:
-        await update.message.reply_text("Использование: /stop <container_id>")
+    if not context.args:
+        await reply(update, "Использование: /stop <container_id|имя|glob|label=ключ=значение> ...")
         return
 
-    container_id = context.args[0]
-    ssh = None
     try:
-        ssh = connect_ssh(VPS_HOST, VPS_USERNAME, VPS_PASSWORD, VPS_KEY_PATH)
-        await stop_container(ssh, container_id, update)
+        async with ssh_pool.connection() as ssh:
+            if len(context.args) == 1 and not is_selector(context.args[0]):
+                await stop_container(ssh, context.args[0], update)
+            else:
+                await bulk_containers(ssh, "stop", context.args, update, "остановлен", "Остановлено")
     except Exception as e:
-        await update.message.reply_text(f"Произошла ошибка: {str(e)}")
-    finally:
-        if ssh:
-            ssh.close()
+        await reply(update, f"Произошла ошибка: {str(e)}")
 
 
 async def handle_remove(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обрабатывает команду /remove <container_id>."""
-    auth = Auth()
+    """Обрабатывает команду /remove <container_id|имя|glob|label=...> ..."""
+    auth = get_auth()
     if not auth.is_authorized_user(update.message.from_user.id):
-        await update.message.reply_text("Вы не авторизованы. Обратитесь к администратору.")
+        await reply(update, "Вы не авторизованы. Обратитесь к администратору.")
         return
     if not auth.check_permission(update.message.from_user.id, "containers_remove"):
         await send_unauthorized_message(update)
         return
 
-    if len(context.args) != 1:
-        await update.message.reply_text("Использование: /remove <container_id>")
+    if not context.args:
+        await reply(update, "Использование: /remove <container_id|имя|glob|label=ключ=значение> ...")
         return
 
-    container_id = context.args[0]
-    ssh = None
     try:
-        ssh = connect_ssh(VPS_HOST, VPS_USERNAME, VPS_PASSWORD, VPS_KEY_PATH)
-        await remove_container(ssh, container_id, update)
+        async with ssh_pool.connection() as ssh:
+            if len(context.args) == 1 and not is_selector(context.args[0]):
+                await remove_container(ssh, context.args[0], update)
+            else:
+                await bulk_containers(ssh, "remove", context.args, update, "удален", "Удалено")
     except Exception as e:
-        await update.message.reply_text(f"Произошла ошибка: {str(e)}")
-    finally:
-        if ssh:
-            ssh.close()
+        await reply(update, f"Произошла ошибка: {str(e)}")
 
 
 async def handle_container_logs(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обрабатывает команду /logs <container_id>."""
-    auth = Auth()
+    """Обрабатывает команду /logs <container_id> [--tail N] [--since T] [--until T] [--grep PATTERN] [--follow]."""
+    auth = get_auth()
     if not auth.is_authorized_user(update.message.from_user.id):
-        await update.message.reply_text("Вы не авторизованы. Обратитесь к администратору.")
+        await reply(update, "Вы не авторизованы. Обратитесь к администратору.")
         return
     if not auth.check_permission(update.message.from_user.id, "containers_list"):
         await send_unauthorized_message(update)
         return
 
-    if len(context.args) != 1:
-        await update.message.reply_text("Использование: /logs <container_id>")
+    if not context.args or context.args[0].startswith("--"):
+        await reply(update, "Использование: /logs <container_id> [--tail N] [--since 10m] [--until 2024-05-01T12:00] "
+                            "[--grep PATTERN] [--follow]")
         return
 
     container_id = context.args[0]
-    ssh = None
     try:
-        ssh = connect_ssh(VPS_HOST, VPS_USERNAME, VPS_PASSWORD, VPS_KEY_PATH)
-        await container_logs(ssh, container_id, update)
+        options = parse_logs_options(context.args[1:])
+        command = container_logs_command(container_id, **options)
+    except ValueError as e:
+        await reply(update, f"Ошибка в опциях: {e}")
+        return
+
+    if options["follow"]:
+        user_id = update.message.from_user.id
+        if not container_log_hub.follow(user_id, update, container_id, command):
+            await reply(update, "У вас уже открыт поток логов. Остановите его с помощью /logs_stop.")
+            return
+        await reply(update, f"Слежу за логами {container_id}. Для остановки используйте /logs_stop.")
+        return
+
+    try:
+        async with ssh_pool.connection() as ssh:
+            await container_logs(ssh, container_id, update, options)
     except Exception as e:
-        await update.message.reply_text(f"Произошла ошибка: {str(e)}")
-    finally:
-        if ssh:
-            ssh.close()
+        await reply(update, f"Произошла ошибка: {str(e)}")
+
+
+async def handle_logs_stop(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает команду /logs_stop."""
+    auth = get_auth()
+    if not auth.is_authorized_user(update.message.from_user.id):
+        await reply(update, "Вы не авторизованы. Обратитесь к администратору.")
+        return
+    if not auth.check_permission(update.message.from_user.id, "containers_list"):
+        await send_unauthorized_message(update)
+        return
+
+    follower = await container_log_hub.stop(update.message.from_user.id)
+    if follower is None:
+        await reply(update, "Поток логов не запущен.")
+        return
+    await reply(update, f"Поток логов {follower.container} остановлен.")
 
 
 async def handle_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обрабатывает команду /stats."""
-    auth = Auth()
+    """Обрабатывает команду /stats [окно], например /stats 1h."""
+    auth = get_auth()
     if not auth.is_authorized_user(update.message.from_user.id):
-        await update.message.reply_text("Вы не авторизованы. Обратитесь к администратору.")
+        await reply(update, "Вы не авторизованы. Обратитесь к администратору.")
         return
     if not auth.check_permission(update.message.from_user.id, "containers_list"):
         await send_unauthorized_message(update)
         return
 
-    ssh = None
+    if len(context.args) > 1:
+        await reply(update, "Использование: /stats [окно: 30s, 5m, 1h, 7d]")
+        return
+
+    if context.args:
+        try:
+            seconds = parse_duration(context.args[0])
+        except ValueError as e:
+            await reply(update, str(e))
+            return
+        if not metrics_sampler.ready:
+            await reply(update, "История метрик еще не собрана, попробуйте позже.")
+            return
+        await send_paginated_message(update, format_window_stats(context.args[0], seconds))
+        return
+
     try:
-        ssh = connect_ssh(VPS_HOST, VPS_USERNAME, VPS_PASSWORD, VPS_KEY_PATH)
-        await container_stats(ssh, update)
+        async with ssh_pool.connection() as ssh:
+            await container_stats(ssh, update)
     except Exception as e:
-        await update.message.reply_text(f"Произошла ошибка: {str(e)}")
-    finally:
-        if ssh:
-            ssh.close()
+        await reply(update, f"Произошла ошибка: {str(e)}")
+
+
+async def handle_alert_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает команду /alert_add <метрика> <селектор> <условие> [длительность] [пауза]."""
+    auth = get_auth()
+    if not auth.is_authorized_user(update.message.from_user.id):
+        await reply(update, "Вы не авторизованы. Обратитесь к администратору.")
+        return
+    if not auth.check_permission(update.message.from_user.id, "containers_list"):
+        await send_unauthorized_message(update)
+        return
+
+    try:
+        rule = parse_rule(context.args)
+    except ValueError as e:
+        await reply(update,
+            f"Ошибка: {e}\nИспользование: /alert_add <метрика> <селектор> <условие> [длительность] [пауза]\n"
+            f"Метрики: {', '.join(METRIC_NAMES)}\nПример: /alert_add cpu billing-* >90 5m 30m")
+        return
+
+    try:
+        added = get_alert_engine().add(update.effective_chat.id, *rule)
+        await reply(update, f"Правило добавлено: {added.describe()}")
+    except Exception as e:
+        await reply(update, f"Произошла ошибка: {str(e)}")
+
+
+async def handle_alert_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает команду /alert_list."""
+    auth = get_auth()
+    if not auth.is_authorized_user(update.message.from_user.id):
+        await reply(update, "Вы не авторизованы. Обратитесь к администратору.")
+        return
+    if not auth.check_permission(update.message.from_user.id, "containers_list"):
+        await send_unauthorized_message(update)
+        return
+
+    rules = get_alert_engine().chat_rules(update.effective_chat.id)
+    if not rules:
+        await reply(update, "Правил тревог нет.")
+        return
+    await send_paginated_message(update, "Правила тревог:\n" + "\n".join(rule.describe() for rule in rules))
+
+
+async def handle_alert_rm(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает команду /alert_rm <id>."""
+    auth = get_auth()
+    if not auth.is_authorized_user(update.message.from_user.id):
+        await reply(update, "Вы не авторизованы. Обратитесь к администратору.")
+        return
+    if not auth.check_permission(update.message.from_user.id, "containers_list"):
+        await send_unauthorized_message(update)
+        return
+
+    if len(context.args) != 1 or not context.args[0].lstrip("#").isdigit():
+        await reply(update, "Использование: /alert_rm <id>")
+        return
+
+    rule_id = int(context.args[0].lstrip("#"))
+    if get_alert_engine().remove(update.effective_chat.id, rule_id):
+        await reply(update, f"Правило #{rule_id} удалено.")
+    else:
+        await reply(update, f"Правило #{rule_id} не найдено.")
@@ -0,0 +1,190 @@
+import http.client
+import json
+import select
+import socket
+import threading
+from typing import Callable
+from urllib.parse import quote, urlencode
+
+import paramiko
+
+from config import DOCKER_API_VERSION, DOCKER_API_TIMEOUT
+
+DIAL_STDIO_COMMAND = "docker system dial-stdio"
+
+
+class DockerAPIError(Exception):
+    """Ответ Docker Engine API с кодом ошибки; message - текст ошибки от демона."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class EngineUnavailable(Exception):
+    """Запрос не дошел до демона: не удалось открыть поток к API или отправить запрос.
+    Операцию можно безопасно повторить другим способом (через docker CLI)."""
+
+
+class EngineRequestError(RuntimeError):
+    """Запрос отправлен, но ответ не получен (таймаут, обрыв): результат операции неизвестен,
+    поэтому ее нельзя повторять автоматически. Обрабатывается как ошибка операции, как RuntimeError CLI."""
+
+
+class EngineConnection(http.client.HTTPConnection):
+    """HTTP/1.1-соединение с Docker Engine API поверх произвольного потока (канал SSH, unix-сокет).
+    Соединение остается открытым между запросами (keep-alive) и переоткрывается при обрыве."""
+
+    def __init__(self, open_socket: Callable[[], socket.socket | paramiko.Channel], timeout: float):
+        super().__init__("docker", timeout=timeout)
+        self._open_socket = open_socket
+
+    def connect(self):
+        self.sock = self._open_socket()
+
+    def is_stale(self) -> bool:
+        """Простаивающее соединение закрыто другой стороной (или в нем неожиданные данные)."""
+        if self.sock is None:
+            return False
+        if isinstance(self.sock, paramiko.Channel):
+            return self.sock.closed or self.sock.eof_received or self.sock.recv_ready()
+        return bool(select.select([self.sock], [], [], 0)[0])
+
+
+def dial_stdio(ssh: paramiko.SSHClient, timeout: float = DOCKER_API_TIMEOUT) -> Callable[[], paramiko.Channel]:
+    """Возвращает функцию, открывающую поток к /var/run/docker.sock хоста через docker system dial-stdio
+    в отдельном канале общего SSH-соединения."""
+    def open_socket() -> paramiko.Channel:
+        channel = ssh.get_transport().open_session(timeout=timeout)
+        channel.settimeout(timeout)
+        channel.exec_command(DIAL_STDIO_COMMAND)
+        return channel
+    return open_socket
+
+
+def unix_socket(path: str, timeout: float = DOCKER_API_TIMEOUT) -> Callable[[], socket.socket]:
+    """Возвращает функцию, открывающую соединение с локальным unix-сокетом Docker."""
+    def open_socket() -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(path)
+        return sock
+    return open_socket
+
+
+class DockerEngine:
+    """Клиент Docker Engine API. Запросы блокирующие (вызываются через run_blocking); простаивающие
+    соединения хранятся в пуле и переиспользуются, так что запрос не порождает ни процесса docker
+    на хосте, ни нового канала SSH."""
+
+    def __init__(self, open_socket: Callable[[], socket.socket | paramiko.Channel],
+                 api_version: str = DOCKER_API_VERSION, timeout: float = DOCKER_API_TIMEOUT, max_idle: int = 4):
+        self.open_socket = open_socket
+        self.prefix = f"/v{api_version}" if api_version else ""
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.verified = False
+        self._idle: list[EngineConnection] = []
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> tuple[EngineConnection, bool]:
+        with self._lock:
+            while self._idle:
+                conn = self._idle.pop()
+                if not conn.is_stale():
+                    return conn, True
+                conn.close()
+        return EngineConnection(self.open_socket, self.timeout), False
+
+    def _release(self, conn: EngineConnection):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def _send(self, method: str, url: str, payload: bytes | None = None,
+              headers: dict | None = None) -> tuple[http.client.HTTPResponse, bytes]:
+        """Отправляет запрос и читает ответ. Ошибка до отправки запроса - EngineUnavailable, после -
+        EngineRequestError. GET, оборвавшийся на переиспользованном соединении, повторяется один раз на новом."""
+        while True:
+            conn, reused = self._acquire()
+            try:
+                if conn.sock is None:
+                    conn.connect()
+                conn.request(method, url, body=payload, headers=headers or {})
+            except (http.client.HTTPException, OSError, EOFError, paramiko.SSHException) as e:
+                conn.close()
+                if reused:
+                    continue
+                raise EngineUnavailable(f"Не удалось отправить запрос к Docker Engine API: {e}") from e
+            except BaseException:
+                conn.close()
+                raise
+            try:
+                response = conn.getresponse()
+                data = response.read()
+            except TimeoutError as e:
+                conn.close()
+                raise EngineRequestError(f"Docker Engine API не ответило за {self.timeout:.0f} сек") from e
+            except (http.client.HTTPException, OSError, EOFError, paramiko.SSHException) as e:
+                conn.close()
+                if reused and method == "GET":
+                    continue
+                raise EngineRequestError(f"Соединение с Docker Engine API оборвалось: {e}") from e
+            except BaseException:
+                conn.close()
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            return response, data
+
+    def ping(self):
+        """Проверяет, что поток ведет к Docker Engine API (есть docker system dial-stdio, демон отвечает).
+        Любая неудача - EngineUnavailable: проверка не меняет состояние хоста."""
+        try:
+            response, data = self._send("GET", self.prefix + "/_ping")
+        except EngineRequestError as e:
+            raise EngineUnavailable(str(e)) from e
+        if response.status != 200:
+            raise EngineUnavailable(f"GET /_ping: {response.status} {data.decode(errors='replace').strip()}")
+        self.verified = True
+
+    def request(self, method: str, path: str, query: dict | None = None, body: dict | None = None):
+        """Выполняет запрос и возвращает разобранный JSON (None для пустого ответа)."""
+        url = self.prefix + path + (f"?{urlencode(query)}" if query else "")
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        response, data = self._send(method, url, payload, headers)
+        if response.status >= 400:
+            try:
+                message = json.loads(data).get("message", "")
+            except ValueError:
+                message = data.decode(errors="replace")
+            raise DockerAPIError(response.status, message.strip() or response.reason)
+        return json.loads(data) if data else None
+
+    def containers(self, include_stopped: bool = True) -> list[dict]:
+        return self.request("GET", "/containers/json", {"all": 1} if include_stopped else None)
+
+    def inspect(self, container_id: str) -> dict:
+        return self.request("GET", f"/containers/{quote(container_id, safe='')}/json")
+
+    def start(self, container_id: str):
+        self.request("POST", f"/containers/{quote(container_id, safe='')}/start")
+
+    def stop(self, container_id: str, timeout: int | None = None):
+        self.request("POST", f"/containers/{quote(container_id, safe='')}/stop",
+                     {"t": timeout} if timeout is not None else None)
+
+    def remove(self, container_id: str, force: bool = False):
+        self.request("DELETE", f"/containers/{quote(container_id, safe='')}", {"force": 1} if force else None)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import re
+import shlex
+
+from telegram import Update
+
+from utils.ssh import ssh_pool, SSHCommandStream
+from utils.telegram import reply, send_paginated_message
+from config import LOG_STREAM_FLUSH_INTERVAL, CONTAINER_LOG_BATCH_LINES
+
+logger = logging.getLogger(__name__)
+
+TIME_PATTERN = re.compile(r"^[0-9A-Za-z:.+\-]+$")
+MISSING_CONTAINER_STATUS = 125
+
+
+def container_logs_command(container: str, tail: int | None = None, since: str | None = None,
+                           until: str | None = None, grep: str | None = None, follow: bool = False) -> str:
+    """Команда docker logs с фильтрами. Потоки stdout и stderr контейнера объединяются и фильтруются
+    grep на хосте, поэтому по SSH передаются только подходящие строки; отсутствие контейнера
+    проверяется заранее (код MISSING_CONTAINER_STATUS), чтобы ошибка docker не смешалась с логами."""
+    for name, value in (("--since", since), ("--until", until)):
+        if value is not None and not TIME_PATTERN.match(value):
+            raise ValueError(f"Неверное значение {name}: {value}. Примеры: 10m, 2h, 2024-05-01T12:00")
+    options = []
+    if tail is not None:
+        options.append(f"--tail {tail}")
+    if since is not None:
+        options.append(f"--since {since}")
+    if until is not None:
+        options.append(f"--until {until}")
+    if follow:
+        options.append("--follow")
+    quoted = shlex.quote(container)
+    command = (f"docker inspect --format . {quoted} >/dev/null || exit {MISSING_CONTAINER_STATUS}; "
+               f"docker logs {' '.join(options)} {quoted} 2>&1")
+    if grep is not None:
+        command += f" | grep --line-buffered -E -- {shlex.quote(grep)}"
+    return command
+
+
+class ContainerLogFollower:
+    """Один docker logs --follow для пользователя: новые строки копятся и отправляются пачками раз
+    в LOG_STREAM_FLUSH_INTERVAL; если за интервал пришло больше max_lines строк, отправляются последние.
+    Поток идет через ssh_pool.stream_connection и не занимает слоты команд обработчиков."""
+
+    def __init__(self, user_id: int, update: Update, container: str, command: str,
+                 max_lines: int = CONTAINER_LOG_BATCH_LINES):
+        self.user_id = user_id
+        self.update = update
+        self.container = container
+        self.command = command
+        self.max_lines = max_lines
+        self.lines: list[str] = []
+        self.skipped = 0
+        self._task: asyncio.Task | None = None
+        self._flusher: asyncio.Task | None = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        for task in (self._task, self._flusher):
+            if task is not None:
+                task.cancel()
+        await asyncio.gather(*(t for t in (self._task, self._flusher) if t is not None), return_exceptions=True)
+        await self._flush()
+
+    def _add(self, line: str):
+        self.lines.append(line)
+        if len(self.lines) > self.max_lines:
+            del self.lines[0]
+            self.skipped += 1
+
+    async def _flush(self):
+        if not self.lines:
+            return
+        lines, self.lines = self.lines, []
+        skipped, self.skipped = self.skipped, 0
+        header = f"Логи {self.container}" + (f" (пропущено строк: {skipped})" if skipped else "") + ":\n"
+        try:
+            await send_paginated_message(self.update, header + "\n".join(lines))
+        except Exception as e:
+            logger.warning(f"Не удалось отправить логи {self.container} пользователю {self.user_id}: {e}")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(LOG_STREAM_FLUSH_INTERVAL)
+            await self._flush()
+
+    async def _run(self):
+        errors = []
+        try:
+            async with ssh_pool.stream_connection() as ssh:
+                async with SSHCommandStream(ssh, self.command) as stream:
+                    async for name, line in stream:
+                        if name == "stderr":
+                            errors.append(line)
+                        else:
+                            self._add(line)
+            text = f"Поток логов {self.container} завершен."
+            if stream.exit_status == MISSING_CONTAINER_STATUS:
+                text = f"Ошибка при получении логов контейнера {self.container}: {' '.join(errors)}"
+        except Exception as e:
+            text = f"Поток логов {self.container} прерван: {e}"
+        container_log_hub.drop(self)
+        if self._flusher is not None:
+            self._flusher.cancel()
+        await self._flush()
+        await reply(self.update, text)
+
+
+class ContainerLogHub:
+    """Потоки логов контейнеров, не больше одного на пользователя."""
+
+    def __init__(self):
+        self.followers: dict[int, ContainerLogFollower] = {}
+
+    def follow(self, user_id: int, update: Update, container: str, command: str) -> bool:
+        """Запускает поток; возвращает False, если у пользователя уже есть поток."""
+        if user_id in self.followers:
+            return False
+        follower = self.followers[user_id] = ContainerLogFollower(user_id, update, container, command)
+        follower.start()
+        return True
+
+    async def stop(self, user_id: int) -> ContainerLogFollower | None:
+        follower = self.followers.pop(user_id, None)
+        if follower is not None:
+            await follower.stop()
+        return follower
+
+    def drop(self, follower: ContainerLogFollower):
+        if self.followers.get(follower.user_id) is follower:
+            del self.followers[follower.user_id]
+
+    async def close_all(self):
+        followers = list(self.followers.values())
+        self.followers.clear()
+        await asyncio.gather(*(follower.stop() for follower in followers), return_exceptions=True)
+
+
+container_log_hub = ContainerLogHub()
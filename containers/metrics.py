@@ -0,0 +1,260 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from array import array
+
+from utils.ssh import ssh_pool, SSHCommandStream
+from config import METRICS_TIERS, METRICS_MAX_CONTAINERS, METRICS_RETENTION, CONTAINER_WATCH_RETRY_DELAY
+
+logger = logging.getLogger(__name__)
+
+STATS_COMMAND = "docker stats --format '{{json .}}'"
+METRICS = ("cpu", "mem", "net_rx", "net_tx")
+DURATION_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)([smhd])$")
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+SIZE_PATTERN = re.compile(r"^([\d.]+)\s*([kKMGTP]?i?B)$")
+SIZE_UNITS = {"B": 1, "kB": 1000, "KB": 1000, "MB": 1000 ** 2, "GB": 1000 ** 3, "TB": 1000 ** 4,
+              "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3, "TiB": 1024 ** 4}
+
+
+def parse_duration(value: str) -> float:
+    """Разбирает длительность вида 30s, 5m, 1h, 7d и возвращает секунды."""
+    match = DURATION_PATTERN.match(value.strip())
+    if not match:
+        raise ValueError(f"Неверная длительность: {value}. Примеры: 30s, 5m, 1h, 7d")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+def parse_size(value: str) -> float:
+    """Разбирает размер из вывода docker stats (10.5MiB, 1.2kB) в байты."""
+    match = SIZE_PATTERN.match(value.strip())
+    if not match or match.group(2) not in SIZE_UNITS:
+        raise ValueError(f"Неверный размер: {value}")
+    return float(match.group(1)) * SIZE_UNITS[match.group(2)]
+
+
+def format_size(value: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(value) < 1024 or unit == "GiB":
+            return f"{value:.0f}{unit}" if unit == "B" else f"{value:.1f}{unit}"
+        value /= 1024
+    return f"{value:.1f}GiB"
+
+
+class Tier:
+    """Ярус истории одного контейнера: кольцевые массивы не больше size элементов с временем слота
+    и средним, минимумом и максимумом каждой метрики за слот длиной resolution секунд.
+    Значения копятся в текущем слоте и попадают в массивы, когда наступает следующий. Массивы растут
+    по мере заполнения, значения хранятся как float32: слот занимает 56 байт."""
+
+    def __init__(self, resolution: float, size: int):
+        self.resolution = resolution
+        self.size = size
+        self.times = array("d")
+        self.values = {(metric, kind): array("f") for metric in METRICS for kind in ("mean", "min", "max")}
+        self.head = 0
+        self.count = 0
+        self._slot: int | None = None
+        self._acc: dict[str, list[float]] = {}
+
+    @property
+    def span(self) -> float:
+        """Сколько секунд истории помещается в ярус."""
+        return self.resolution * self.size
+
+    def add(self, timestamp: float, sample: dict[str, tuple[float, float, float]]) -> tuple | None:
+        """Добавляет значения (среднее, минимум, максимум) в текущий слот. Если начался новый слот,
+        закрывает предыдущий и возвращает его (время, значения) для следующего яруса."""
+        slot = int(timestamp // self.resolution)
+        closed = None
+        if self._slot is not None and slot != self._slot:
+            closed = self._close()
+        self._slot = slot
+        for metric, (mean, low, high) in sample.items():
+            acc = self._acc.get(metric)
+            if acc is None:
+                self._acc[metric] = [mean, 1, low, high]
+            else:
+                acc[0] += mean
+                acc[1] += 1
+                acc[2] = min(acc[2], low)
+                acc[3] = max(acc[3], high)
+        return closed
+
+    def _close(self) -> tuple[float, dict[str, tuple[float, float, float]]]:
+        timestamp = self._slot * self.resolution
+        sample = {metric: (total / count, low, high) for metric, (total, count, low, high) in self._acc.items()}
+        if self.count < self.size:
+            self.times.append(timestamp)
+            for metric in METRICS:
+                mean, low, high = sample.get(metric, (float("nan"),) * 3)
+                self.values[metric, "mean"].append(mean)
+                self.values[metric, "min"].append(low)
+                self.values[metric, "max"].append(high)
+            self.count += 1
+        else:
+            index = self.head
+            self.times[index] = timestamp
+            for metric in METRICS:
+                mean, low, high = sample.get(metric, (float("nan"),) * 3)
+                self.values[metric, "mean"][index] = mean
+                self.values[metric, "min"][index] = low
+                self.values[metric, "max"][index] = high
+            self.head = (self.head + 1) % self.size
+        self._acc = {}
+        return timestamp, sample
+
+    def since(self, timestamp: float, metric: str) -> tuple[list[float], list[float], list[float]]:
+        """Возвращает средние, минимумы и максимумы метрики по слотам, начавшимся не раньше timestamp."""
+        means, lows, highs = [], [], []
+        for i in range(self.count):
+            index = (self.head + i) % self.size
+            mean = self.values[metric, "mean"][index]
+            if self.times[index] >= timestamp and mean == mean:
+                means.append(mean)
+                lows.append(self.values[metric, "min"][index])
+                highs.append(self.values[metric, "max"][index])
+        return means, lows, highs
+
+
+class ContainerSeries:
+    """История метрик контейнера: ярусы с понижением частоты (по умолчанию 1 с, 1 мин и 1 ч)
+    и последний полученный снимок."""
+
+    def __init__(self, name: str, tiers: list[tuple[float, int]] = METRICS_TIERS):
+        self.name = name
+        self.tiers = [Tier(resolution, size) for resolution, size in tiers]
+        self.latest: dict[str, float] = {}
+        self.updated: float = 0.0
+        self._net: tuple[float, float, float] | None = None
+
+    def add(self, timestamp: float, cpu: float, mem: float, net_rx: float, net_tx: float):
+        """Добавляет снимок docker stats; сетевые счетчики переводятся в скорость (байт/с)."""
+        values = {"cpu": cpu, "mem": mem}
+        if self._net is not None and timestamp > self._net[0] and net_rx >= self._net[1] and net_tx >= self._net[2]:
+            elapsed = timestamp - self._net[0]
+            values["net_rx"] = (net_rx - self._net[1]) / elapsed
+            values["net_tx"] = (net_tx - self._net[2]) / elapsed
+        self._net = (timestamp, net_rx, net_tx)
+        self.latest = dict(values, net_rx_total=net_rx, net_tx_total=net_tx)
+        self.updated = timestamp
+
+        sample = {metric: (value, value, value) for metric, value in values.items()}
+        for tier in self.tiers:
+            closed = tier.add(timestamp, sample)
+            if closed is None:
+                break
+            timestamp, sample = closed
+
+    def window(self, seconds: float, now: float | None = None) -> dict[str, tuple[float, float, float, float]]:
+        """Минимум, среднее, p95 и максимум каждой метрики за последние seconds секунд по самому
+        подробному ярусу, который их вмещает. Для грубых ярусов p95 считается по средним слотов."""
+        now = now if now is not None else time.time()
+        tier = next((tier for tier in self.tiers if tier.span >= seconds), self.tiers[-1])
+        result = {}
+        for metric in METRICS:
+            means, lows, highs = tier.since(now - seconds, metric)
+            if not means:
+                continue
+            ordered = sorted(means)
+            p95 = ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+            result[metric] = (min(lows), sum(means) / len(means), p95, max(highs))
+        return result
+
+
+class MetricsSampler:
+    """Фоновый сбор метрик из одного долгоживущего потока docker stats: по ContainerSeries на контейнер.
+    Поток сам подхватывает запущенные позже контейнеры и идет через ssh_pool.stream_connection.
+    История хранится не больше чем для max_containers контейнеров; история контейнеров, от которых
+    нет данных дольше retention секунд, удаляется."""
+
+    def __init__(self, retry_delay: float = CONTAINER_WATCH_RETRY_DELAY, max_containers: int = METRICS_MAX_CONTAINERS,
+                 retention: float = METRICS_RETENTION):
+        self.retry_delay = retry_delay
+        self.max_containers = max_containers
+        self.retention = retention
+        self.series: dict[str, ContainerSeries] = {}
+        self._task: asyncio.Task | None = None
+        self._pruned = time.time()
+        self._capped = False
+
+    @property
+    def ready(self) -> bool:
+        return self._task is not None and bool(self.series)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def running(self, within: float = 10.0) -> list[ContainerSeries]:
+        """Контейнеры, от которых были данные за последние within секунд."""
+        now = time.time()
+        return sorted((series for series in self.series.values() if now - series.updated <= within),
+                      key=lambda series: series.name)
+
+    def _add(self, row: dict):
+        rx, tx = (parse_size(value) for value in row["NetIO"].split("/"))
+        now = time.time()
+        name = row.get("Name") or row["Container"]
+        series = self.series.get(name)
+        if series is None:
+            if len(self.series) >= self.max_containers and not self._evict(now):
+                return
+            series = self.series[name] = ContainerSeries(name)
+        series.add(now, float(row["CPUPerc"].rstrip("%") or 0), parse_size(row["MemUsage"].split("/")[0]), rx, tx)
+        if row.get("MemPerc", "").rstrip("%"):
+            series.latest["mem_pct"] = float(row["MemPerc"].rstrip("%"))
+        if now - self._pruned > 60:
+            self._prune()
+
+    def _evict(self, now: float) -> bool:
+        """Освобождает место под новый контейнер, удаляя историю давно не обновлявшегося.
+        Если все контейнеры с историей работают, новый не отслеживается."""
+        oldest = min(self.series.values(), key=lambda series: series.updated)
+        if now - oldest.updated > 10:
+            del self.series[oldest.name]
+            return True
+        if not self._capped:
+            self._capped = True
+            logger.warning(f"История метрик собирается только для {self.max_containers} контейнеров "
+                           f"(METRICS_MAX_CONTAINERS)")
+        return False
+
+    def _prune(self):
+        self._pruned = time.time()
+        horizon = self._pruned - self.retention
+        for name in [name for name, series in self.series.items() if series.updated < horizon]:
+            del self.series[name]
+
+    async def _follow(self, ssh):
+        async with SSHCommandStream(ssh, STATS_COMMAND) as stream:
+            async for name, line in stream:
+                # docker stats перерисовывает экран: перед JSON стоят управляющие последовательности
+                start = line.find("{")
+                if name != "stdout" or start < 0:
+                    continue
+                try:
+                    self._add(json.loads(line[start:]))
+                except (ValueError, KeyError) as e:
+                    logger.warning(f"Не удалось разобрать строку docker stats: {e}")
+            raise ConnectionError(f"Поток docker stats завершился (код {stream.exit_status})")
+
+    async def _run(self):
+        while True:
+            try:
+                async with ssh_pool.stream_connection() as ssh:
+                    await self._follow(ssh)
+            except Exception as e:
+                logger.warning(f"Поток docker stats прерван, переподключаюсь: {e}")
+            await asyncio.sleep(self.retry_delay)
+
+
+metrics_sampler = MetricsSampler()
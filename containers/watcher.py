@@ -0,0 +1,196 @@
+import asyncio
+import json
+import logging
+import re
+import time
+
+from utils.ssh import ssh_pool, execute_ssh_command, SSHCommandStream
+from config import CONTAINER_RESYNC_INTERVAL, CONTAINER_WATCH_RETRY_DELAY
+
+logger = logging.getLogger(__name__)
+
+PS_FORMAT = "docker ps -a --no-trunc --format '{{json .}}'"
+WATCHED_EVENTS = ("create", "start", "restart", "die", "stop", "pause", "unpause", "rename", "update", "destroy",
+                  "health_status")
+HEALTH_PATTERN = re.compile(r"\((healthy|unhealthy|health: starting)\)")
+REFRESH_DELAY = 0.2
+
+
+class ContainerInfo:
+    """Состояние контейнера в кэше: ID, имя, образ, порты, статус docker ps, состояние и health."""
+
+    def __init__(self, container_id: str, name: str, image: str, ports: str, status: str, state: str,
+                 health: str | None = None):
+        self.id = container_id
+        self.name = name
+        self.image = image
+        self.ports = ports
+        self.status = status
+        self.state = state
+        self.health = health
+
+    @classmethod
+    def from_ps(cls, row: dict) -> "ContainerInfo":
+        """Строит запись из строки docker ps --format '{{json .}}'."""
+        status = row.get("Status", "")
+        match = HEALTH_PATTERN.search(status)
+        state = row.get("State") or ("running" if status.startswith("Up") else "exited")
+        return cls(row["ID"], row.get("Names", ""), row.get("Image", ""), row.get("Ports", ""), status, state,
+                   match.group(1).removeprefix("health: ") if match else None)
+
+    @classmethod
+    def from_api(cls, row: dict) -> "ContainerInfo":
+        """Строит запись из элемента ответа GET /containers/json Docker Engine API."""
+        ports = ", ".join(
+            f"{port['IP']}:{port['PublicPort']}->{port['PrivatePort']}/{port['Type']}" if port.get("PublicPort")
+            else f"{port['PrivatePort']}/{port['Type']}"
+            for port in row.get("Ports") or [])
+        name = (row.get("Names") or [""])[0].lstrip("/")
+        return cls.from_ps({"ID": row["Id"], "Names": name, "Image": row.get("Image", ""), "Ports": ports,
+                            "Status": row.get("Status", ""), "State": row.get("State", "")})
+
+    @property
+    def running(self) -> bool:
+        return self.state in ("running", "restarting", "paused")
+
+
+class ContainerWatcher:
+    """Кэш состояния контейнеров, который поддерживается одним долгоживущим потоком docker events.
+    При подключении и раз в resync_interval кэш полностью перечитывается через docker ps, события
+    с момента перечитывания применяются поверх; порты и текст статуса затронутых событиями контейнеров
+    догружаются одним docker ps на пачку событий. Пока поток не подключен, кэш считается неготовым.
+    Поток идет через ssh_pool.stream_connection и не занимает слоты команд обработчиков."""
+
+    def __init__(self, resync_interval: float = CONTAINER_RESYNC_INTERVAL,
+                 retry_delay: float = CONTAINER_WATCH_RETRY_DELAY):
+        self.resync_interval = resync_interval
+        self.retry_delay = retry_delay
+        self.containers: dict[str, ContainerInfo] = {}
+        self.synced_at: float | None = None
+        self._connected = False
+        self._task: asyncio.Task | None = None
+        self._refresher: asyncio.Task | None = None
+        self._pending: set[str] = set()
+
+    @property
+    def ready(self) -> bool:
+        """Кэш перечитан и поток событий подключен."""
+        return self._connected and self.synced_at is not None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        tasks = [task for task in (self._task, self._refresher) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = self._refresher = None
+        self._connected = False
+
+    def list(self) -> list[ContainerInfo]:
+        """Контейнеры из кэша: запущенные сначала, затем по имени."""
+        return sorted(self.containers.values(), key=lambda c: (not c.running, c.name))
+
+    def find(self, ref: str) -> ContainerInfo | None:
+        """Ищет контейнер по полному или сокращенному ID либо по имени."""
+        if ref in self.containers:
+            return self.containers[ref]
+        matches = [c for c in self.containers.values() if c.name == ref or c.name == ref.lstrip("/")]
+        if not matches and len(ref) >= 3:
+            matches = [c for c in self.containers.values() if c.id.startswith(ref)]
+        return matches[0] if len(matches) == 1 else None
+
+    async def _resync(self, ssh) -> str:
+        """Перечитывает все контейнеры; возвращает время на хосте, с которого нужно читать события."""
+        stdout, stderr, exit_status = await execute_ssh_command(ssh, f"date +%s && {PS_FORMAT}")
+        if exit_status != 0:
+            raise RuntimeError(f"Не удалось получить список контейнеров: {stderr.strip()}")
+        since, *rows = stdout.splitlines()
+        containers = {}
+        for row in rows:
+            if row.strip():
+                info = ContainerInfo.from_ps(json.loads(row))
+                containers[info.id] = info
+        self.containers = containers
+        self.synced_at = time.monotonic()
+        return since.strip()
+
+    def _apply(self, event: dict):
+        """Сразу обновляет состояние по событию и ставит контейнер в очередь на догрузку из docker ps."""
+        action = event.get("Action") or event.get("status", "")
+        container_id = event.get("id") or event.get("Actor", {}).get("ID")
+        if not container_id:
+            return
+        if action == "destroy":
+            self.containers.pop(container_id, None)
+            self._pending.discard(container_id)
+            return
+        container = self.containers.get(container_id)
+        if container is not None:
+            if action.startswith("health_status:"):
+                container.health = action.split(":", 1)[1].strip()
+            elif action in ("start", "restart", "unpause"):
+                container.state = "running"
+            elif action == "pause":
+                container.state = "paused"
+            elif action in ("die", "stop"):
+                container.state, container.health = "exited", None
+            if action == "rename":
+                container.name = event.get("Actor", {}).get("Attributes", {}).get("name", container.name)
+        self._pending.add(container_id)
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_pending())
+
+    async def _refresh_pending(self):
+        """Догружает порты и статус контейнеров, затронутых событиями, одним запросом на пачку."""
+        await asyncio.sleep(REFRESH_DELAY)
+        while self._pending:
+            ids, self._pending = self._pending, set()
+            filters = " ".join(f"--filter id={container_id}" for container_id in sorted(ids))
+            try:
+                async with ssh_pool.connection() as ssh:
+                    stdout, stderr, exit_status = await execute_ssh_command(ssh, f"{PS_FORMAT} {filters}")
+            except Exception as e:
+                logger.warning(f"Не удалось обновить состояние контейнеров: {e}")
+                return
+            if exit_status != 0:
+                logger.warning(f"Не удалось обновить состояние контейнеров: {stderr.strip()}")
+                return
+            for row in stdout.splitlines():
+                if row.strip():
+                    info = ContainerInfo.from_ps(json.loads(row))
+                    if info.id in ids:
+                        self.containers[info.id] = info
+
+    async def _follow(self, ssh):
+        since = await self._resync(ssh)
+        filters = " ".join(f"--filter event={event}" for event in WATCHED_EVENTS)
+        command = f"docker events --since {since} --filter type=container {filters} --format '{{{{json .}}}}'"
+        async with SSHCommandStream(ssh, command) as stream:
+            self._connected = True
+            async for name, line in stream:
+                if name != "stdout" or not line.strip():
+                    continue
+                try:
+                    self._apply(json.loads(line))
+                except (ValueError, AttributeError) as e:
+                    logger.warning(f"Не удалось разобрать событие docker: {e}")
+            raise ConnectionError(f"Поток docker events завершился (код {stream.exit_status})")
+
+    async def _run(self):
+        while True:
+            try:
+                async with ssh_pool.stream_connection() as ssh:
+                    await asyncio.wait_for(self._follow(ssh), self.resync_interval)
+            except asyncio.TimeoutError:
+                # Плановое перечитывание: новый поток продолжит с момента нового docker ps
+                continue
+            except Exception as e:
+                self._connected = False
+                logger.warning(f"Поток docker events прерван, переподключаюсь: {e}")
+            await asyncio.sleep(self.retry_delay)
+
+
+container_watcher = ContainerWatcher()
@@ -0,0 +1,113 @@
+import shlex
+
+import paramiko
+
+from utils.ssh import execute_ssh_command
+from config import PROXY_CONF_DIR, PROXY_RELOAD_COMMAND, BLUEGREEN_PORT_OFFSET, DEPLOY_HEALTH_TIMEOUT, \
+    DEPLOY_HEALTH_INTERVAL
+
+SLOTS = ("blue", "green")
+
+
+def proxy_conf_path(image: str) -> str:
+    """Файл конфигурации обратного прокси (nginx), через который идет трафик на активный слот."""
+    return f'{PROXY_CONF_DIR}/deploy-bot-{image}.conf'
+
+
+def slot_port(port: int, slot: str) -> int:
+    """Локальный порт слота: приложение с портом 8080 слушает 18080 (blue) или 18081 (green)."""
+    return port + BLUEGREEN_PORT_OFFSET + SLOTS.index(slot)
+
+
+def health_check_command(port: int, health: str, address: str = '$ip') -> str:
+    """Проверка готовности: "tcp" - порт принимает соединения, "/path" - HTTP GET возвращает 2xx/3xx.
+    Проверяется порт приложения на IP контейнера (address - выражение shell), а не опубликованный порт
+    хоста: docker-proxy принимает на нем соединения сразу после запуска контейнера, когда приложение
+    еще не слушает."""
+    if health == 'tcp':
+        return f'timeout 2 bash -c "exec 3<>/dev/tcp/{address}/{port}" 2>/dev/null'
+    if not health.startswith('/'):
+        raise ValueError(f'Неверная проверка готовности: {health}. Используйте tcp или /path')
+    return f'curl -fsS -o /dev/null --max-time 2 "http://{address}:{port}"{shlex.quote(health)} 2>/dev/null'
+
+
+async def is_enabled(ssh: paramiko.SSHClient, image: str) -> bool:
+    """Проверяет, переведен ли сервис на blue/green (трафик идет через прокси)."""
+    stdout, stderr, exit_status = await execute_ssh_command(ssh, f'test -f {shlex.quote(proxy_conf_path(image))}')
+    return exit_status == 0
+
+
+async def active_slot(ssh: paramiko.SSHClient, image: str) -> str | None:
+    """Возвращает запущенный слот сервиса, если он есть."""
+    for slot in SLOTS:
+        stdout, stderr, exit_status = await execute_ssh_command(
+            ssh, f"docker inspect -f '{{{{.State.Running}}}}' {image}-{slot}")
+        if exit_status == 0 and stdout.strip() == 'true':
+            return slot
+    return None
+
+
+def start_and_wait_command(image: str, port: int, slot: str, health: str, timeout: float = DEPLOY_HEALTH_TIMEOUT,
+                           interval: float = DEPLOY_HEALTH_INTERVAL) -> str:
+    """Запускает образ в слоте на локальном порту и ждет готовности. Печатает "healthy <мс от запуска>";
+    код 2 - не дождались за timeout, 3 - контейнер завершился."""
+    name = f'{image}-{slot}'
+    local_port = slot_port(port, slot)
+    return f"""
+docker rm -f {name} >/dev/null 2>&1
+start=$(date +%s%N)
+docker run -d --name {name} --restart unless-stopped -p 127.0.0.1:{local_port}:{port} {image} >/dev/null || exit 1
+set -- $(docker inspect -f '{{{{range .NetworkSettings.Networks}}}}{{{{.IPAddress}}}} {{{{end}}}}' {name})
+ip=$1
+[ -n "$ip" ] || {{ echo "Не удалось определить IP контейнера {name}" >&2; exit 1; }}
+deadline=$((start + {int(timeout * 1000)} * 1000000))
+while :; do
+    if {health_check_command(port, health)}; then
+        echo "healthy $(( ($(date +%s%N) - start) / 1000000 ))"
+        exit 0
+    fi
+    [ "$(docker inspect -f '{{{{.State.Running}}}}' {name} 2>/dev/null)" = true ] || exit 3
+    [ "$(date +%s%N)" -ge "$deadline" ] && exit 2
+    sleep {interval}
+done
+"""
+
+
+def switch_command(image: str, port: int, slot: str, old_slot: str | None) -> str:
+    """Переключает прокси на слот и останавливает предыдущий контейнер. Контейнер, запущенный
+    без blue/green и занимающий публичный порт, удаляется непосредственно перед перезагрузкой прокси."""
+    conf = proxy_conf_path(image)
+    server = (f'server {{\n    listen {port};\n    location / {{\n'
+              f'        proxy_pass http://127.0.0.1:{slot_port(port, slot)};\n'
+              f'        proxy_set_header Host $host;\n        proxy_set_header X-Forwarded-For $remote_addr;\n'
+              f'    }}\n}}\n')
+    stop_old = f'docker rm -f {image}-{old_slot} >/dev/null 2>&1; ' if old_slot else ''
+    return (f'cp {shlex.quote(conf)} {shlex.quote(conf)}.bak 2>/dev/null; '
+            f'printf %s {shlex.quote(server)} > {shlex.quote(conf)} && '
+            f'{{ docker rm -f {image} >/dev/null 2>&1; true; }} && '
+            f'{{ {PROXY_RELOAD_COMMAND} || {{ mv {shlex.quote(conf)}.bak {shlex.quote(conf)} 2>/dev/null; exit 1; }}; }} && '
+            f'{stop_old}rm -f {shlex.quote(conf)}.bak')
+
+
+async def bluegreen_deploy(ssh: paramiko.SSHClient, image: str, port: int, health: str) -> int:
+    """Запускает образ в свободном слоте, дожидается готовности, переключает на него трафик
+    и останавливает старый контейнер. Возвращает время до готовности в миллисекундах.
+    При неудаче новый контейнер удаляется, трафик остается на старом, выбрасывается RuntimeError."""
+    old_slot = await active_slot(ssh, image)
+    slot = 'green' if old_slot == 'blue' else 'blue'
+    stdout, stderr, exit_status = await execute_ssh_command(ssh, start_and_wait_command(image, port, slot, health))
+    if exit_status != 0:
+        reason = {2: f'не готов за {DEPLOY_HEALTH_TIMEOUT:.0f} сек', 3: 'контейнер завершился'}.get(
+            exit_status, f'не удалось запустить: {stderr.strip()}')
+        logs, _, _ = await execute_ssh_command(ssh, f'docker logs --tail 20 {image}-{slot} 2>&1; '
+                                                    f'docker rm -f {image}-{slot} >/dev/null 2>&1')
+        raise RuntimeError(f'Новый контейнер ({slot}) {reason}, трафик не переключен.\n{logs.strip()}')
+    time_to_healthy = int(stdout.split()[-1])
+
+    stdout, stderr, exit_status = await execute_ssh_command(ssh, switch_command(image, port, slot, old_slot))
+    if exit_status != 0:
+        if old_slot is not None:
+            # Прокси остался на старом слоте, новый контейнер не нужен
+            await execute_ssh_command(ssh, f'docker rm -f {image}-{slot}')
+        raise RuntimeError(f'Не удалось переключить прокси: {stderr.strip()}')
+    return time_to_healthy
@@ -0,0 +1,75 @@
+import json
+import posixpath
+import re
+
+import paramiko
+
+from utils.ssh import execute_ssh_command
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+COMPOSE_CONFIG_PATTERN = re.compile(r'^((docker-)?compose(\.[\w-]+)?\.ya?ml|\.env)$')
+
+
+async def build_contexts(ssh: paramiko.SSHClient, repo_path: str) -> dict[str, list[str]] | None:
+    """Возвращает для каждого собираемого сервиса пути (относительно репозитория), изменение которых
+    требует пересборки: каталог контекста сборки и Dockerfile. None, если конфигурацию разобрать не удалось."""
+    stdout, stderr, exit_status = await execute_ssh_command(
+        ssh, f'cd {repo_path} && {{ docker-compose config --format json 2>/dev/null || docker-compose config; }}')
+    if exit_status != 0:
+        return None
+    try:
+        config = json.loads(stdout)
+    except ValueError:
+        if yaml is None:
+            return None
+        try:
+            config = yaml.safe_load(stdout)
+        except yaml.YAMLError:
+            return None
+
+    contexts = {}
+    for service, options in (config.get('services') or {}).items():
+        build = options.get('build')
+        if build is None:
+            continue
+        if isinstance(build, str):
+            build = {'context': build}
+        context = build.get('context', '.')
+        if '://' in context or context.startswith('git@'):
+            continue
+        context = posixpath.normpath(posixpath.relpath(posixpath.join(repo_path, context), repo_path))
+        if context.startswith('..'):
+            # Контекст вне репозитория (или путь через символическую ссылку): пересобираем при любом изменении
+            context = '.'
+        paths = [context]
+        if build.get('dockerfile'):
+            paths.append(posixpath.normpath(posixpath.join(context, build['dockerfile'])))
+        contexts[service] = paths
+    return contexts
+
+
+async def changed_files(ssh: paramiko.SSHClient, repo_path: str, old_commit: str, new_commit: str) -> list[str] | None:
+    """Возвращает файлы, измененные между коммитами, или None, если старого коммита нет в рабочей копии."""
+    stdout, stderr, exit_status = await execute_ssh_command(
+        ssh, f'git -C {repo_path} diff --name-only {old_commit} {new_commit}')
+    if exit_status != 0:
+        return None
+    return [line for line in stdout.splitlines() if line]
+
+
+def affected_services(contexts: dict[str, list[str]], changed: list[str]) -> list[str] | None:
+    """Сервисы, контекст сборки которых затронут изменениями. None означает, что изменилась сама
+    конфигурация docker-compose и пересобрать нужно все."""
+    if any(COMPOSE_CONFIG_PATTERN.match(path) for path in changed):
+        return None
+    affected = []
+    for service, paths in contexts.items():
+        for path in changed:
+            if any(prefix in ('', '.') or path == prefix or path.startswith(prefix + '/') for prefix in paths):
+                affected.append(service)
+                break
+    return sorted(affected)
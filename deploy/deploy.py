@@ -1,110 +1,357 @@
+import logging
 import re
+import shlex
+import time
 import paramiko
 from telegram import Update
 from telegram.ext import ContextTypes
-from config import VPS_HOST, VPS_USERNAME, VPS_KEY_PATH, TARGET_DIR, DEFAULT_PORT, VPS_PASSWORD
-from utils.ssh import connect_ssh
+from auth.auth import get_auth
+from config import TARGET_DIR, DEFAULT_PORT, DEPLOY_TIMEOUT, GIT_SHALLOW_CLONE, DEPLOY_KEEP_RELEASES, DEPLOY_BLUEGREEN, \
+    DEPLOY_HEALTH_CHECK
+from utils.ssh import ssh_pool, execute_ssh_command
+from utils.telegram import reply, send_paginated_message
+from utils.inventory import get_inventory
+from .state import get_deploy_state
+from .git_cache import build_checkout_command
+from .compose import build_contexts, changed_files, affected_services
+from .jobs import HostProgress, deploy_scheduler
+from .bluegreen import bluegreen_deploy, is_enabled as bluegreen_enabled
+from .releases import running_images, tag_release, untag_releases, retag_release_command, restore_release_command
 
-async def check_docker_file(ssh: paramiko.SSHClient, repo_path: str, update: Update) -> tuple[bool, bool, int]:
+logger = logging.getLogger(__name__)
+
+
+async def check_docker_file(ssh: paramiko.SSHClient, repo_path: str, progress: HostProgress) -> tuple[bool, bool, int]:
     """Проверяет наличие docker-compose.yml и Dockerfile, извлекает порт из Dockerfile."""
-    stdin, stdout, stderr = ssh.exec_command(f'test -f {repo_path}/docker-compose.yml && echo "exists"')
-    has_docker_compose = stdout.read().decode().strip() == 'exists'
-    await update.message.reply_text(f'Отладка: docker-compose.yml существует: {has_docker_compose}')
+    stdout, stderr, exit_status = await execute_ssh_command(ssh, f'test -f {repo_path}/docker-compose.yml && echo "exists"')
+    has_docker_compose = stdout.strip() == 'exists'
+    logger.debug(f'docker-compose.yml существует: {has_docker_compose}')
 
-    stdin, stdout, stderr = ssh.exec_command(f'test -f {repo_path}/Dockerfile && echo "exists"')
-    has_dockerfile = stdout.read().decode().strip() == 'exists'
-    await update.message.reply_text(f'Отладка: Dockerfile существует: {has_dockerfile}')
+    stdout, stderr, exit_status = await execute_ssh_command(ssh, f'test -f {repo_path}/Dockerfile && echo "exists"')
+    has_dockerfile = stdout.strip() == 'exists'
+    logger.debug(f'Dockerfile существует: {has_dockerfile}')
 
     port = DEFAULT_PORT
     if has_dockerfile:
-        stdin, stdout, stderr = ssh.exec_command(f'cat {repo_path}/Dockerfile')
-        dockerfile_content = stdout.read().decode()
+        dockerfile_content, stderr, exit_status = await execute_ssh_command(ssh, f'cat {repo_path}/Dockerfile')
         expose_match = re.search(r'EXPOSE\s+(\d+)', dockerfile_content)
         if expose_match:
             port = int(expose_match.group(1))
-            await update.message.reply_text(f'Отладка: Порт из Dockerfile: {port}')
+            logger.debug(f'Порт из Dockerfile: {port}')
         else:
-            await update.message.reply_text(f'Отладка: Порт EXPOSE не найден, используется порт по умолчанию: {port}')
+            logger.debug(f'Порт EXPOSE не найден, используется порт по умолчанию: {port}')
 
     return has_docker_compose, has_dockerfile, port
 
-async def update_repository(ssh: paramiko.SSHClient, repo_path: str, repo_url: str, update: Update) -> bool:
-    """Обновляет репозиторий: выполняет git pull, если он существует, или git clone, если нет."""
-    stdin, stdout, stderr = ssh.exec_command(f'test -d {repo_path} && echo "exists"')
-    repo_exists = stdout.read().decode().strip() == 'exists'
-
-    if repo_exists:
-        await update.message.reply_text('Репозиторий уже существует, выполняю git pull...')
-        command = f'cd {repo_path} && git pull'
-    else:
-        await update.message.reply_text('Клонирую репозиторий...')
-        command = f'ssh-agent bash -c "ssh-add ~/.ssh/id_rsa; cd {TARGET_DIR} && git clone {repo_url}"'
-
-    stdin, stdout, stderr = ssh.exec_command(command)
-    exit_status = stdout.channel.recv_exit_status()
-    error = stderr.read().decode()
+async def update_repository(ssh: paramiko.SSHClient, repo_path: str, repo_url: str, progress: HostProgress) -> bool:
+    """Обновляет репозиторий через кэш зеркал: зеркало догружается инкрементальным fetch,
+    рабочая копия создается из него (clone --shared или shallow) или обновляется до его HEAD."""
+    progress.set_stage('обновление репозитория')
+    command = build_checkout_command(repo_url, repo_path, shallow=GIT_SHALLOW_CLONE)
+    stdout, error, exit_status = await execute_ssh_command(ssh, command, timeout=DEPLOY_TIMEOUT)
 
     if exit_status != 0:
-        action = 'git pull' if repo_exists else 'клонировании репозитория'
-        await update.message.reply_text(f'Ошибка при {action}: {error}')
+        progress.result = f'Ошибка при получении репозитория: {error}'
         return False
+    action = 'Рабочая копия создана из зеркала' if stdout.strip() == 'cloned' else 'Рабочая копия обновлена из зеркала'
+    progress.log(f'{action}.')
     return True
 
-async def deploy_container(ssh: paramiko.SSHClient, repo_path: str, repo_name: str, has_docker_compose: bool,
-                           port: int, update: Update) -> bool:
-    """Собирает и запускает Docker контейнер."""
-    await update.message.reply_text('Выполняю сборку и запуск контейнера...')
+async def get_head_commit(ssh: paramiko.SSHClient, repo_path: str) -> str | None:
+    """Возвращает SHA текущего коммита рабочей копии."""
+    stdout, stderr, exit_status = await execute_ssh_command(ssh, f'git -C {repo_path} rev-parse HEAD')
+    return stdout.strip() if exit_status == 0 else None
 
+async def get_image_id(ssh: paramiko.SSHClient, repo_path: str, repo_name: str, has_docker_compose: bool) -> str | None:
+    """Возвращает ID собранного образа (для docker-compose - ID образов всех сервисов через запятую)."""
     if has_docker_compose:
-        command = f'cd {repo_path} && docker-compose up --build -d'
+        command = f'cd {repo_path} && docker-compose images -q'
     else:
-        command = f'cd {repo_path} && docker build -t {repo_name.lower()} . && docker run -d -p {port}:{port} {repo_name.lower()}'
+        command = f"docker image inspect -f '{{{{.Id}}}}' {repo_name.lower()}"
+    stdout, stderr, exit_status = await execute_ssh_command(ssh, command)
+    if exit_status != 0:
+        return None
+    return ','.join(line.strip() for line in stdout.splitlines() if line.strip()) or None
 
-    stdin, stdout, stderr = ssh.exec_command(command)
-    stdout.channel.settimeout(300)
-    error = stderr.read().decode()
+async def plan_compose_services(ssh: paramiko.SSHClient, repo_path: str, old_commit: str, new_commit: str,
+                                progress: HostProgress) -> list[str] | None:
+    """Определяет сервисы docker-compose, которые нужно пересобрать после перехода с old_commit на new_commit.
+    None означает полную пересборку (изменилась конфигурация или не удалось сопоставить изменения)."""
+    changed = await changed_files(ssh, repo_path, old_commit, new_commit)
+    contexts = await build_contexts(ssh, repo_path) if changed is not None else None
+    if contexts is None:
+        progress.log('Не удалось сопоставить изменения с сервисами, пересобираю все.')
+        return None
+    services = affected_services(contexts, changed)
+    if services is None:
+        progress.log('Изменилась конфигурация docker-compose, пересобираю все сервисы.')
+    else:
+        progress.log(f'Изменено файлов: {len(changed)}, пересобираю сервисы: {", ".join(services) or "нет"}')
+    return services
+
+async def deploy_container(ssh: paramiko.SSHClient, repo_path: str, repo_name: str, has_docker_compose: bool,
+                           port: int, progress: HostProgress, services: list[str] | None = None,
+                           commit: str | None = None) -> bool:
+    """Собирает и запускает Docker контейнер. Сборка идет через BuildKit: неизмененные слои берутся
+    из кэша демона, а при его очистке - из inline-кэша предыдущего образа.
+    Для docker-compose можно передать services - тогда пересоздаются только эти сервисы.
+    Одиночный контейнер в режиме blue/green запускается рядом со старым и получает трафик после проверки готовности."""
+    progress.set_stage('сборка и запуск контейнера')
+
+    image = repo_name.lower()
+    compose = 'DOCKER_BUILDKIT=1 COMPOSE_DOCKER_CLI_BUILD=1 BUILDKIT_PROGRESS=plain docker-compose'
+    bluegreen = False
+    if has_docker_compose and services is None:
+        command = f'cd {repo_path} && {compose} up --build -d'
+    elif has_docker_compose and services:
+        command = f'cd {repo_path} && {compose} up -d --no-deps --build {" ".join(shlex.quote(s) for s in services)}'
+    elif has_docker_compose:
+        command = f'cd {repo_path} && {compose} up -d'
+    else:
+        command = (f'cd {repo_path} && DOCKER_BUILDKIT=1 docker build --progress=plain --build-arg BUILDKIT_INLINE_CACHE=1 '
+                   f'--cache-from {image} -t {image} .')
+        bluegreen = progress.job.bluegreen or await bluegreen_enabled(ssh, image)
+        if not bluegreen:
+            command += (f' && {{ docker rm -f {image} >/dev/null 2>&1; true; }} && '
+                        f'docker run -d --name {image} -p {port}:{port} {image}')
+
+    exit_status = await progress.run(ssh, command)
+    if exit_status != 0:
+        progress.result = f'Ошибка при развертывании (код {exit_status}), см. вывод выше.'
+        return False
+    if bluegreen:
+        return await switch_traffic(ssh, repo_name, port, progress, commit)
+    progress.result = f'Репозиторий успешно развернут на порту {port}!'
+    return True
 
-    if error and "DEPRECATED" not in error:
-        await update.message.reply_text(f'Ошибка при развертывании: {error}')
+async def switch_traffic(ssh: paramiko.SSHClient, repo_name: str, port: int, progress: HostProgress,
+                         commit: str | None) -> bool:
+    """Выполняет blue/green переключение и сообщает время до готовности в сравнении с прошлыми замерами."""
+    job, host = progress.job, progress.host
+    progress.set_stage(f'запуск в свободном слоте и проверка готовности ({job.health})')
+    state = get_deploy_state()
+    history = state.health_history(host.name, repo_name)
+    try:
+        time_to_healthy = await bluegreen_deploy(ssh, repo_name.lower(), port, job.health)
+    except RuntimeError as e:
+        progress.result = str(e)
         return False
-    await update.message.reply_text(f'Репозиторий успешно развернут на порту {port}!')
+    if commit is not None:
+        state.record_health(host.name, repo_name, commit, time_to_healthy)
+    previous = f' (прошлые: {", ".join(f"{ms / 1000:.1f}" for sha, ms, checked_at in history)} сек)' if history else ''
+    progress.result = (f'Трафик на порту {port} переключен без простоя, время до готовности '
+                       f'{time_to_healthy / 1000:.1f} сек{previous}.')
     return True
 
+async def save_release(ssh: paramiko.SSHClient, repo_path: str, repo_name: str, has_docker_compose: bool,
+                       port: int, commit: str, progress: HostProgress):
+    """Помечает образы развертывания тегом коммита и удаляет теги релизов сверх DEPLOY_KEEP_RELEASES."""
+    state = get_deploy_state()
+    host = progress.host.name
+    try:
+        images = await running_images(ssh, repo_path, repo_name.lower(), has_docker_compose)
+        await tag_release(ssh, images, commit)
+        state.add_release(host, repo_name, commit, None if has_docker_compose else port, has_docker_compose, images,
+                          progress.job.health)
+        await untag_releases(ssh, state.prune_releases(host, repo_name, DEPLOY_KEEP_RELEASES))
+    except Exception as e:
+        progress.log(f'Предупреждение: не удалось сохранить образы для отката: {str(e)}')
+
+async def run_deploy(progress: HostProgress) -> bool:
+    """Выполняет задание развертывания на одном хосте. Если HEAD не изменился с прошлого развертывания
+    на этом хосте, сборка пропускается (при force - выполняется все равно)."""
+    job, host = progress.job, progress.host
+    repo_path = f'{TARGET_DIR}/{job.repo_name}'
+    async with ssh_pool.connection(*host.credentials) as ssh:
+        await execute_ssh_command(ssh, f'mkdir -p {TARGET_DIR}')
+        logger.debug(f'Путь к репозиторию: {repo_path}')
+
+        if not await update_repository(ssh, repo_path, job.repo_url, progress):
+            return False
+
+        state = get_deploy_state()
+        commit = await get_head_commit(ssh, repo_path)
+        previous = state.get(host.name, job.repo_name)
+        if not job.force and commit is not None and previous is not None and previous.commit_sha == commit:
+            progress.result = (f'Коммит {commit[:12]} уже развернут ({previous.deployed_at} UTC), изменений нет - '
+                               f'сборка пропущена. Для принудительной пересборки добавьте к ссылке --force.')
+            return True
+
+        progress.set_stage('проверка Dockerfile и docker-compose.yml')
+        has_docker_compose, has_dockerfile, port = await check_docker_file(ssh, repo_path, progress)
+        if not has_docker_compose and not has_dockerfile:
+            progress.result = 'В репозитории отсутствует Dockerfile или docker-compose.yml'
+            return False
+
+        services = None
+        if has_docker_compose and not job.force and previous is not None and commit is not None:
+            services = await plan_compose_services(ssh, repo_path, previous.commit_sha, commit, progress)
+
+        if not await deploy_container(ssh, repo_path, job.repo_name, has_docker_compose, port, progress, services,
+                                      commit):
+            return False
+        if commit is not None:
+            progress.set_stage('сохранение релиза')
+            image_id = await get_image_id(ssh, repo_path, job.repo_name, has_docker_compose)
+            state.record(host.name, job.repo_name, job.repo_url, commit, image_id, None if has_docker_compose else port)
+            await save_release(ssh, repo_path, job.repo_name, has_docker_compose, port, commit, progress)
+        return True
+
 async def handle_deploy(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обрабатывает команду деплоя или текстовое сообщение с SSH-ссылкой."""
+    """Обрабатывает команду деплоя или текстовое сообщение с SSH-ссылкой: <ссылка> [хост|группа] [--force].
+    Задание ставится в очередь, обработчик сразу возвращает управление; на несколько хостов развертывание
+    идет параллельно, ход и итог по каждому хосту показываются в одном обновляемом сообщении."""
     message_text = update.message.text
     github_ssh_pattern = r'git@github\.com:[\w-]+/[\w-]+\.git'
     if not re.match(github_ssh_pattern, message_text):
-        await update.message.reply_text(
+        await reply(update,
             'Пожалуйста, отправьте действительную SSH ссылку на GitHub репозиторий (например: git@github.com:username/repository.git).')
         return
 
-    await update.message.reply_text('Начинаю развертывание репозитория...')
+    repo_url, *options = message_text.split()
+    force = '--force' in options
+    bluegreen = DEPLOY_BLUEGREEN or '--bluegreen' in options
+    health = next((option.split('=', 1)[1] for option in options if option.startswith('--health=')),
+                  DEPLOY_HEALTH_CHECK)
+    targets = [option for option in options if not option.startswith('--')]
+    if len(targets) > 1 or (health != 'tcp' and not health.startswith('/')):
+        await reply(update, 'Использование: <ссылка на репозиторий> [хост|группа|all] [--force] [--bluegreen] '
+                            '[--health=tcp|/path]')
+        return
 
-    ssh = None
+    inventory = get_inventory()
+    target = targets[0] if targets else inventory.default
     try:
-        ssh = connect_ssh(VPS_HOST, VPS_USERNAME, VPS_PASSWORD, VPS_KEY_PATH)
-        ssh.exec_command(f'mkdir -p {TARGET_DIR}')
+        hosts = inventory.resolve(target)
+    except KeyError as e:
+        await reply(update, f'Ошибка: {e.args[0]}. Доступны: {", ".join([*inventory.hosts, *inventory.groups, "all"])}')
+        return
 
-        repo_name = message_text.split('/')[-1].replace('.git', '')
-        repo_path = f'{TARGET_DIR}/{repo_name}'
-        await update.message.reply_text(f'Отладка: Путь к репозиторию: {repo_path}')
+    repo_name = repo_url.split('/')[-1].replace('.git', '')
+    deploy_scheduler.submit(update, repo_name, repo_url, force, target, hosts, run_deploy,
+                            bluegreen=bluegreen, health=health)
 
-        if not await update_repository(ssh, repo_path, message_text, update):
-            ssh.close()
-            return
+async def handle_deploy_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает команду /deploy_status [id]: список заданий или подробности одного задания."""
+    auth = get_auth()
+    if not auth.is_authorized_user(update.message.from_user.id):
+        await reply(update, 'Вы не авторизованы. Обратитесь к администратору.')
+        return
+    if not auth.check_permission(update.message.from_user.id, 'deploy'):
+        await reply(update, 'У вас нет прав на развертывание.')
+        return
 
-        has_docker_compose, has_dockerfile, port = await check_docker_file(ssh, repo_path, update)
-        if not has_docker_compose and not has_dockerfile:
-            await update.message.reply_text('В репозитории отсутствует Dockerfile или docker-compose.yml')
-            ssh.close()
+    if context.args:
+        try:
+            job = deploy_scheduler.get(int(context.args[0].lstrip('#')))
+        except ValueError:
+            await reply(update, 'Использование: /deploy_status [id]')
+            return
+        if job is None:
+            await reply(update, f'Задание {context.args[0]} не найдено.')
             return
+        await reply(update, job.render())
+        return
 
-        await deploy_container(ssh, repo_path, repo_name, has_docker_compose, port, update)
+    jobs = sorted(deploy_scheduler.jobs.values(), key=lambda job: (not job.active, -job.id))
+    if not jobs:
+        await reply(update, 'Заданий развертывания нет.')
+        return
+    await send_paginated_message(update, 'Задания развертывания:\n' + '\n'.join(job.summary() for job in jobs))
 
-        ssh.close()
+async def handle_deploy_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает команду /deploy_cancel <id>."""
+    auth = get_auth()
+    if not auth.is_authorized_user(update.message.from_user.id):
+        await reply(update, 'Вы не авторизованы. Обратитесь к администратору.')
+        return
+    if not auth.check_permission(update.message.from_user.id, 'deploy'):
+        await reply(update, 'У вас нет прав на развертывание.')
+        return
 
+    if len(context.args) != 1:
+        await reply(update, 'Использование: /deploy_cancel <id>')
+        return
+    try:
+        job_id = int(context.args[0].lstrip('#'))
+    except ValueError:
+        await reply(update, 'Идентификатор задания должен быть числом.')
+        return
+
+    if not deploy_scheduler.cancel(job_id):
+        await reply(update, f'Активное задание #{job_id} не найдено.')
+        return
+    await reply(update, f'Задание #{job_id} отменяется.')
+
+async def handle_rollback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает команду /rollback <repo> [sha] [--host name]: перезапускает сервис из сохраненных
+    образов указанного или предыдущего релиза, без git и сборки."""
+    auth = get_auth()
+    if not auth.is_authorized_user(update.message.from_user.id):
+        await reply(update, 'Вы не авторизованы. Обратитесь к администратору.')
+        return
+    if not auth.check_permission(update.message.from_user.id, 'deploy'):
+        await reply(update, 'У вас нет прав на развертывание.')
+        return
+
+    args = list(context.args)
+    host_name = None
+    if '--host' in args:
+        index = args.index('--host')
+        host_name = args[index + 1] if index + 1 < len(args) else ''
+        del args[index:index + 2]
+    if len(args) not in (1, 2) or host_name == '':
+        await reply(update, 'Использование: /rollback <repo> [sha] [--host name]')
+        return
+
+    try:
+        host = get_inventory().get(host_name)
+    except KeyError as e:
+        await reply(update, f'Ошибка: {e.args[0]}')
+        return
+
+    repo_name = args[0]
+    state = get_deploy_state()
+    current = state.get(host.name, repo_name)
+    releases = state.releases(host.name, repo_name)
+    if current is None or not releases:
+        await reply(update, f'Для {repo_name} на {host.name} нет сохраненных релизов.')
+        return
+
+    if len(args) == 2:
+        matches = [release for release in releases if release.commit_sha.startswith(args[1])]
+        if len(matches) != 1:
+            shas = ', '.join(release.commit_sha[:12] for release in releases)
+            await reply(update, f'Релиз {args[1]} не найден или неоднозначен. Доступные: {shas}')
+            return
+        target = matches[0]
+    else:
+        target = next((release for release in releases if release.commit_sha != current.commit_sha), None)
+        if target is None:
+            await reply(update, f'Для {repo_name} на {host.name} нет предыдущего релиза.')
+            return
+
+    await reply(update,
+        f'Откатываю {repo_name} на {host.name} к {target.commit_sha[:12]} ({target.deployed_at} UTC)...')
+    repo_path = f'{TARGET_DIR}/{repo_name}'
+    try:
+        async with deploy_scheduler.repo_lock(host.name, repo_name), ssh_pool.connection(*host.credentials) as ssh:
+            started = time.monotonic()
+            # Сервис за прокси откатывается тоже через свободный слот, без простоя
+            bluegreen = not target.compose and await bluegreen_enabled(ssh, repo_name.lower())
+            if bluegreen:
+                command = retag_release_command(target)
+            else:
+                command = restore_release_command(target, repo_path, repo_name.lower())
+            stdout, error, exit_status = await execute_ssh_command(ssh, command, timeout=DEPLOY_TIMEOUT)
+            if exit_status != 0:
+                await reply(update, f'Ошибка при откате: {error}')
+                return
+            if bluegreen:
+                await bluegreen_deploy(ssh, repo_name.lower(), target.port, target.health or DEPLOY_HEALTH_CHECK)
+            elapsed = time.monotonic() - started
+            image_id = await get_image_id(ssh, repo_path, repo_name, target.compose)
+            state.record(host.name, repo_name, current.repo_url, target.commit_sha, image_id, target.port)
+        await reply(update, f'{repo_name} на {host.name} откачен к {target.commit_sha[:12]} за {elapsed:.1f} сек.')
     except Exception as e:
-        await update.message.reply_text(f'Произошла ошибка: {str(e)}')
-        if ssh:
-            ssh.close()
+        await reply(update, f'Произошла ошибка: {str(e)}')
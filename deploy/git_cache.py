@@ -0,0 +1,62 @@
+import re
+import shlex
+
+from config import GIT_CACHE_DIR, GIT_SSH_KEY
+
+REPO_URL_PATTERN = re.compile(r'git@[\w.-]+:([\w-]+)/([\w-]+)\.git')
+
+
+def mirror_path(repo_url: str) -> str:
+    """Путь к bare-зеркалу репозитория в кэше: <GIT_CACHE_DIR>/<owner>/<repo>.git."""
+    match = REPO_URL_PATTERN.match(repo_url)
+    if not match:
+        raise ValueError(f'Неподдерживаемая ссылка на репозиторий: {repo_url}')
+    owner, name = match.groups()
+    return f'{GIT_CACHE_DIR}/{owner}/{name}.git'
+
+
+def build_checkout_command(repo_url: str, repo_path: str, shallow: bool = False) -> str:
+    """Строит удаленный скрипт, который обновляет зеркало репозитория инкрементальным fetch,
+    а затем создает или обновляет рабочую копию из зеркала, без повторного скачивания с GitHub.
+    Полная рабочая копия клонируется из зеркала локально (объекты - жесткие ссылки, а не alternates, чтобы
+    fetch --prune и gc зеркала не ломали ее), shallow - содержит только последний коммит.
+    Копия, созданная раньше через clone --shared, отвязывается от зеркала. Скрипт печатает "cloned" или "updated"."""
+    mirror = mirror_path(repo_url)
+    if shallow:
+        origin, depth = '"file://$mirror"', ' --depth 1'
+        clone = f'git clone -q --depth 1 {origin} "$work"'
+    else:
+        origin, depth = '"$mirror"', ''
+        clone = f'git clone -q {origin} "$work"'
+    return f"""
+set -e
+export GIT_SSH_COMMAND={shlex.quote(f'ssh -i {GIT_SSH_KEY} -o BatchMode=yes -o StrictHostKeyChecking=accept-new')}
+mirror={shlex.quote(mirror)}
+work={shlex.quote(repo_path)}
+mkdir -p "$(dirname "$mirror")" "$(dirname "$work")"
+exec 9>"$mirror.lock"
+flock 9
+# Копия, созданная через clone --shared, забирает объекты себе до того, как зеркало их удалит
+if [ -f "$work/.git/objects/info/alternates" ]; then
+    git -C "$work" repack -q -a -d
+    rm -f "$work/.git/objects/info/alternates"
+fi
+if [ -d "$mirror" ]; then
+    git -C "$mirror" remote set-url origin {shlex.quote(repo_url)}
+    git -C "$mirror" fetch -q --prune origin
+else
+    rm -rf "$mirror.tmp"
+    git clone -q --mirror {shlex.quote(repo_url)} "$mirror.tmp"
+    mv "$mirror.tmp" "$mirror"
+fi
+flock -u 9
+if [ -d "$work/.git" ]; then
+    git -C "$work" remote set-url origin {origin}
+    git -C "$work" fetch -q{depth} origin HEAD
+    git -C "$work" reset -q --hard FETCH_HEAD
+    echo updated
+else
+    {clone}
+    echo cloned
+fi
+"""
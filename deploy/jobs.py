@@ -0,0 +1,287 @@
+import asyncio
+import logging
+import shlex
+import time
+from collections import deque
+from typing import Awaitable, Callable
+
+import paramiko
+from telegram import Update
+
+from utils.ssh import SSHCommandStream, execute_ssh_command
+from utils.telegram import LiveMessage
+from utils.inventory import Host
+from config import DEPLOY_MAX_CONCURRENT, DEPLOY_OUTPUT_LINES, DEPLOY_JOB_HISTORY, DEPLOY_TIMEOUT, \
+    DEPLOY_HOST_PARALLEL, DEPLOY_HEALTH_CHECK
+
+STATUS_NAMES = {
+    "queued": "в очереди",
+    "running": "выполняется",
+    "done": "завершен",
+    "failed": "ошибка",
+    "cancelled": "отменен",
+}
+MAX_LINE_LENGTH = 300
+MAX_RENDER_LENGTH = 4000
+PGID_MARKER = "__deploy_bot_pgid__"
+TERMINATE_GRACE = 10
+
+logger = logging.getLogger(__name__)
+
+
+def process_group_command(command: str) -> str:
+    """Запускает команду в отдельной сессии и группе процессов (setsid) и печатает строку с PGID.
+    Без PTY закрытие SSH-канала не отправляет SIGHUP, и сборка продолжила бы работать на хосте,
+    поэтому при отмене группа завершается явно (terminate_command)."""
+    return f"setsid bash -c {shlex.quote(command)} </dev/null & pid=$!; echo {PGID_MARKER} $pid; wait $pid"
+
+
+def terminate_command(pgid: int, grace: float = TERMINATE_GRACE) -> str:
+    """Отправляет группе процессов SIGTERM, а если она не завершилась за grace секунд - SIGKILL."""
+    return (f"kill -TERM -- -{pgid} 2>/dev/null; "
+            f"(sleep {grace}; kill -KILL -- -{pgid} 2>/dev/null) </dev/null >/dev/null 2>&1 &")
+
+
+class HostProgress:
+    """Ход развертывания задания на одном хосте: свой статус, этап и итог; вывод попадает в общее
+    сообщение задания с пометкой хоста, если хостов несколько."""
+
+    def __init__(self, job: "DeployJob", host: Host):
+        self.job = job
+        self.host = host
+        self.status = "queued"
+        self.stage = "ожидание очереди"
+        self.result = ""
+        self.started: float | None = None
+        self.finished: float | None = None
+
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished if self.finished is not None else time.monotonic()) - self.started
+
+    def summary(self) -> str:
+        text = f"{self.host.name}: {STATUS_NAMES[self.status]}"
+        if self.started is not None:
+            text += f" за {self.elapsed():.0f} сек" if self.finished is not None else f", {self.stage}"
+        return text + (f" - {self.result}" if self.result and self.finished is not None else "")
+
+    def log(self, line: str):
+        self.job.log(line, self.host.name if len(self.job.targets) > 1 else None)
+
+    def set_stage(self, stage: str):
+        self.stage = stage
+        self.log(f"== {stage}")
+
+    async def run(self, ssh: paramiko.SSHClient, command: str, timeout: float = DEPLOY_TIMEOUT) -> int | None:
+        """Выполняет команду, передавая ее вывод в сообщение задания по мере поступления.
+        Возвращает код завершения или None, если команда не уложилась в timeout. При таймауте
+        и отмене задания удаленная команда завершается вместе со всеми дочерними процессами."""
+        pgid = None
+
+        async def follow() -> int | None:
+            nonlocal pgid
+            async with SSHCommandStream(ssh, process_group_command(command)) as stream:
+                async for name, line in stream:
+                    if pgid is None and name == "stdout" and line.startswith(PGID_MARKER):
+                        pgid = int(line.split()[1])
+                        continue
+                    self.log(line)
+            return stream.exit_status
+
+        try:
+            return await asyncio.wait_for(follow(), timeout)
+        except asyncio.TimeoutError:
+            self.log(f"Команда не завершилась за {timeout:.0f} сек и была прервана.")
+            await self._terminate(ssh, pgid)
+            return None
+        except asyncio.CancelledError:
+            await self._terminate(ssh, pgid)
+            raise
+
+    async def _terminate(self, ssh: paramiko.SSHClient, pgid: int | None):
+        if pgid is None:
+            return
+        try:
+            await execute_ssh_command(ssh, terminate_command(pgid), timeout=TERMINATE_GRACE)
+        except Exception as e:
+            logger.warning(f"Не удалось завершить группу процессов {pgid} на {self.host.name}: {e}")
+
+
+class DeployJob:
+    """Задание на развертывание репозитория на один или несколько хостов: статус, ход по хостам
+    и хвост вывода показываются в одном сообщении, обновляемом по ходу выполнения."""
+
+    def __init__(self, job_id: int, repo_name: str, repo_url: str, force: bool, target: str, hosts: list[Host],
+                 user_id: int, update: Update, bluegreen: bool = False, health: str = DEPLOY_HEALTH_CHECK):
+        self.id = job_id
+        self.repo_name = repo_name
+        self.repo_url = repo_url
+        self.force = force
+        self.bluegreen = bluegreen
+        self.health = health
+        self.target = target
+        self.targets = {host.name: HostProgress(self, host) for host in hosts}
+        self.user_id = user_id
+        self.status = "queued"
+        self.output: deque[str] = deque(maxlen=DEPLOY_OUTPUT_LINES)
+        self.created = time.monotonic()
+        self.started: float | None = None
+        self.finished: float | None = None
+        self.message = LiveMessage(update)
+        self.task: asyncio.Task | None = None
+
+    @property
+    def active(self) -> bool:
+        return self.finished is None
+
+    def elapsed(self) -> float:
+        """Время выполнения (или ожидания в очереди, если задание еще не началось)."""
+        start = self.started if self.started is not None else self.created
+        return (self.finished if self.finished is not None else time.monotonic()) - start
+
+    def summary(self) -> str:
+        """Краткая строка для списка заданий."""
+        text = f"#{self.id} {self.repo_name} -> {self.target}: {STATUS_NAMES[self.status]}, {self.elapsed():.0f} сек"
+        if self.active and len(self.targets) == 1:
+            text += f", этап: {next(iter(self.targets.values())).stage}"
+        return text
+
+    def render(self) -> str:
+        """Полный текст сообщения о ходе развертывания."""
+        header = (f"Деплой #{self.id} {self.repo_name} -> {self.target}: {STATUS_NAMES[self.status]} "
+                  f"({self.elapsed():.0f} сек)")
+        if len(self.targets) > 1:
+            header += "\n" + "\n".join(progress.summary() for progress in self.targets.values())
+            footer = ""
+        else:
+            progress = next(iter(self.targets.values()))
+            if self.active:
+                header += f"\nЭтап: {progress.stage}"
+            footer = f"\n{progress.result}" if progress.result else ""
+        lines = list(self.output)
+        while lines and len(header) + len(footer) + sum(len(line) + 1 for line in lines) > MAX_RENDER_LENGTH:
+            lines.pop(0)
+        body = "\n" + "\n".join(lines) if lines else ""
+        return header + body + footer
+
+    def refresh(self):
+        self.message.set(self.render())
+
+    def log(self, line: str, host: str | None = None):
+        """Добавляет строку вывода; у строк с прогрессом (\\r) остается только последнее состояние."""
+        line = line.rsplit("\r", 1)[-1].rstrip()
+        if line:
+            self.output.append((f"[{host}] " if host else "") + line[:MAX_LINE_LENGTH])
+            self.refresh()
+
+
+class DeployScheduler:
+    """Очередь заданий развертывания: задания одного репозитория на одном хосте выполняются строго
+    по очереди, одновременно выполняется не больше max_concurrent заданий, а внутри задания - не больше
+    host_parallel хостов параллельно. Обработчик команды не ждет сборки."""
+
+    def __init__(self, max_concurrent: int = DEPLOY_MAX_CONCURRENT, history: int = DEPLOY_JOB_HISTORY,
+                 host_parallel: int = DEPLOY_HOST_PARALLEL):
+        self.history = history
+        self.host_parallel = host_parallel
+        self.jobs: dict[int, DeployJob] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._locks: dict[tuple[str, str], asyncio.Lock] = {}
+        self._next_id = 1
+
+    def repo_lock(self, host: str, repo_name: str) -> asyncio.Lock:
+        """Блокировка репозитория на хосте; ее же берут другие операции, меняющие развертывание (откат)."""
+        return self._locks.setdefault((host, repo_name), asyncio.Lock())
+
+    def submit(self, update: Update, repo_name: str, repo_url: str, force: bool, target: str, hosts: list[Host],
+               run: Callable[[HostProgress], Awaitable[bool]], **options) -> DeployJob:
+        """Ставит задание в очередь и сразу возвращает его; options передаются в DeployJob."""
+        job = DeployJob(self._next_id, repo_name, repo_url, force, target, hosts, update.message.from_user.id, update,
+                        **options)
+        self._next_id += 1
+        self.jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job, run))
+        self._trim()
+        return job
+
+    async def _run(self, job: DeployJob, run: Callable[[HostProgress], Awaitable[bool]]):
+        # Сначала очередь репозитория, потом слот: ожидающее задание не занимает слот, нужный другим репозиториям.
+        # Блокировки берутся в порядке имен хостов, чтобы многохостовые задания не ждали друг друга по кругу.
+        held: list[asyncio.Lock] = []
+        try:
+            await job.message.start(job.render())
+            for name in sorted(job.targets):
+                lock = self.repo_lock(name, job.repo_name)
+                await lock.acquire()
+                held.append(lock)
+            async with self._semaphore:
+                job.status = "running"
+                job.started = time.monotonic()
+                job.refresh()
+                hosts = asyncio.Semaphore(self.host_parallel)
+                results = await asyncio.gather(*(self._run_host(progress, run, hosts, held)
+                                                 for progress in job.targets.values()))
+            job.status = "done" if all(results) else "failed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+        finally:
+            for lock in held:
+                lock.release()
+            job.finished = time.monotonic()
+            for progress in job.targets.values():
+                if progress.finished is None:
+                    progress.status = "cancelled"
+            job.message.finish(job.render())
+
+    async def _run_host(self, progress: HostProgress, run: Callable[[HostProgress], Awaitable[bool]],
+                        hosts: asyncio.Semaphore, held: list[asyncio.Lock]) -> bool:
+        """Выполняет задание на одном хосте, блокировка которого уже взята в _run, и сразу отпускает ее,
+        чтобы откат или следующее задание на этом хосте не ждали остальные хосты; ошибка на хосте
+        не прерывает остальные."""
+        lock = self.repo_lock(progress.host.name, progress.job.repo_name)
+        try:
+            async with hosts:
+                progress.status = "running"
+                progress.started = time.monotonic()
+                progress.job.refresh()
+                try:
+                    succeeded = await run(progress)
+                except Exception as e:
+                    succeeded = False
+                    progress.result = f"Произошла ошибка: {str(e)}"
+                progress.status = "done" if succeeded else "failed"
+                progress.finished = time.monotonic()
+                progress.job.refresh()
+                return succeeded
+        finally:
+            held.remove(lock)
+            lock.release()
+
+    def _trim(self):
+        """Оставляет в истории не больше history завершенных заданий."""
+        finished = [job_id for job_id, job in self.jobs.items() if not job.active]
+        for job_id in finished[:max(len(finished) - self.history, 0)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id: int) -> DeployJob | None:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: int) -> bool:
+        """Отменяет задание в очереди или прерывает выполняющееся; группе процессов удаленной
+        команды отправляется SIGTERM (см. HostProgress.run)."""
+        job = self.jobs.get(job_id)
+        if job is None or not job.active or job.task is None:
+            return False
+        job.task.cancel()
+        return True
+
+    async def close_all(self):
+        """Прерывает все задания."""
+        tasks = [job.task for job in self.jobs.values() if job.active and job.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+deploy_scheduler = DeployScheduler()
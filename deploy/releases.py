@@ -0,0 +1,61 @@
+import shlex
+
+import paramiko
+
+from utils.ssh import execute_ssh_command
+from .state import Release
+
+COMPOSE_IMAGES_COMMAND = ("docker-compose ps -q | xargs -r docker inspect "
+                          "-f '{{index .Config.Labels \"com.docker.compose.service\"}} {{.Config.Image}}'")
+
+
+def release_tag(image_ref: str, commit_sha: str) -> str:
+    """Имя образа с тегом коммита: myapp или myapp:latest -> myapp:<sha>."""
+    name = image_ref.rsplit(':', 1)[0] if ':' in image_ref.rsplit('/', 1)[-1] else image_ref
+    return f'{name}:{commit_sha[:12]}'
+
+
+async def running_images(ssh: paramiko.SSHClient, repo_path: str, image: str,
+                         has_docker_compose: bool) -> list[tuple[str, str]]:
+    """Возвращает пары (сервис, образ) запущенного развертывания; для одиночного контейнера сервис пустой."""
+    if not has_docker_compose:
+        return [('', image)]
+    stdout, stderr, exit_status = await execute_ssh_command(ssh, f'cd {repo_path} && {COMPOSE_IMAGES_COMMAND}')
+    if exit_status != 0:
+        raise RuntimeError(f'Не удалось получить образы сервисов: {stderr}')
+    images = dict(line.split(' ', 1) for line in stdout.splitlines() if ' ' in line)
+    return sorted(images.items())
+
+
+async def tag_release(ssh: paramiko.SSHClient, images: list[tuple[str, str]], commit_sha: str):
+    """Помечает образы развертывания тегом коммита, чтобы к ним можно было откатиться."""
+    command = ' && '.join(f'docker tag {shlex.quote(image_ref)} {shlex.quote(release_tag(image_ref, commit_sha))}'
+                          for service, image_ref in images)
+    stdout, stderr, exit_status = await execute_ssh_command(ssh, command)
+    if exit_status != 0:
+        raise RuntimeError(f'Не удалось пометить образы тегом {commit_sha[:12]}: {stderr}')
+
+
+async def untag_releases(ssh: paramiko.SSHClient, releases: list[Release]):
+    """Снимает теги устаревших релизов; слои удаляются демоном, если на них больше ничего не ссылается."""
+    tags = [shlex.quote(release_tag(image_ref, release.commit_sha))
+            for release in releases for service, image_ref in release.images]
+    if tags:
+        await execute_ssh_command(ssh, f'docker rmi {" ".join(tags)}')
+
+
+def retag_release_command(release: Release) -> str:
+    """Команда, возвращающая исходным именам образов содержимое образов релиза."""
+    return ' && '.join(f'docker tag {shlex.quote(release_tag(image_ref, release.commit_sha))} {shlex.quote(image_ref)}'
+                       for service, image_ref in release.images)
+
+
+def restore_release_command(release: Release, repo_path: str, image: str) -> str:
+    """Команда перезапуска сервиса из образов релиза без git и сборки: образы релиза
+    перепомечаются исходными именами, после чего контейнеры пересоздаются."""
+    retag = retag_release_command(release)
+    if release.compose:
+        return f'{retag} && cd {repo_path} && docker-compose up -d --no-build'
+    port = release.port
+    return (f'{retag} && {{ docker rm -f {image} >/dev/null 2>&1; true; }} && '
+            f'docker run -d --name {image} -p {port}:{port} {image}')
@@ -0,0 +1,194 @@
+from auth.db import Database, get_database
+from utils.inventory import DEFAULT_HOST_NAME
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deployments (
+    host TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    repo_url TEXT NOT NULL,
+    commit_sha TEXT NOT NULL,
+    image_id TEXT,
+    port INTEGER,
+    deployed_at TEXT NOT NULL,
+    PRIMARY KEY (host, repo)
+);
+CREATE TABLE IF NOT EXISTS releases (
+    host TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    commit_sha TEXT NOT NULL,
+    port INTEGER,
+    compose INTEGER NOT NULL,
+    deployed_at TEXT NOT NULL,
+    health TEXT,
+    PRIMARY KEY (host, repo, commit_sha)
+);
+CREATE TABLE IF NOT EXISTS release_images (
+    host TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    commit_sha TEXT NOT NULL,
+    service TEXT NOT NULL,
+    image_ref TEXT NOT NULL,
+    PRIMARY KEY (host, repo, commit_sha, service),
+    FOREIGN KEY (host, repo, commit_sha) REFERENCES releases(host, repo, commit_sha) ON DELETE CASCADE
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS health_checks (
+    host TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    commit_sha TEXT NOT NULL,
+    time_to_healthy_ms INTEGER NOT NULL,
+    checked_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_health_checks_repo ON health_checks (host, repo, checked_at);
+"""
+# Столбцы таблиц до появления инвентаря (без host); порядок - порядок переноса
+LEGACY_COLUMNS = {
+    "deployments": "repo, repo_url, commit_sha, image_id, port, deployed_at",
+    "releases": "repo, commit_sha, port, compose, deployed_at",
+    "release_images": "repo, commit_sha, service, image_ref",
+}
+
+
+class Deployment:
+    """Сведения о последнем успешном развертывании репозитория на хосте."""
+
+    def __init__(self, host: str, repo: str, repo_url: str, commit_sha: str, image_id: str | None,
+                 port: int | None, deployed_at: str):
+        self.host = host
+        self.repo = repo
+        self.repo_url = repo_url
+        self.commit_sha = commit_sha
+        self.image_id = image_id
+        self.port = port
+        self.deployed_at = deployed_at
+
+
+class Release:
+    """Сохраненный релиз: образы, помеченные тегом коммита, из которых можно перезапустить сервис.
+    images - пары (сервис docker-compose или "" для одиночного контейнера, исходное имя образа);
+    health - проверка готовности, с которой релиз развертывался (None у релизов, сохраненных раньше)."""
+
+    def __init__(self, host: str, repo: str, commit_sha: str, port: int | None, compose: bool, deployed_at: str,
+                 images: list[tuple[str, str]], health: str | None = None):
+        self.host = host
+        self.repo = repo
+        self.commit_sha = commit_sha
+        self.port = port
+        self.compose = compose
+        self.deployed_at = deployed_at
+        self.images = images
+        self.health = health
+
+
+class DeployState:
+    """Хранит в базе бота, какой коммит и образ развернут для каждого репозитория на каждом хосте."""
+
+    def __init__(self, db: Database | None = None):
+        self.db = db or get_database()
+        with self.db.lock, self.db.conn:
+            self._migrate_host_column()
+            self._migrate_health_column()
+        self.db.executescript(SCHEMA)
+
+    def _migrate_host_column(self):
+        """Переносит данные из таблиц без столбца host (до появления инвентаря) на хост по умолчанию.
+        Переносятся только существующие таблицы: в старых базах releases и release_images может не быть."""
+        legacy = []
+        for table in LEGACY_COLUMNS:
+            columns = [row[1] for row in self.db.conn.execute(f"PRAGMA table_info({table})")]
+            if columns and "host" not in columns:
+                legacy.append(table)
+        if not legacy:
+            return
+        self.db.conn.execute("BEGIN")
+        for table in legacy:
+            self.db.conn.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+        for statement in SCHEMA.split(";"):
+            if statement.strip():
+                self.db.conn.execute(statement)
+        for table in legacy:
+            self.db.conn.execute(f"""
+                INSERT INTO {table} (host, {LEGACY_COLUMNS[table]}) SELECT ?, {LEGACY_COLUMNS[table]} FROM {table}_old
+            """, (DEFAULT_HOST_NAME,))
+        for table in reversed(legacy):
+            self.db.conn.execute(f"DROP TABLE {table}_old")
+
+    def _migrate_health_column(self):
+        """Добавляет в releases столбец health, если таблица создана до его появления."""
+        columns = [row[1] for row in self.db.conn.execute("PRAGMA table_info(releases)")]
+        if columns and "health" not in columns:
+            self.db.conn.execute("ALTER TABLE releases ADD COLUMN health TEXT")
+
+    def get(self, host: str, repo: str) -> Deployment | None:
+        """Возвращает последнее развертывание репозитория на хосте."""
+        rows = self.db.query("""
+            SELECT host, repo, repo_url, commit_sha, image_id, port, deployed_at FROM deployments
+            WHERE host = ? AND repo = ?
+        """, (host, repo))
+        return Deployment(*rows[0]) if rows else None
+
+    def record(self, host: str, repo: str, repo_url: str, commit_sha: str, image_id: str | None, port: int | None):
+        """Запоминает успешное развертывание."""
+        self.db.execute("""
+            INSERT OR REPLACE INTO deployments (host, repo, repo_url, commit_sha, image_id, port, deployed_at)
+            VALUES (?, ?, ?, ?, ?, ?, datetime('now'))
+        """, (host, repo, repo_url, commit_sha, image_id, port))
+
+    def add_release(self, host: str, repo: str, commit_sha: str, port: int | None, compose: bool,
+                    images: list[tuple[str, str]], health: str | None = None):
+        """Запоминает образы, помеченные тегом коммита, и проверку готовности, чтобы откат использовал ее же."""
+        with self.db.lock, self.db.conn:
+            self.db.conn.execute("DELETE FROM releases WHERE host = ? AND repo = ? AND commit_sha = ?",
+                                 (host, repo, commit_sha))
+            self.db.conn.execute("""
+                INSERT INTO releases (host, repo, commit_sha, port, compose, deployed_at, health)
+                VALUES (?, ?, ?, ?, ?, datetime('now'), ?)
+            """, (host, repo, commit_sha, port, int(compose), health))
+            self.db.conn.executemany(
+                "INSERT INTO release_images (host, repo, commit_sha, service, image_ref) VALUES (?, ?, ?, ?, ?)",
+                [(host, repo, commit_sha, service, image_ref) for service, image_ref in images])
+
+    def releases(self, host: str, repo: str) -> list[Release]:
+        """Возвращает сохраненные релизы репозитория на хосте, новые сначала."""
+        rows = self.db.query("""
+            SELECT commit_sha, port, compose, deployed_at, health FROM releases WHERE host = ? AND repo = ?
+            ORDER BY deployed_at DESC, rowid DESC
+        """, (host, repo))
+        images: dict[str, list[tuple[str, str]]] = {}
+        for commit_sha, service, image_ref in self.db.query("""
+            SELECT commit_sha, service, image_ref FROM release_images WHERE host = ? AND repo = ? ORDER BY service
+        """, (host, repo)):
+            images.setdefault(commit_sha, []).append((service, image_ref))
+        return [Release(host, repo, commit_sha, port, bool(compose), deployed_at, images.get(commit_sha, []), health)
+                for commit_sha, port, compose, deployed_at, health in rows]
+
+    def prune_releases(self, host: str, repo: str, keep: int) -> list[Release]:
+        """Удаляет из базы релизы сверх последних keep и возвращает их, чтобы снять теги с образов."""
+        dropped = self.releases(host, repo)[keep:]
+        self.db.executemany("DELETE FROM releases WHERE host = ? AND repo = ? AND commit_sha = ?",
+                            [(host, repo, release.commit_sha) for release in dropped])
+        return dropped
+
+    def record_health(self, host: str, repo: str, commit_sha: str, time_to_healthy_ms: int):
+        """Запоминает время от запуска контейнера до готовности."""
+        self.db.execute("""
+            INSERT INTO health_checks (host, repo, commit_sha, time_to_healthy_ms, checked_at)
+            VALUES (?, ?, ?, ?, datetime('now'))
+        """, (host, repo, commit_sha, time_to_healthy_ms))
+
+    def health_history(self, host: str, repo: str, limit: int = 5) -> list[tuple[str, int, str]]:
+        """Возвращает последние замеры времени до готовности: (коммит, мс, время замера), новые сначала."""
+        return self.db.query("""
+            SELECT commit_sha, time_to_healthy_ms, checked_at FROM health_checks
+            WHERE host = ? AND repo = ? ORDER BY checked_at DESC, rowid DESC LIMIT ?
+        """, (host, repo, limit))
+
+
+_deploy_state: DeployState | None = None
+
+
+def get_deploy_state() -> DeployState:
+    """Возвращает общее хранилище состояния развертываний."""
+    global _deploy_state
+    if _deploy_state is None:
+        _deploy_state = DeployState()
+    return _deploy_state
@@ -0,0 +1,148 @@
+import re
+import shlex
+
+import paramiko
+
+from auth.db import Database, get_database
+from utils.ssh import execute_ssh_command, SSHCommandStream
+from config import LOG_INDEX_STEP
+from .search import time_filter
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS log_index_files (
+    host TEXT NOT NULL,
+    path TEXT NOT NULL,
+    inode INTEGER NOT NULL,
+    indexed_to INTEGER NOT NULL,
+    PRIMARY KEY (host, path)
+);
+CREATE TABLE IF NOT EXISTS log_index_entries (
+    host TEXT NOT NULL,
+    path TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    ts TEXT NOT NULL,
+    PRIMARY KEY (host, path, offset)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_log_index_entries_ts ON log_index_entries (host, path, ts);
+"""
+
+TIMESTAMP_PATTERN = re.compile(rb"^(\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2})")
+AWK_TIMESTAMP = "/^[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9][ T][0-9][0-9]:[0-9][0-9]:[0-9][0-9]/"
+
+
+def line_timestamp(line: bytes) -> str | None:
+    """Возвращает время в начале строки лога в виде "YYYY-MM-DD HH:MM:SS" или None."""
+    match = TIMESTAMP_PATTERN.match(line)
+    return match.group(1).decode().replace("T", " ") if match else None
+
+
+class LogIndex:
+    """Разреженный индекс "время -> байтовое смещение" для больших файлов логов.
+    Примерно каждые step байт запоминается смещение первой строки с временной меткой;
+    индекс хранится в базе бота и достраивается по мере роста файла."""
+
+    def __init__(self, db: Database | None = None, step: int = LOG_INDEX_STEP):
+        self.db = db or get_database()
+        self.step = step
+        self.db.executescript(SCHEMA)
+
+    def state(self, host: str, path: str) -> tuple[int, int] | None:
+        """Возвращает inode и смещение, до которого файл проиндексирован."""
+        rows = self.db.query("SELECT inode, indexed_to FROM log_index_files WHERE host = ? AND path = ?", (host, path))
+        return rows[0] if rows else None
+
+    def next_entry_offset(self, host: str, path: str) -> int:
+        """Смещение, начиная с которого следует добавить очередную запись индекса."""
+        rows = self.db.query("SELECT max(offset) FROM log_index_entries WHERE host = ? AND path = ?", (host, path))
+        return 0 if rows[0][0] is None else rows[0][0] + self.step
+
+    def reset(self, host: str, path: str, inode: int):
+        """Начинает индекс заново (новый файл после ротации или усечения)."""
+        with self.db.lock, self.db.conn:
+            self.db.conn.execute("DELETE FROM log_index_entries WHERE host = ? AND path = ?", (host, path))
+            self.db.conn.execute(
+                "INSERT OR REPLACE INTO log_index_files (host, path, inode, indexed_to) VALUES (?, ?, ?, 0)",
+                (host, path, inode))
+
+    def record(self, host: str, path: str, inode: int, start: int, end: int, entries: list[tuple[int, str]]):
+        """Добавляет записи для диапазона [start, end), прочитанного монитором логов.
+        Диапазон принимается, только если он продолжает уже проиндексированную часть без пропусков."""
+        state = self.state(host, path)
+        if state is None or state[0] != inode or state[1] < start:
+            return
+        with self.db.lock, self.db.conn:
+            self.db.conn.executemany(
+                "INSERT OR IGNORE INTO log_index_entries (host, path, offset, ts) VALUES (?, ?, ?, ?)",
+                [(host, path, offset, ts) for offset, ts in entries if offset >= state[1]])
+            self.db.conn.execute("UPDATE log_index_files SET indexed_to = ? WHERE host = ? AND path = ?",
+                                 (max(state[1], end), host, path))
+
+    async def extend(self, ssh: paramiko.SSHClient, host: str, path: str) -> int:
+        """Достраивает индекс по данным, дописанным в файл с прошлого раза; возвращает размер файла."""
+        command = f'test -r {shlex.quote(path)} && stat -L -c "%i %s" -- {shlex.quote(path)}'
+        stdout, stderr, exit_status = await execute_ssh_command(ssh, command)
+        if exit_status != 0 or len(stdout.split()) != 2:
+            raise FileNotFoundError(f"Файл {path} не существует или недоступен для чтения: {stderr.strip()}")
+        inode, size = (int(value) for value in stdout.split())
+
+        state = self.state(host, path)
+        if state is None or state[0] != inode or state[1] > size:
+            self.reset(host, path, inode)
+            state = (inode, 0)
+        start = state[1]
+        if start >= size:
+            return size
+
+        next_at = max(self.next_entry_offset(host, path) - start, 0)
+        program = (f"{{ if (pos >= next_at && match($0, {AWK_TIMESTAMP})) "
+                   f"{{ print base + pos, substr($0, 1, 19); next_at = pos + step }} pos += length($0) + 1 }}")
+        command = (f"tail -c +{start + 1} -- {shlex.quote(path)} | head -c {size - start} | "
+                   f"LC_ALL=C awk -v base={start} -v step={self.step} -v next_at={next_at} {shlex.quote(program)}")
+        entries = []
+        async with SSHCommandStream(ssh, command) as stream:
+            async for name, line in stream:
+                if name != "stdout":
+                    continue
+                offset, ts = line.split(" ", 1)
+                entries.append((int(offset), ts.replace("T", " ")))
+                if len(entries) >= 1000:
+                    self.record(host, path, inode, start, start, entries)
+                    entries = []
+        if stream.exit_status != 0:
+            raise RuntimeError(f"Ошибка при индексации {path}")
+        self.record(host, path, inode, start, size, entries)
+        return size
+
+    def lookup(self, host: str, path: str, since: str, until: str) -> tuple[int, int | None]:
+        """Возвращает диапазон байт [start, end), в котором лежат строки с временем от since до until;
+        end равен None, если диапазон доходит до конца проиндексированной части."""
+        rows = self.db.query("""
+            SELECT offset FROM log_index_entries WHERE host = ? AND path = ? AND ts < ?
+            ORDER BY ts DESC, offset DESC LIMIT 1
+        """, (host, path, since))
+        start = rows[0][0] if rows else 0
+        rows = self.db.query("""
+            SELECT offset FROM log_index_entries WHERE host = ? AND path = ? AND ts > ?
+            ORDER BY ts, offset LIMIT 1
+        """, (host, path, until))
+        end = rows[0][0] if rows else None
+        return start, end
+
+
+def range_command(path: str, start: int, end: int | None, since: str, until: str) -> str:
+    """Команда чтения диапазона байт файла с фильтрацией строк по времени."""
+    command = f"tail -c +{start + 1} -- {shlex.quote(path)}"
+    if end is not None:
+        command += f" | head -c {end - start}"
+    return command + time_filter(since, until, reverse=False)
+
+
+_log_index: LogIndex | None = None
+
+
+def get_log_index() -> LogIndex:
+    """Возвращает общий индекс логов."""
+    global _log_index
+    if _log_index is None:
+        _log_index = LogIndex()
+    return _log_index
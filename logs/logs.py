@@ -1,270 +1,280 @@
+import re
 import shlex
 import logging
 from telegram import Update
 from telegram.ext import ContextTypes
-from auth.auth import Auth
-from utils.ssh import connect_ssh, execute_ssh_command
-from utils.telegram import send_paginated_message
-from config import VPS_HOST, VPS_USERNAME, VPS_KEY_PATH, VPS_PASSWORD
+from auth.auth import get_auth
+from utils.ssh import ssh_pool, execute_ssh_command, read_ssh_lines, SSHCommandStream
+from utils.telegram import reply, send_paginated_message
+from config import VPS_HOST, LOG_MAX_LINES, LOG_MAX_BYTES, LOG_SEARCH_MAX_MATCHES, LOG_SEARCH_PARALLEL
+from .search import build_search_command, normalize_timestamp, parse_search_line, FILE_HEADER_PREFIX
+from .stream import log_hub, LogSubscriber
+from .index import get_log_index, range_command
+
+logger = logging.getLogger(__name__)
+
+
+def parse_search_options(args: list[str]) -> dict:
+    """Разбирает опции /log_logs: --max N, --context N, --since T, --until T."""
+    options = {"max_matches": LOG_SEARCH_MAX_MATCHES, "context_lines": 0, "since": None, "until": None}
+    i = 0
+    while i < len(args):
+        name = args[i]
+        if name not in ("--max", "--context", "--since", "--until") or i + 1 >= len(args):
+            raise ValueError(f"Неизвестная опция или нет значения: {name}")
+        value = args[i + 1]
+        if name == "--max":
+            options["max_matches"] = min(int(value), LOG_MAX_LINES)
+            if options["max_matches"] <= 0:
+                raise ValueError("--max должен быть положительным числом")
+        elif name == "--context":
+            options["context_lines"] = min(max(int(value), 0), 20)
+        elif name == "--since":
+            options["since"] = normalize_timestamp(value)
+        else:
+            options["until"] = normalize_timestamp(value, end=True)
+        i += 2
+    return options
 
 
 async def handle_logs(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обрабатывает команду /logs <path> <pattern>."""
-    auth = Auth()
+    """Обрабатывает команду /log_logs <path_glob> <pattern> [--max N] [--context N] [--since T] [--until T]."""
+    auth = get_auth()
     if not auth.is_authorized_user(update.message.from_user.id):
-        await update.message.reply_text("Вы не авторизованы. Обратитесь к администратору.")
+        await reply(update, "Вы не авторизованы. Обратитесь к администратору.")
         return
     if not auth.check_permission(update.message.from_user.id, "logs_view"):
-        await update.message.reply_text("У вас нет прав на просмотр логов.")
+        await reply(update, "У вас нет прав на просмотр логов.")
         return
 
-    if len(context.args) != 2:
-        await update.message.reply_text("Использование: /logs <path> <pattern>")
+    if len(context.args) < 2:
+        await reply(update,
+            "Использование: /log_logs <path_glob> <pattern> [--max N] [--context N] "
+            "[--since YYYY-MM-DDTHH:MM] [--until YYYY-MM-DDTHH:MM]")
         return
 
-    path, pattern = context.args
-    if not path.startswith("/"):
-        await update.message.reply_text("Пожалуйста, используйте абсолютный путь для файла логов (начинающийся с /).")
+    path_glob, pattern = context.args[:2]
+    if not path_glob.startswith("/"):
+        await reply(update, "Пожалуйста, используйте абсолютный путь для файла логов (начинающийся с /).")
         return
 
-    ssh = None
     try:
-        ssh = connect_ssh(VPS_HOST, VPS_USERNAME, VPS_PASSWORD, VPS_KEY_PATH)
-
-        command = f'test -f {shlex.quote(path)} && test -r {shlex.quote(path)} && echo "readable"'
-        stdout, stderr, exit_status = execute_ssh_command(ssh, command)
-        if exit_status != 0 or stdout.strip() != "readable":
-            await update.message.reply_text(f"Ошибка: Файл {path} не существует или недоступен для чтения: {stderr}")
-            return
-
-        command = f'grep {shlex.quote(pattern)} {shlex.quote(path)}'
-        await update.message.reply_text(f"Выполняю команду: {command}")
-        stdout, stderr, exit_status = execute_ssh_command(ssh, command)
-        await update.message.reply_text(f"Результат grep: exit_status={exit_status}, stderr={stderr.strip()}")
-
-        if exit_status not in (0, 1):
-            await update.message.reply_text(f"Ошибка при поиске в логе: {stderr}")
-            return
-        if not stdout.strip():
-            await update.message.reply_text(f"В файле {path} не найдено строк, соответствующих шаблону '{pattern}'.")
-            return
+        options = parse_search_options(context.args[2:])
+    except ValueError as e:
+        await reply(update, f"Ошибка в опциях: {e}")
+        return
 
-        response = f"Результат поиска в {path} (шаблон: {pattern}):\n{stdout}"
-        await send_paginated_message(update, response)
+    max_matches = options["max_matches"]
+    command = build_search_command(path_glob, pattern, parallel=LOG_SEARCH_PARALLEL, **options)
+    try:
+        async with ssh_pool.connection() as ssh:
+            await reply(update, f"Ищу '{pattern}' в {path_glob} (от новых записей к старым)...")
+            lines, errors, found, limited, last_match = [], [], 0, False, 0
+            async with SSHCommandStream(ssh, command, max_bytes=LOG_MAX_BYTES) as stream:
+                async for name, line in stream:
+                    if name == "stderr":
+                        errors.append(line)
+                        continue
+                    text, is_match = parse_search_line(line)
+                    if is_match:
+                        if found == max_matches:
+                            # Совпадение сверх лимита только подтверждает усечение; его контекст отбрасываем
+                            limited = True
+                            del lines[next((i for i in range(last_match, len(lines))
+                                            if lines[i] == "--" or lines[i].startswith(FILE_HEADER_PREFIX)),
+                                           len(lines)):]
+                            break
+                        found += 1
+                        last_match = len(lines)
+                    lines.append(text)
+            truncated = limited or stream.truncated
+
+            if not truncated and stream.exit_status not in (0, 1):
+                await reply(update, f"Ошибка при поиске в логе: {' '.join(errors)}")
+                return
+            if not found:
+                await reply(update, f"В файлах {path_glob} не найдено строк, соответствующих шаблону '{pattern}'.")
+                return
+
+            response = f"Результат поиска в {path_glob} (шаблон: {pattern}, новые сначала):\n" + "\n".join(lines)
+            if truncated:
+                response += f"\n... поиск остановлен после {found} совпадений."
+            await send_paginated_message(update, response, name="grep")
     except Exception as e:
-        await update.message.reply_text(f"Произошла ошибка: {str(e)}")
-    finally:
-        if ssh:
-            ssh.close()
+        await reply(update, f"Произошла ошибка: {str(e)}")
 
 async def handle_tail(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обрабатывает команду /tail <path> [n]."""
-    auth = Auth()
+    auth = get_auth()
     if not auth.is_authorized_user(update.message.from_user.id):
-        await update.message.reply_text("Вы не авторизованы. Обратитесь к администратору.")
+        await reply(update, "Вы не авторизованы. Обратитесь к администратору.")
         return
     if not auth.check_permission(update.message.from_user.id, "logs_view"):
-        await update.message.reply_text("У вас нет прав на просмотр логов.")
+        await reply(update, "У вас нет прав на просмотр логов.")
         return
 
     if len(context.args) not in (1, 2):
-        await update.message.reply_text("Использование: /tail <path> [n]")
+        await reply(update, "Использование: /tail <path> [n]")
         return
 
     path = context.args[0]
     n_lines = context.args[1] if len(context.args) == 2 else "10"
 
     if not path.startswith("/"):
-        await update.message.reply_text("Пожалуйста, используйте абсолютный путь для файла логов (начинающийся с /).")
+        await reply(update, "Пожалуйста, используйте абсолютный путь для файла логов (начинающийся с /).")
         return
 
     try:
         n_lines = int(n_lines)
         if n_lines <= 0:
-            await update.message.reply_text("Количество строк должно быть положительным числом.")
+            await reply(update, "Количество строк должно быть положительным числом.")
             return
+        n_lines = min(n_lines, LOG_MAX_LINES)
     except ValueError:
-        await update.message.reply_text("Количество строк должно быть числом.")
+        await reply(update, "Количество строк должно быть числом.")
         return
 
-    ssh = None
     try:
-        ssh = connect_ssh(VPS_HOST, VPS_USERNAME, VPS_PASSWORD, VPS_KEY_PATH)
+        async with ssh_pool.connection() as ssh:
+            command = f'test -f {shlex.quote(path)} && test -r {shlex.quote(path)} && echo "readable"'
+            stdout, stderr, exit_status = await execute_ssh_command(ssh, command)
+            if exit_status != 0 or stdout.strip() != "readable":
+                await reply(update, f"Ошибка: Файл {path} не существует или недоступен для чтения: {stderr}")
+                return
+
+            command = f'tail -n {n_lines} {shlex.quote(path)}'
+            logger.debug(f"Выполняю команду: {command}")
+            stdout, stderr, exit_status, truncated = await read_ssh_lines(ssh, command, max_bytes=LOG_MAX_BYTES)
+            logger.debug(f"Результат tail: exit_status={exit_status}, stderr={stderr.strip()}")
+
+            if not truncated and exit_status != 0:
+                await reply(update, f"Ошибка при получении строк лога: {stderr}")
+                return
+            if not stdout.strip():
+                await reply(update, f"Файл {path} пуст.")
+                return
+
+            response = f"Последние {n_lines} строк из {path}:\n{stdout}"
+            if truncated:
+                response += f"\n... вывод обрезан по лимиту {LOG_MAX_BYTES} байт."
+            await send_paginated_message(update, response, name="tail")
+    except Exception as e:
+        await reply(update, f"Произошла ошибка: {str(e)}")
 
-        command = f'test -f {shlex.quote(path)} && test -r {shlex.quote(path)} && echo "readable"'
-        stdout, stderr, exit_status = execute_ssh_command(ssh, command)
-        if exit_status != 0 or stdout.strip() != "readable":
-            await update.message.reply_text(f"Ошибка: Файл {path} не существует или недоступен для чтения: {stderr}")
-            return
+async def handle_logs_between(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает команду /logs_between <path> <from> <to>: читает только участок файла,
+    найденный по индексу времени, вместо просмотра всего файла."""
+    auth = get_auth()
+    if not auth.is_authorized_user(update.message.from_user.id):
+        await reply(update, "Вы не авторизованы. Обратитесь к администратору.")
+        return
+    if not auth.check_permission(update.message.from_user.id, "logs_view"):
+        await reply(update, "У вас нет прав на просмотр логов.")
+        return
 
-        command = f'tail -n {n_lines} {shlex.quote(path)}'
-        await update.message.reply_text(f"Выполняю команду: {command}")
-        stdout, stderr, exit_status = execute_ssh_command(ssh, command)
-        await update.message.reply_text(f"Результат tail: exit_status={exit_status}, stderr={stderr.strip()}")
+    if len(context.args) != 3:
+        await reply(update, "Использование: /logs_between <path> <YYYY-MM-DDTHH:MM> <YYYY-MM-DDTHH:MM>")
+        return
 
-        if exit_status != 0:
-            await update.message.reply_text(f"Ошибка при получении строк лога: {stderr}")
-            return
-        if not stdout.strip():
-            await update.message.reply_text(f"Файл {path} пуст.")
-            return
+    path = context.args[0]
+    if not path.startswith("/"):
+        await reply(update, "Пожалуйста, используйте абсолютный путь для файла логов (начинающийся с /).")
+        return
+
+    try:
+        since = normalize_timestamp(context.args[1])
+        until = normalize_timestamp(context.args[2], end=True)
+    except ValueError as e:
+        await reply(update, f"Ошибка: {e}")
+        return
+    if since > until:
+        await reply(update, "Начало интервала должно быть раньше конца.")
+        return
 
-        response = f"Последние {n_lines} строк из {path}:\n{stdout}"
-        await send_paginated_message(update, response)
+    index = get_log_index()
+    try:
+        async with ssh_pool.connection() as ssh:
+            size = await index.extend(ssh, VPS_HOST, path)
+            start, end = index.lookup(VPS_HOST, path, since, until)
+            end = size if end is None else end
+            await reply(update, f"Читаю {path}: байты {start}-{end} из {size} по индексу времени...")
+            stdout, stderr, exit_status, truncated = await read_ssh_lines(
+                ssh, range_command(path, start, end, since, until), max_lines=LOG_MAX_LINES, max_bytes=LOG_MAX_BYTES)
+
+            if not truncated and exit_status != 0:
+                await reply(update, f"Ошибка при чтении лога: {stderr}")
+                return
+            if not stdout.strip():
+                await reply(update, f"В {path} нет строк с {since} по {until}.")
+                return
+
+            response = f"Строки {path} с {since} по {until}:\n{stdout}"
+            if truncated:
+                response += f"\n... вывод обрезан по лимиту {LOG_MAX_LINES} строк или {LOG_MAX_BYTES} байт."
+            await send_paginated_message(update, response, name="range")
+    except FileNotFoundError as e:
+        await reply(update, f"Ошибка: {e}")
     except Exception as e:
-        await update.message.reply_text(f"Произошла ошибка: {str(e)}")
-    finally:
-        if ssh:
-            ssh.close()
+        await reply(update, f"Произошла ошибка: {str(e)}")
 
 async def handle_monitor_logs(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обрабатывает команду /monitor_logs <path> [interval]."""
+    """Обрабатывает команду /monitor_logs <path> [pattern]."""
     logger.debug(f"Получена команда /monitor_logs: args={context.args}, user_id={update.message.from_user.id}")
-    auth = Auth()
+    auth = get_auth()
     if not auth.is_authorized_user(update.message.from_user.id):
-        await update.message.reply_text("Вы не авторизованы. Обратитесь к администратору.")
+        await reply(update, "Вы не авторизованы. Обратитесь к администратору.")
         return
     if not auth.check_permission(update.message.from_user.id, "logs_monitor"):
-        await update.message.reply_text("У вас нет прав на мониторинг логов.")
+        await reply(update, "У вас нет прав на мониторинг логов.")
         return
 
     if len(context.args) not in (1, 2):
-        await update.message.reply_text("Использование: /monitor_logs <path> [interval]")
+        await reply(update, "Использование: /monitor_logs <path> [pattern]")
         return
 
     path = context.args[0]
-    interval = float(context.args[1]) if len(context.args) == 2 else 5.0
-
     if not path.startswith("/"):
-        await update.message.reply_text("Пожалуйста, используйте абсолютный путь для файла логов (начинающийся с /).")
+        await reply(update, "Пожалуйста, используйте абсолютный путь для файла логов (начинающийся с /).")
         return
 
-    try:
-        interval = float(interval)
-        if interval < 1.0:
-            await update.message.reply_text("Интервал должен быть не менее 1 секунды.")
+    pattern = None
+    if len(context.args) == 2:
+        try:
+            pattern = re.compile(context.args[1])
+        except re.error as e:
+            await reply(update, f"Неверное регулярное выражение: {e}")
             return
-    except ValueError:
-        await update.message.reply_text("Интервал должен быть числом.")
-        return
 
     user_id = update.message.from_user.id
-    if context.user_data is None:
-        context.user_data = {}
-    if f"monitor_job_{user_id}" in context.user_data:
-        await update.message.reply_text(
+    if log_hub.subscription(user_id) is not None:
+        await reply(update,
             "У вас уже запущен мониторинг логов. Остановите его с помощью /stop_monitoring.")
         return
 
-    ssh = None
     try:
-        ssh = connect_ssh(VPS_HOST, VPS_USERNAME, VPS_PASSWORD, VPS_KEY_PATH)
-
-        command = f'test -f {shlex.quote(path)} && test -r {shlex.quote(path)} && echo "readable"'
-        stdout, stderr, exit_status = execute_ssh_command(ssh, command)
-        if exit_status != 0 or stdout.strip() != "readable":
-            await update.message.reply_text(f"Ошибка: Файл {path} не существует или недоступен для чтения: {stderr}")
-            return
-
-        job = context.job_queue.run_repeating(
-            monitor_logs_job,
-            interval=interval,
-            data={"user_id": user_id, "path": path, "chat_id": update.message.chat_id, "last_output": "", "update": update},
-            name=f"monitor_logs_{user_id}"
-        )
-        context.user_data[f"monitor_job_{user_id}"] = job
-        await update.message.reply_text(
-            f"Начался мониторинг {path} (интервал {interval} сек). Для остановки используйте /stop_monitoring.")
+        stream = await log_hub.subscribe(path, LogSubscriber(user_id, update, pattern))
+        shared = f" (вместе с {len(stream.subscribers) - 1} другими)" if len(stream.subscribers) > 1 else ""
+        await reply(update,
+            f"Начался мониторинг {path}{shared}. Для остановки используйте /stop_monitoring.")
+    except FileNotFoundError as e:
+        await reply(update, f"Ошибка: {e}")
     except Exception as e:
-        await update.message.reply_text(f"Произошла ошибка: {str(e)}")
-    finally:
-        if ssh:
-            ssh.close()
-
-async def monitor_logs_job(context: ContextTypes.DEFAULT_TYPE):
-    """Фоновая задача для мониторинга логов."""
-    if not hasattr(context, "job") or not context.job:
-        return
-
-    user_id = context.job.data["user_id"]
-    path = context.job.data["path"]
-    chat_id = context.job.data["chat_id"]
-    update = context.job.data["update"]
-    last_output = context.job.data.get("last_output", "")
-
-    ssh = None
-    try:
-        ssh = connect_ssh(VPS_HOST, VPS_USERNAME, VPS_PASSWORD, VPS_KEY_PATH)
-
-        command = f'test -f {shlex.quote(path)} && test -r {shlex.quote(path)} && echo "readable"'
-        stdout, stderr, exit_status = execute_ssh_command(ssh, command)
-        if exit_status != 0 or stdout.strip() != "readable":
-            await update.message.reply_text(f"Ошибка: Файл {path} не существует или недоступен для чтения: {stderr}")
-            context.job.schedule_removal()
-            if context.user_data is not None:
-                context.user_data.pop(f"monitor_job_{user_id}", None)
-            return
-
-        command = f'tail -n 10 {shlex.quote(path)}'
-        stdout, stderr, exit_status = execute_ssh_command(ssh, command)
-        if exit_status != 0:
-            await update.message.reply_text(f"Ошибка при мониторинге лога: {stderr}")
-            context.job.schedule_removal()
-            if context.user_data is not None:
-                context.user_data.pop(f"monitor_job_{user_id}", None)
-            return
-
-        if not isinstance(stdout, str):
-            await update.message.reply_text(f"Ошибка при мониторинге: Неверный формат вывода лога")
-            context.job.schedule_removal()
-            if context.user_data is not None:
-                context.user_data.pop(f"monitor_job_{user_id}", None)
-            return
-
-        if not stdout.strip():
-            return
-        if stdout == last_output:
-            return
-
-        new_lines = stdout.strip().split("\n")[-10:]
-        response = f"Новые строки в {path}:\n" + "\n".join(new_lines)
-        await send_paginated_message(update, response)
-        context.job.data["last_output"] = stdout
-
-    except Exception as e:
-        await update.message.reply_text(f"Ошибка при мониторинге: {str(e)}")
-        context.job.schedule_removal()
-        if context.user_data is not None:
-            context.user_data.pop(f"monitor_job_{user_id}", None)
-    finally:
-        if ssh:
-            ssh.close()
+        await reply(update, f"Произошла ошибка: {str(e)}")
 
 async def handle_stop_monitoring(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обрабатывает команду /stop_monitoring."""
-    auth = Auth()
+    auth = get_auth()
     if not auth.is_authorized_user(update.message.from_user.id):
-        await update.message.reply_text("Вы не авторизованы. Обратитесь к администратору.")
+        await reply(update, "Вы не авторизованы. Обратитесь к администратору.")
         return
     if not auth.check_permission(update.message.from_user.id, "logs_monitor"):
-        await update.message.reply_text("У вас нет прав на мониторинг логов.")
-        return
-
-    user_id = update.message.from_user.id
-    job_key = f"monitor_job_{user_id}"
-    if context.user_data is None or job_key not in context.user_data:
-        await update.message.reply_text("Нет активного мониторинга логов.")
+        await reply(update, "У вас нет прав на мониторинг логов.")
         return
 
-    job = context.user_data[job_key]
     try:
-        if job and job.enabled:
-            job.schedule_removal()
-            context.user_data.pop(job_key, None)
-            await update.message.reply_text("Мониторинг логов остановлен.")
-        else:
-            context.user_data.pop(job_key, None)
-            await update.message.reply_text("Мониторинг уже был остановлен или не существует.")
+        if not await log_hub.unsubscribe(update.message.from_user.id):
+            await reply(update, "Нет активного мониторинга логов.")
+            return
+        await reply(update, "Мониторинг логов остановлен.")
     except Exception as e:
-        context.user_data.pop(job_key, None)
-        await update.message.reply_text(f"Ошибка при остановке мониторинга: {str(e)}")
+        await reply(update, f"Ошибка при остановке мониторинга: {str(e)}")
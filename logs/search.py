@@ -0,0 +1,110 @@
+import re
+import shlex
+
+TIMESTAMP_ARG_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2})?)?$")
+FILE_HEADER_PREFIX = "==> "
+GREP_LINE_PATTERN = re.compile(r"^\d+([:-])")
+# Печатает перевернутый вывод grep -n до m-го совпадения включительно вместе с его контекстом
+NEWEST_MATCHES_PROGRAM = '/^[0-9]+:/ { n++ } n > m || (n == m && $0 == "--") { exit } { print }'
+
+
+def quote_glob(pattern: str) -> str:
+    """Экранирует путь для shell, оставляя активными символы шаблона * ? [ ]."""
+    return re.sub(r"([^\w*?\[\]/.\-])", r"\\\1", pattern)
+
+
+def normalize_timestamp(value: str, end: bool = False) -> str:
+    """Приводит время вида 2024-01-01[THH:MM[:SS]] к "YYYY-MM-DD HH:MM:SS" для строкового сравнения.
+    Для верхней границы недостающие части дополняются до конца интервала."""
+    if not TIMESTAMP_ARG_PATTERN.match(value):
+        raise ValueError(f"Неверный формат времени: {value}. Используйте YYYY-MM-DD[THH:MM[:SS]]")
+    value = value.replace("T", " ")
+    if len(value) == 10:
+        value += " 23:59:59" if end else " 00:00:00"
+    elif len(value) == 16:
+        value += ":59" if end else ":00"
+    return value
+
+
+def time_filter(since: str | None, until: str | None, reverse: bool) -> str:
+    """awk-фильтр по префиксу времени строки. При чтении с конца файла (reverse) поиск прекращается,
+    как только строки стали старше since, при чтении с начала - как только стали новее until."""
+    if not since and not until:
+        return ""
+    stop = "s != \"\" && t < s" if reverse else "u != \"\" && t > u"
+    program = (f"{{ t = substr($0, 1, 19); sub(/T/, \" \", t); if (t !~ /^[0-9][0-9][0-9][0-9]-/) next; if ({stop}) exit }} "
+               f"(s == \"\" || t >= s) && (u == \"\" || t <= u)")
+    return f" | awk -v s={shlex.quote(since or '')} -v u={shlex.quote(until or '')} {shlex.quote(program)}"
+
+
+def build_search_command(path_glob: str, pattern: str, max_matches: int, context_lines: int = 0,
+                         since: str | None = None, until: str | None = None, parallel: int = 4) -> str:
+    """Строит удаленный скрипт поиска по файлам, подходящим под шаблон пути (включая ротированные
+    .gz/.zst/.bz2/.xz). Файлы обрабатываются от новых к старым пачками по parallel штук, совпадения
+    внутри файла выдаются от новых к старым; каждый файл предваряется строкой "==> путь <==".
+    Строки выводятся в формате grep -n ("N:" - совпадение, "N-" - контекст, см. parse_search_line).
+    Считаются только совпадения, а не строки контекста; ищется на одно совпадение больше max_matches,
+    чтобы отличить усечение от результата ровно из max_matches совпадений."""
+    limit = max_matches + 1
+    context_option = f" -C {context_lines}" if context_lines > 0 else ""
+    grep = f"grep -a -n -m {limit}{context_option} -e {shlex.quote(pattern)}"
+    grep_all = f"grep -a -n{context_option} -e {shlex.quote(pattern)}"
+    # Для сжатых файлов (читаются с начала) - последние limit совпадений вместе с их контекстом
+    newest = f"tac | awk -v m={limit} {shlex.quote(NEWEST_MATCHES_PROGRAM)}"
+    plain_filter = time_filter(since, until, reverse=True)
+    packed_filter = time_filter(since, until, reverse=False)
+    since_check = ""
+    if since:
+        since_check = f'touch -d {shlex.quote(since)} "$tmp/.since" || exit 2'
+    return f"""
+tmp=$(mktemp -d) || exit 2
+trap 'rm -rf "$tmp"' EXIT
+trap 'rm -rf "$tmp"; exit 1' HUP PIPE TERM
+{since_check}
+search() {{
+    case "$1" in
+        *.gz) zcat -- "$1"{packed_filter} | {grep_all} | {newest} ;;
+        *.zst) zstdcat -- "$1"{packed_filter} | {grep_all} | {newest} ;;
+        *.bz2) bzcat -- "$1"{packed_filter} | {grep_all} | {newest} ;;
+        *.xz) xzcat -- "$1"{packed_filter} | {grep_all} | {newest} ;;
+        *) tac -- "$1"{plain_filter} | {grep} ;;
+    esac
+}}
+ls -1td -- {quote_glob(path_glob)} 2>/dev/null | {{
+    i=0; batch=0; found=0
+    emit() {{
+        j=$batch
+        while [ "$j" -lt "$i" ]; do
+            if [ -s "$tmp/$j" ]; then
+                printf '{FILE_HEADER_PREFIX}%s <==\\n' "$(cat "$tmp/$j.name")"
+                cat "$tmp/$j"
+                found=$((found + $(grep -c '^[0-9]*:' "$tmp/$j")))
+            fi
+            j=$((j + 1))
+        done
+        batch=$i
+    }}
+    while IFS= read -r f; do
+        [ -f "$f" ] || continue
+        if [ -e "$tmp/.since" ] && [ ! "$f" -nt "$tmp/.since" ]; then break; fi
+        printf '%s' "$f" > "$tmp/$i.name"
+        search "$f" > "$tmp/$i" 2>/dev/null &
+        i=$((i + 1))
+        if [ $((i - batch)) -ge {parallel} ]; then
+            wait; emit
+            [ "$found" -ge {limit} ] && exit 0
+        fi
+    done
+    wait; emit
+    [ "$i" -gt 0 ] || {{ echo {shlex.quote(f"Нет файлов, подходящих под {path_glob}")} >&2; exit 3; }}
+}}
+"""
+
+
+def parse_search_line(line: str) -> tuple[str, bool]:
+    """Разбирает строку вывода build_search_command: возвращает текст без номера grep -n
+    и признак совпадения (False для контекста, разделителей "--" и заголовков файлов)."""
+    match = GREP_LINE_PATTERN.match(line)
+    if match is None:
+        return line, False
+    return line[match.end():], match.group(1) == ":"
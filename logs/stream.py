@@ -0,0 +1,283 @@
+import asyncio
+import logging
+import os
+import re
+import shlex
+
+import paramiko
+from telegram import Update
+
+from utils.ssh import ssh_pool, execute_ssh_command, execute_ssh_command_raw, SSHCommandStream
+from utils.telegram import reply, send_paginated_message
+from config import VPS_HOST, LOG_MONITOR_MAX_BYTES, LOG_MONITOR_MAX_MISSES, LOG_STREAM_FLUSH_INTERVAL, \
+    LOG_STREAM_RETRY_DELAY
+from .index import get_log_index, line_timestamp
+
+logger = logging.getLogger(__name__)
+
+
+def _read_appended_command(path: str, inode: int | None, offset: int, max_bytes: int) -> str:
+    """Строит команду, которая печатает заголовок "inode size start old_len" и затем
+    дописанные байты: сначала остаток ротированного файла (если inode сменился), потом новые данные."""
+    quoted = shlex.quote(path)
+    directory = shlex.quote(os.path.dirname(path) or "/")
+    known_inode = inode if inode is not None else ""
+    return f"""
+f={quoted}
+cur=$(stat -L -c '%i %s' -- "$f") || exit 3
+set -- $cur
+ino=$1; size=$2; start={offset}; old=""; old_len=0
+if [ -n "{known_inode}" ] && [ "$ino" != "{known_inode}" ]; then
+    old=$(find {directory} -maxdepth 1 -inum {known_inode or 0} 2>/dev/null | head -n 1)
+    if [ -n "$old" ]; then
+        old_len=$(( $(stat -c %s -- "$old") - {offset} ))
+        [ "$old_len" -lt 0 ] && old_len=0
+        [ "$old_len" -gt {max_bytes} ] && old_len={max_bytes}
+    fi
+    start=0
+elif [ "$size" -lt "$start" ]; then
+    start=0
+fi
+echo "$ino $size $start $old_len"
+if [ "$old_len" -gt 0 ]; then tail -c +{offset + 1} -- "$old" | head -c "$old_len"; fi
+tail -c +$((start + 1)) -- "$f" | head -c {max_bytes}
+"""
+
+
+async def read_appended(ssh, path: str, inode: int | None, offset: int,
+                        max_bytes: int = LOG_MONITOR_MAX_BYTES) -> tuple[int, int, bytes]:
+    """Читает байты, дописанные в файл после offset, с учетом ротации (смена inode) и усечения файла.
+    Возвращает новый inode, новое смещение и прочитанные полные строки."""
+    stdout, stderr, exit_status = await execute_ssh_command_raw(
+        ssh, _read_appended_command(path, inode, offset, max_bytes))
+    if exit_status != 0:
+        raise FileNotFoundError(f"Файл {path} не существует или недоступен для чтения: {stderr.strip()}")
+
+    header, _, data = stdout.partition(b"\n")
+    new_inode, size, start, old_len = (int(value) for value in header.split())
+    old_data, new_data = data[:old_len], data[old_len:]
+    if old_data and not old_data.endswith(b"\n"):
+        old_data += b"\n"
+
+    # Незавершенную последнюю строку оставляем до следующего опроса, если буфер не заполнен целиком
+    if len(new_data) < max_bytes and not new_data.endswith(b"\n"):
+        new_data = new_data[:new_data.rfind(b"\n") + 1]
+    return new_inode, start + len(new_data), old_data + new_data
+
+
+async def stat_log_file(ssh: paramiko.SSHClient, path: str) -> tuple[int, int]:
+    """Возвращает inode и размер читаемого файла."""
+    command = f'test -r {shlex.quote(path)} && stat -L -c "%i %s" -- {shlex.quote(path)}'
+    stdout, stderr, exit_status = await execute_ssh_command(ssh, command)
+    if exit_status != 0 or len(stdout.split()) != 2:
+        raise FileNotFoundError(f"Файл {path} не существует или недоступен для чтения: {stderr.strip()}")
+    inode, size = (int(value) for value in stdout.split())
+    return inode, size
+
+
+class LogSubscriber:
+    """Подписчик потока лога: куда отправлять строки и какой фильтр к ним применять."""
+
+    def __init__(self, user_id: int, update: Update, pattern: re.Pattern | None = None):
+        self.user_id = user_id
+        self.update = update
+        self.pattern = pattern
+        self.lines: list[str] = []
+
+
+class LogStream:
+    """Один долгоживущий удаленный tail -F на пару (host, path) с рассылкой новых строк подписчикам.
+    Хранит inode и байтовое смещение, чтобы после обрыва соединения продолжить с того же места."""
+
+    def __init__(self, host: str, path: str):
+        self.host = host
+        self.path = path
+        self.subscribers: dict[int, LogSubscriber] = {}
+        self.inode: int | None = None
+        self.offset: int | None = None
+        self._task: asyncio.Task | None = None
+        self._flusher: asyncio.Task | None = None
+        self._index_start: int | None = None
+        self._index_next = 0
+        self._index_entries: list[tuple[int, str]] = []
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        for task in (self._task, self._flusher):
+            if task is not None:
+                task.cancel()
+        await asyncio.gather(*(t for t in (self._task, self._flusher) if t is not None), return_exceptions=True)
+        await self._flush()
+        self._record_index()
+
+    def _dispatch(self, lines: list[str]):
+        for subscriber in self.subscribers.values():
+            if subscriber.pattern is None:
+                subscriber.lines.extend(lines)
+            else:
+                subscriber.lines.extend(line for line in lines if subscriber.pattern.search(line))
+
+    async def _flush(self):
+        for subscriber in list(self.subscribers.values()):
+            if not subscriber.lines:
+                continue
+            lines, subscriber.lines = subscriber.lines, []
+            try:
+                await send_paginated_message(subscriber.update, f"Новые строки в {self.path}:\n" + "\n".join(lines))
+            except Exception as e:
+                logger.warning(f"Не удалось отправить строки лога {self.path} пользователю {subscriber.user_id}: {e}")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(LOG_STREAM_FLUSH_INTERVAL)
+            await self._flush()
+            self._record_index()
+
+    def _index_line(self, offset: int, line: bytes):
+        """Запоминает время строки как кандидата в индекс, если с прошлой записи прошло достаточно байт."""
+        if self._index_start is None or offset < self._index_next:
+            return
+        ts = line_timestamp(line)
+        if ts is not None:
+            self._index_entries.append((offset, ts))
+            self._index_next = offset + get_log_index().step
+
+    def _record_index(self):
+        """Дописывает прочитанный потоком диапазон в индекс времени, если индекс для файла уже построен."""
+        if self._index_start is None or self.inode is None or self.offset == self._index_start:
+            return
+        try:
+            get_log_index().record(self.host, self.path, self.inode, self._index_start, self.offset,
+                                   self._index_entries)
+        except Exception as e:
+            logger.warning(f"Не удалось обновить индекс {self.path}: {e}")
+        self._index_start, self._index_entries = self.offset, []
+
+    async def _start_index(self, ssh: paramiko.SSHClient):
+        index = get_log_index()
+        self._index_start, self._index_entries = None, []
+        if index.state(self.host, self.path) is None:
+            return
+        try:
+            await index.extend(ssh, self.host, self.path)
+        except Exception as e:
+            logger.warning(f"Не удалось достроить индекс {self.path}: {e}")
+            return
+        self._index_start = self.offset
+        self._index_next = index.next_entry_offset(self.host, self.path)
+
+    async def _notify(self, text: str):
+        for subscriber in list(self.subscribers.values()):
+            try:
+                await reply(subscriber.update, text)
+            except Exception as e:
+                logger.warning(f"Не удалось уведомить пользователя {subscriber.user_id}: {e}")
+
+    async def _follow(self, ssh: paramiko.SSHClient):
+        if self.offset is None:
+            self.inode, self.offset = await stat_log_file(ssh, self.path)
+        else:
+            # Догоняем то, что было дописано (или ротировано) за время переподключения
+            inode, offset, chunk = await read_appended(ssh, self.path, self.inode, self.offset)
+            if inode != self.inode and self.inode is not None:
+                await self._notify(f"Файл {self.path} был ротирован.")
+            self.inode, self.offset = inode, offset
+            if chunk:
+                self._dispatch(chunk.decode(errors="replace").rstrip("\n").split("\n"))
+        await self._start_index(ssh)
+
+        command = f"tail -c +{self.offset + 1} -F -- {shlex.quote(self.path)}"
+        async with SSHCommandStream(ssh, command, decode=False) as stream:
+            async for name, line in stream:
+                if name == "stderr":
+                    message = line.decode(errors="replace")
+                    if "has been replaced" in message or "truncated" in message:
+                        # tail -F перешел на новый файл и читает его с начала
+                        self.inode, self.offset = None, 0
+                        self._index_start, self._index_entries = None, []
+                    continue
+                self._index_line(self.offset, line)
+                self.offset += len(line) + 1
+                self._dispatch([line.decode(errors="replace")])
+            raise ConnectionError(f"Поток tail для {self.path} завершился (код {stream.exit_status})")
+
+    async def _run(self):
+        misses = 0
+        try:
+            while self.subscribers:
+                try:
+                    async with ssh_pool.stream_connection(self.host) as ssh:
+                        await self._follow(ssh)
+                except FileNotFoundError as e:
+                    misses += 1
+                    if misses >= LOG_MONITOR_MAX_MISSES:
+                        log_hub.drop(self)
+                        await self._flush()
+                        await self._notify(f"Ошибка: {e}. Мониторинг остановлен.")
+                        self.subscribers.clear()
+                        return
+                except Exception as e:
+                    logger.warning(f"Поток лога {self.path} прерван, переподключаюсь: {e}")
+                else:
+                    misses = 0
+                await asyncio.sleep(LOG_STREAM_RETRY_DELAY)
+        finally:
+            if self._flusher is not None:
+                self._flusher.cancel()
+
+
+class LogStreamHub:
+    """Реестр потоков логов: один tail -F на (host, path), сколько бы пользователей за ним ни следило."""
+
+    def __init__(self):
+        self._streams: dict[tuple[str, str], LogStream] = {}
+
+    def subscription(self, user_id: int) -> LogStream | None:
+        """Возвращает поток, на который подписан пользователь."""
+        for stream in self._streams.values():
+            if user_id in stream.subscribers:
+                return stream
+        return None
+
+    async def subscribe(self, path: str, subscriber: LogSubscriber, host: str = VPS_HOST) -> LogStream:
+        """Подписывает пользователя на поток; поток запускается при первой подписке."""
+        key = (host, path)
+        stream = self._streams.get(key)
+        if stream is None:
+            async with ssh_pool.connection(host) as ssh:
+                await stat_log_file(ssh, path)
+            stream = self._streams.setdefault(key, LogStream(host, path))
+        stream.subscribers[subscriber.user_id] = subscriber
+        if stream._task is None:
+            stream.start()
+        return stream
+
+    async def unsubscribe(self, user_id: int) -> bool:
+        """Отписывает пользователя; поток останавливается, когда уходит последний подписчик."""
+        stream = self.subscription(user_id)
+        if stream is None:
+            return False
+        subscriber = stream.subscribers.pop(user_id)
+        if not stream.subscribers:
+            self.drop(stream)
+            await stream.stop()
+        if subscriber.lines:
+            await send_paginated_message(subscriber.update, f"Новые строки в {stream.path}:\n" + "\n".join(subscriber.lines))
+        return True
+
+    def drop(self, stream: LogStream):
+        """Удаляет поток из реестра."""
+        if self._streams.get((stream.host, stream.path)) is stream:
+            del self._streams[(stream.host, stream.path)]
+
+    async def close_all(self):
+        """Останавливает все потоки."""
+        streams = list(self._streams.values())
+        self._streams.clear()
+        await asyncio.gather(*(stream.stop() for stream in streams), return_exceptions=True)
+
+
+log_hub = LogStreamHub()
@@ -2,12 +2,40 @@ from telegram import Update
 from telegram.ext import Application
 from config import TELEGRAM_TOKEN
 from commands import register_commands
+from utils.ssh import ssh_pool
+from logs.stream import log_hub
+from utils.telegram import outbound_queue
+from deploy.jobs import deploy_scheduler
+from utils.inventory import get_inventory
+from containers.watcher import container_watcher
+from containers.metrics import metrics_sampler
+from containers.alerts import get_alert_engine
+from containers.follow import container_log_hub
+
+async def post_init(application: Application):
+    """Запускает фоновое отслеживание состояния и метрик контейнеров и проверку правил тревог."""
+    container_watcher.start()
+    metrics_sampler.start()
+    get_alert_engine().start(application.bot)
+
+async def post_shutdown(application: Application):
+    """Останавливает фоновые потоки и задания, досылает очередь сообщений и закрывает SSH-соединения."""
+    await log_hub.close_all()
+    await container_log_hub.close_all()
+    await container_watcher.stop()
+    await metrics_sampler.stop()
+    await get_alert_engine().stop()
+    await deploy_scheduler.close_all()
+    await outbound_queue.close()
+    ssh_pool.close_all()
 
 def main():
     """Запускает бота."""
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    get_inventory()
+    application = (Application.builder().token(TELEGRAM_TOKEN).concurrent_updates(True)
+                   .post_init(post_init).post_shutdown(post_shutdown).build())
     register_commands(application)
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,95 @@
+import json
+import os
+
+from config import INVENTORY_PATH, VPS_HOST, VPS_USERNAME, VPS_PASSWORD, VPS_KEY_PATH
+
+DEFAULT_HOST_NAME = "default"
+
+
+class Host:
+    """Сервер из инвентаря: имя, адрес и учетные данные SSH."""
+
+    def __init__(self, name: str, host: str, username: str | None = None, password: str | None = None,
+                 key_path: str | None = None):
+        self.name = name
+        self.host = host
+        self.username = username
+        self.password = password
+        self.key_path = key_path
+
+    @property
+    def credentials(self) -> tuple[str, str | None, str | None, str | None]:
+        """Аргументы для ssh_pool.connection."""
+        return self.host, self.username, self.password, self.key_path
+
+
+class Inventory:
+    """Инвентарь серверов: хосты, группы хостов и цель по умолчанию.
+
+    Формат файла (JSON):
+        {"hosts": {"staging": {"host": "10.0.0.5", "username": "deploy", "key_path": "~/.ssh/id_rsa"}, ...},
+         "groups": {"prod": ["prod-a", "prod-b"]},
+         "default": "staging"}
+    Не указанные у хоста username, password и key_path берутся из VPS_USERNAME, VPS_PASSWORD и VPS_KEY_PATH."""
+
+    def __init__(self, hosts: dict[str, Host], groups: dict[str, list[str]] | None = None,
+                 default: str | None = None):
+        self.hosts = hosts
+        self.groups = groups or {}
+        self.default = default or next(iter(hosts), None)
+        for group, members in self.groups.items():
+            unknown = [name for name in members if name not in hosts]
+            if unknown:
+                raise ValueError(f"В группе {group} неизвестные хосты: {', '.join(unknown)}")
+        if self.default is not None and self.default not in hosts and self.default not in self.groups:
+            raise ValueError(f"Цель по умолчанию {self.default} не найдена в инвентаре")
+
+    def resolve(self, target: str | None = None) -> list[Host]:
+        """Возвращает хосты по имени хоста, группы или "all"; без имени - цель по умолчанию."""
+        target = target or self.default
+        if target == "all":
+            return list(self.hosts.values())
+        if target in self.groups:
+            return [self.hosts[name] for name in self.groups[target]]
+        if target in self.hosts:
+            return [self.hosts[target]]
+        raise KeyError(f"Хост или группа {target} не найдены в инвентаре")
+
+    def get(self, name: str | None = None) -> Host:
+        """Возвращает один хост по имени; без имени - хост по умолчанию."""
+        hosts = self.resolve(name)
+        if len(hosts) != 1:
+            raise KeyError(f"{name or self.default} - группа, а не отдельный хост")
+        return hosts[0]
+
+    def is_known(self, target: str) -> bool:
+        return target == "all" or target in self.hosts or target in self.groups
+
+
+def load_inventory(path: str = INVENTORY_PATH) -> Inventory:
+    """Загружает инвентарь из файла; если файла нет, инвентарь состоит из одного хоста VPS_HOST."""
+    if not os.path.exists(path):
+        return Inventory({DEFAULT_HOST_NAME: Host(DEFAULT_HOST_NAME, VPS_HOST, VPS_USERNAME, VPS_PASSWORD,
+                                                  VPS_KEY_PATH)})
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    hosts = {}
+    for name, options in data.get("hosts", {}).items():
+        if "host" not in options:
+            raise ValueError(f"Для хоста {name} не указан адрес (host)")
+        hosts[name] = Host(name, options["host"], options.get("username", VPS_USERNAME),
+                           options.get("password", VPS_PASSWORD), options.get("key_path", VPS_KEY_PATH))
+    if not hosts:
+        raise ValueError(f"В инвентаре {path} нет хостов")
+    return Inventory(hosts, data.get("groups"), data.get("default"))
+
+
+_inventory: Inventory | None = None
+
+
+def get_inventory() -> Inventory:
+    """Возвращает инвентарь, загруженный при запуске."""
+    global _inventory
+    if _inventory is None:
+        _inventory = load_inventory()
+    return _inventory
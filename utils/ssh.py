@@ -1,7 +1,26 @@
+import asyncio
 import os
+import select
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 
 import paramiko
 
+from config import VPS_HOST, VPS_USERNAME, VPS_PASSWORD, VPS_KEY_PATH, SSH_KEEPALIVE_INTERVAL, SSH_MAX_SESSIONS, \
+    SSH_WORKERS, SSH_MAX_STREAMS
+
+_executor = ThreadPoolExecutor(max_workers=SSH_WORKERS, thread_name_prefix="ssh")
+
+
+async def run_blocking(func, *args):
+    """Выполняет блокирующую SSH-операцию в пуле потоков, не останавливая цикл событий."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, func, *args)
+
+
 def connect_ssh(host: str, username: str, password: str, key_path: str) -> paramiko.SSHClient:
     """Устанавливает SSH-соединение."""
     ssh = paramiko.SSHClient()
@@ -9,15 +28,264 @@ def connect_ssh(host: str, username: str, password: str, key_path: str) -> param
     ssh.connect(host, username=username, password=password, key_filename=key_path)
     return ssh
 
-def execute_ssh_command(ssh: paramiko.SSHClient, command: str) -> tuple[str, str, int]:
+
+class SSHPool:
+    """Пул постоянных SSH-соединений: одно аутентифицированное соединение на хост,
+    для каждой команды открывается отдельный канал поверх общего транспорта.
+    Долгоживущие потоки (tail -F, docker events, docker stats, docker logs -f) идут через второе
+    соединение с хостом и свой лимит, чтобы не занимать слоты команд обработчиков."""
+
+    def __init__(self, keepalive: int = SSH_KEEPALIVE_INTERVAL, max_sessions: int = SSH_MAX_SESSIONS,
+                 max_streams: int = SSH_MAX_STREAMS):
+        self.keepalive = keepalive
+        self.max_sessions = max_sessions
+        self.max_streams = max_streams
+        self._clients: dict[tuple[str, str, str], paramiko.SSHClient] = {}
+        self._semaphores: dict[tuple[str, str, str], asyncio.Semaphore] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _is_alive(ssh: paramiko.SSHClient) -> bool:
+        """Проверяет, что транспорт соединения активен и аутентифицирован."""
+        transport = ssh.get_transport()
+        return transport is not None and transport.is_active() and transport.is_authenticated()
+
+    def get_client(self, host: str, username: str, password: str, key_path: str,
+                   kind: str = "commands") -> paramiko.SSHClient:
+        """Возвращает живое соединение с хостом, при необходимости переподключаясь.
+        kind - назначение соединения: "commands" или "streams"."""
+        key = (host, username, kind)
+        with self._lock:
+            ssh = self._clients.get(key)
+            if ssh is not None and self._is_alive(ssh):
+                return ssh
+            if ssh is not None:
+                ssh.close()
+            ssh = connect_ssh(host, username, password, key_path)
+            ssh.get_transport().set_keepalive(self.keepalive)
+            self._clients[key] = ssh
+            return ssh
+
+    def discard(self, host: str, username: str, ssh: paramiko.SSHClient | None = None, kind: str = "commands"):
+        """Закрывает соединение с хостом, чтобы следующий запрос установил новое."""
+        key = (host, username, kind)
+        with self._lock:
+            current = self._clients.get(key)
+            if current is None or (ssh is not None and current is not ssh):
+                return
+            del self._clients[key]
+        current.close()
+
+    @asynccontextmanager
+    async def connection(self, host: str = VPS_HOST, username: str = VPS_USERNAME,
+                         password: str = VPS_PASSWORD, key_path: str = VPS_KEY_PATH):
+        """Выдает общее соединение с хостом, ограничивая число одновременных сессий."""
+        async with self._lease("commands", self.max_sessions, host, username, password, key_path) as ssh:
+            yield ssh
+
+    @asynccontextmanager
+    async def stream_connection(self, host: str = VPS_HOST, username: str = VPS_USERNAME,
+                                password: str = VPS_PASSWORD, key_path: str = VPS_KEY_PATH):
+        """Выдает соединение для долгоживущего потока. Это отдельное соединение с хостом со своим лимитом
+        max_streams: потоки не занимают слоты connection() и не делят с командами лимит каналов
+        на одно соединение (MaxSessions в sshd). Читать поток нужно через SSHCommandStream."""
+        async with self._lease("streams", self.max_streams, host, username, password, key_path) as ssh:
+            yield ssh
+
+    @asynccontextmanager
+    async def _lease(self, kind: str, limit: int, host: str, username: str, password: str, key_path: str):
+        semaphore = self._semaphores.setdefault((host, username, kind), asyncio.Semaphore(limit))
+        async with semaphore:
+            ssh = await run_blocking(self.get_client, host, username, password, key_path, kind)
+            try:
+                yield ssh
+            except (paramiko.SSHException, EOFError, OSError):
+                if not self._is_alive(ssh):
+                    self.discard(host, username, ssh, kind)
+                raise
+
+    def close_all(self):
+        """Закрывает все соединения пула."""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for ssh in clients:
+            ssh.close()
+
+
+ssh_pool = SSHPool()
+
+
+def _poll_channel(channel: paramiko.Channel, chunk_size: int) -> tuple[str | None, bytes] | None:
+    """Неблокирующее чтение: порция stdout или stderr, (None, b"") в конце вывода или None, если данных пока нет."""
+    if channel.recv_stderr_ready():
+        return "stderr", channel.recv_stderr(chunk_size)
+    if channel.recv_ready():
+        return "stdout", channel.recv(chunk_size)
+    if channel.eof_received or channel.closed:
+        return None, b""
+    return None
+
+
+def _read_channel(channel: paramiko.Channel, chunk_size: int = 32768,
+                  timeout: float | None = None) -> tuple[str | None, bytes]:
+    """Читает очередную порцию stdout или stderr канала; (None, b"") означает конец вывода.
+    Оба потока читаются поочередно, поэтому переполнение окна одного из них не блокирует другой."""
+    started = time.monotonic()
+    while True:
+        chunk = _poll_channel(channel, chunk_size)
+        if chunk is not None:
+            return chunk
+        if timeout is not None and time.monotonic() - started > timeout:
+            raise TimeoutError(f"Нет вывода от команды более {timeout} сек")
+        select.select([channel], [], [], 0.1)
+
+
+def _execute_ssh_command(ssh: paramiko.SSHClient, command: str, timeout: float | None) -> tuple[bytes, bytes, int]:
+    channel = ssh.get_transport().open_session(timeout=timeout)
+    try:
+        channel.exec_command(command)
+        output = {"stdout": [], "stderr": []}
+        while True:
+            stream, data = _read_channel(channel, timeout=timeout)
+            if stream is None:
+                break
+            output[stream].append(data)
+        exit_status = channel.recv_exit_status()
+    finally:
+        channel.close()
+    return b"".join(output["stdout"]), b"".join(output["stderr"]), exit_status
+
+
+async def execute_ssh_command(ssh: paramiko.SSHClient, command: str,
+                              timeout: float | None = None) -> tuple[str, str, int]:
     """Выполняет SSH-команду и возвращает stdout, stderr и exit_status."""
-    stdin, stdout, stderr = ssh.exec_command(command)
-    exit_status = stdout.channel.recv_exit_status()
-    return stdout.read().decode(), stderr.read().decode(), exit_status
+    stdout, stderr, exit_status = await run_blocking(_execute_ssh_command, ssh, command, timeout)
+    return stdout.decode(errors="replace"), stderr.decode(errors="replace"), exit_status
 
 
-def download_file(ssh: paramiko.SSHClient, remote_path: str, local_path: str):
-    """Скачивает файл через SFTP."""
+async def execute_ssh_command_raw(ssh: paramiko.SSHClient, command: str,
+                                  timeout: float | None = None) -> tuple[bytes, str, int]:
+    """Выполняет SSH-команду и возвращает stdout без декодирования (для работы с байтовыми смещениями)."""
+    stdout, stderr, exit_status = await run_blocking(_execute_ssh_command, ssh, command, timeout)
+    return stdout, stderr.decode(errors="replace"), exit_status
+
+
+class SSHCommandStream:
+    """Асинхронный итератор по строкам вывода удаленной команды: выдает пары (stream, line),
+    где stream - "stdout" или "stderr", а line - строка без перевода строки (bytes, если decode=False).
+    При превышении max_lines или max_bytes канал закрывается, а truncated становится True;
+    exit_status заполняется только при штатном завершении.
+    Ожидание вывода не занимает поток пула: дескриптор канала отслеживается циклом событий,
+    а раз в poll_interval состояние канала перепроверяется, поэтому поток может жить сколько угодно."""
+
+    def __init__(self, ssh: paramiko.SSHClient, command: str, max_lines: int | None = None,
+                 max_bytes: int | None = None, get_pty: bool = False, chunk_size: int = 32768,
+                 decode: bool = True, poll_interval: float = 1.0):
+        self.ssh = ssh
+        self.command = command
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.get_pty = get_pty
+        self.chunk_size = chunk_size
+        self.decode = decode
+        self.poll_interval = poll_interval
+        self.exit_status: int | None = None
+        self.truncated = False
+        self._channel: paramiko.Channel | None = None
+        self._partial = {"stdout": b"", "stderr": b""}
+        self._pending: deque[tuple[str, bytes]] = deque()
+        self._lines = 0
+        self._bytes = 0
+        self._finished = False
+
+    def _open(self) -> paramiko.Channel:
+        channel = self.ssh.get_transport().open_session()
+        if self.get_pty:
+            channel.get_pty()
+        channel.exec_command(self.command)
+        return channel
+
+    async def _wait_readable(self):
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        fd = self._channel.fileno()
+        loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await asyncio.wait_for(ready, self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            loop.remove_reader(fd)
+
+    async def _read(self) -> tuple[str | None, bytes]:
+        while (chunk := _poll_channel(self._channel, self.chunk_size)) is None:
+            await self._wait_readable()
+        if chunk[0] is None:
+            if self._channel.exit_status_ready():
+                self.exit_status = self._channel.exit_status
+            else:
+                self.exit_status = await run_blocking(self._channel.recv_exit_status)
+        return chunk
+
+    def _feed(self, stream: str, data: bytes):
+        *lines, self._partial[stream] = (self._partial[stream] + data).split(b"\n")
+        for line in lines:
+            self._pending.append((stream, line))
+
+    async def __aenter__(self):
+        self._channel = await run_blocking(self._open)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """Закрывает канал; удаленная команда получит SIGPIPE при следующей записи."""
+        if self._channel is not None and not self._channel.closed:
+            await run_blocking(self._channel.close)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> tuple[str, str | bytes]:
+        while not self._pending:
+            if self._finished:
+                raise StopAsyncIteration
+            stream, data = await self._read()
+            if stream is None:
+                for name, rest in self._partial.items():
+                    if rest:
+                        self._pending.append((name, rest))
+                self._finished = True
+            else:
+                self._feed(stream, data)
+
+        stream, line = self._pending.popleft()
+        self._lines += 1
+        self._bytes += len(line) + 1
+        if (self.max_lines is not None and self._lines > self.max_lines) or \
+                (self.max_bytes is not None and self._bytes > self.max_bytes):
+            self.truncated = True
+            self._pending.clear()
+            self._finished = True
+            await self.close()
+            raise StopAsyncIteration
+        return stream, line.decode(errors="replace") if self.decode else line
+
+
+async def read_ssh_lines(ssh: paramiko.SSHClient, command: str, max_lines: int | None = None,
+                         max_bytes: int | None = None) -> tuple[str, str, int | None, bool]:
+    """Выполняет команду, читая вывод потоком с ограничениями.
+    Возвращает stdout, stderr, exit_status (None при усечении) и признак усечения."""
+    output = {"stdout": [], "stderr": []}
+    async with SSHCommandStream(ssh, command, max_lines=max_lines, max_bytes=max_bytes) as stream:
+        async for name, line in stream:
+            output[name].append(line)
+    return "\n".join(output["stdout"]), "\n".join(output["stderr"]), stream.exit_status, stream.truncated
+
+
+def _download_file(ssh: paramiko.SSHClient, remote_path: str, local_path: str):
     sftp = ssh.open_sftp()
     try:
         os.makedirs(os.path.dirname(local_path), exist_ok=True)
@@ -26,10 +294,19 @@ def download_file(ssh: paramiko.SSHClient, remote_path: str, local_path: str):
         sftp.close()
 
 
-def upload_file(ssh: paramiko.SSHClient, local_path: str, remote_path: str):
-    """Загружает файл на VPS через SFTP."""
+async def download_file(ssh: paramiko.SSHClient, remote_path: str, local_path: str):
+    """Скачивает файл через SFTP."""
+    await run_blocking(_download_file, ssh, remote_path, local_path)
+
+
+def _upload_file(ssh: paramiko.SSHClient, local_path: str, remote_path: str):
     sftp = ssh.open_sftp()
     try:
         sftp.put(local_path, remote_path)
     finally:
-        sftp.close()
\ No newline at end of file
+        sftp.close()
+
+
+async def upload_file(ssh: paramiko.SSHClient, local_path: str, remote_path: str):
+    """Загружает файл на VPS через SFTP."""
+    await run_blocking(_upload_file, ssh, local_path, remote_path)
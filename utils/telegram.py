@@ -1,31 +1,308 @@
-from telegram import Update
+import asyncio
+import gzip
+import logging
+from collections import deque
+
+from telegram import Bot, Message, Update
+from telegram.error import RetryAfter, BadRequest, NetworkError, TelegramError
+
+from config import TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_INTERVAL, TELEGRAM_SEND_ATTEMPTS, \
+    OUTPUT_ATTACHMENT_THRESHOLD, OUTPUT_COMPRESSION, LIVE_MESSAGE_INTERVAL
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 4096
+MAX_CAPTION_LENGTH = 1024
+
+
+class OutboundMessage:
+    """Сообщение в очереди на отправку: текст, документ (document и filename), где text - подпись,
+    или новый текст уже отправленного сообщения (edit_message_id). Если задан sent, в него
+    передается отправленное сообщение (None при неудаче)."""
+
+    def __init__(self, bot: Bot, text: str, document: bytes | None = None, filename: str | None = None,
+                 edit_message_id: int | None = None, sent: asyncio.Future | None = None):
+        self.bot = bot
+        self.text = text
+        self.document = document
+        self.filename = filename
+        self.edit_message_id = edit_message_id
+        self.sent = sent
+        self.attempts = 0
+
+    def resolve(self, message: Message | None):
+        if self.sent is not None and not self.sent.done():
+            self.sent.set_result(message)
+
+
+class OutboundQueue:
+    """Очередь исходящих сообщений: ограничивает частоту отправки в каждый чат и глобально,
+    склеивает серии мелких сообщений в один чат и повторяет отправку после RetryAfter."""
+
+    def __init__(self, global_rate: float = TELEGRAM_GLOBAL_RATE, chat_interval: float = TELEGRAM_CHAT_INTERVAL,
+                 max_attempts: int = TELEGRAM_SEND_ATTEMPTS):
+        self.global_interval = 1 / global_rate
+        self.chat_interval = chat_interval
+        self.max_attempts = max_attempts
+        self._pending: dict[int, deque[OutboundMessage]] = {}
+        self._next_send: dict[int, float] = {}
+        self._global_next = 0.0
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    def put(self, bot: Bot, chat_id: int, text: str):
+        """Ставит сообщение в очередь и сразу возвращает управление."""
+        self._enqueue(chat_id, OutboundMessage(bot, text))
+
+    def put_document(self, bot: Bot, chat_id: int, data: bytes, filename: str, caption: str = ""):
+        """Ставит документ в очередь, сохраняя порядок относительно текстовых сообщений."""
+        self._enqueue(chat_id, OutboundMessage(bot, caption, document=data, filename=filename))
+
+    async def send_and_wait(self, bot: Bot, chat_id: int, text: str) -> Message | None:
+        """Отправляет сообщение через очередь и дожидается его отправки; None, если отправить не удалось."""
+        sent = asyncio.get_running_loop().create_future()
+        self._enqueue(chat_id, OutboundMessage(bot, text, sent=sent))
+        return await sent
+
+    def put_edit(self, bot: Bot, chat_id: int, message_id: int, text: str):
+        """Ставит в очередь замену текста сообщения. Еще не отправленная правка того же сообщения
+        заменяется новой, поэтому частые обновления не копятся в очереди."""
+        for message in self._pending.get(chat_id, ()):
+            if message.edit_message_id == message_id and message.attempts == 0:
+                message.text = text
+                return
+        self._enqueue(chat_id, OutboundMessage(bot, text, edit_message_id=message_id))
+
+    def _enqueue(self, chat_id: int, message: OutboundMessage):
+        self._pending.setdefault(chat_id, deque()).append(message)
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+
+    def _take(self, chat_id: int) -> OutboundMessage:
+        """Извлекает следующее сообщение, склеивая с ним идущие подряд короткие сообщения."""
+        queue = self._pending[chat_id]
+        message = queue.popleft()
+        if message.document is not None or message.edit_message_id is not None or message.sent is not None:
+            return message
+        parts = [message.text]
+        length = len(message.text)
+        while queue and queue[0].attempts == 0 and queue[0].document is None and \
+                queue[0].edit_message_id is None and queue[0].sent is None and length + 1 + len(queue[0].text) <= MAX_MESSAGE_LENGTH:
+            text = queue.popleft().text
+            parts.append(text)
+            length += 1 + len(text)
+        message.text = "\n".join(parts)
+        return message
+
+    async def _send(self, chat_id: int):
+        loop = asyncio.get_running_loop()
+        message = self._take(chat_id)
+        message.attempts += 1
+        try:
+            if message.document is not None:
+                sent = await message.bot.send_document(chat_id=chat_id, document=message.document,
+                                                       filename=message.filename, caption=message.text or None)
+            elif message.edit_message_id is not None:
+                sent = await message.bot.edit_message_text(chat_id=chat_id, message_id=message.edit_message_id,
+                                                           text=message.text)
+            else:
+                sent = await message.bot.send_message(chat_id=chat_id, text=message.text)
+            self._next_send[chat_id] = loop.time() + self.chat_interval
+            message.resolve(sent)
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+            logger.warning(f"Лимит Telegram для чата {chat_id}, повтор через {retry_after} сек")
+            self._pending[chat_id].appendleft(message)
+            self._next_send[chat_id] = loop.time() + retry_after
+        except BadRequest as e:
+            if "not modified" not in str(e):
+                logger.error(f"Telegram отклонил сообщение в чат {chat_id}: {e}")
+            message.resolve(None)
+        except NetworkError as e:
+            if message.attempts >= self.max_attempts:
+                logger.error(f"Сообщение в чат {chat_id} не отправлено после {message.attempts} попыток: {e}")
+                message.resolve(None)
+                return
+            self._pending[chat_id].appendleft(message)
+            self._next_send[chat_id] = loop.time() + 2 ** message.attempts
+        except TelegramError as e:
+            logger.error(f"Ошибка отправки сообщения в чат {chat_id}: {e}")
+            message.resolve(None)
+        except asyncio.CancelledError:
+            message.resolve(None)
+            raise
+        except Exception as e:
+            # Непредвиденная ошибка одного сообщения не должна останавливать очередь
+            logger.exception(f"Ошибка отправки сообщения в чат {chat_id}: {e}")
+            message.resolve(None)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            waiting = {chat_id: self._next_send.get(chat_id, 0.0) for chat_id, queue in self._pending.items() if queue}
+            ready = sorted((chat_id for chat_id, at in waiting.items() if at <= now), key=waiting.get)
+            if not ready:
+                for chat_id in [chat_id for chat_id, queue in self._pending.items() if not queue]:
+                    del self._pending[chat_id]
+                self._wakeup.clear()
+                timeout = min(waiting.values()) - now if waiting else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            for chat_id in ready:
+                delay = self._global_next - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self._global_next = loop.time() + self.global_interval
+                await self._send(chat_id)
+
+    async def close(self, timeout: float = 10.0):
+        """Дожидается отправки оставшихся сообщений и останавливает очередь. Ожидающие send_and_wait
+        для неотправленных сообщений получают None."""
+        if self._task is None:
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while any(self._pending.values()) and loop.time() < deadline and not self._task.done():
+            await asyncio.sleep(0.1)
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        for queue in self._pending.values():
+            for message in queue:
+                message.resolve(None)
+        self._pending.clear()
+
+
+outbound_queue = OutboundQueue()
+
+
+class LiveMessage:
+    """Одно сообщение с постоянно меняющимся текстом (прогресс долгой операции):
+    обновляется редактированием не чаще раза в interval секунд, промежуточные состояния пропускаются."""
+
+    def __init__(self, update: Update, interval: float = LIVE_MESSAGE_INTERVAL):
+        self.bot = update.get_bot()
+        self.chat_id = update.effective_chat.id
+        self.interval = interval
+        self.message_id: int | None = None
+        self._text = ""
+        self._shown = ""
+        self._timer: asyncio.Task | None = None
+
+    async def start(self, text: str):
+        """Отправляет исходное сообщение."""
+        self._text = self._shown = text[:MAX_MESSAGE_LENGTH]
+        message = await outbound_queue.send_and_wait(self.bot, self.chat_id, self._text)
+        self.message_id = message.message_id if message is not None else None
+
+    def set(self, text: str):
+        """Задает новый текст; он будет показан при ближайшем плановом обновлении."""
+        self._text = text[:MAX_MESSAGE_LENGTH]
+        if self._timer is None:
+            self._timer = asyncio.create_task(self._refresh_later())
+
+    async def _refresh_later(self):
+        await asyncio.sleep(self.interval)
+        self._timer = None
+        self._refresh()
+
+    def _refresh(self):
+        if self.message_id is None or self._text == self._shown:
+            return
+        outbound_queue.put_edit(self.bot, self.chat_id, self.message_id, self._text)
+        self._shown = self._text
+
+    def finish(self, text: str):
+        """Показывает итоговый текст сразу, без ожидания интервала."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._text = text[:MAX_MESSAGE_LENGTH]
+        if self.message_id is None:
+            outbound_queue.put(self.bot, self.chat_id, self._text)
+            return
+        self._refresh()
+
+
+async def reply(update: Update, text: str):
+    """Ставит ответ в чат пользователя в очередь исходящих сообщений."""
+    outbound_queue.put(update.get_bot(), update.effective_chat.id, text)
+
 
 async def send_unauthorized_message(update: Update):
     """Отправляет сообщение об отсутствии прав."""
-    await update.message.reply_text("У вас нет прав для выполнения этой команды.")
+    await reply(update, "У вас нет прав для выполнения этой команды.")
+
+
+def split_message(text: str, max_length: int = 4000) -> list[str]:
+    """Разбивает текст на части не длиннее max_length по границам строк за линейное время.
+    Строки длиннее max_length режутся на куски."""
+    chunks = []
+    current: list[str] = []
+    size = 0
+    for line in text.split("\n"):
+        while len(line) > max_length:
+            if current:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            chunks.append(line[:max_length])
+            line = line[max_length:]
+        added = len(line) + (1 if current else 0)
+        if current and size + added > max_length:
+            chunks.append("\n".join(current))
+            current, size = [line], len(line)
+        else:
+            current.append(line)
+            size += added
+    if current:
+        chunks.append("\n".join(current))
+    return [chunk.strip() for chunk in chunks if chunk.strip()]
+
 
+def compress_output(text: str, name: str = "output") -> tuple[bytes, str]:
+    """Сжимает текст в zstd (если выбран и доступен модуль zstandard) или gzip; возвращает данные и имя файла."""
+    data = text.encode()
+    if OUTPUT_COMPRESSION == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=10).compress(data), f"{name}.txt.zst"
+    return gzip.compress(data, compresslevel=6), f"{name}.txt.gz"
 
-async def send_paginated_message(update: Update, text: str, max_length: int = 4000):
-    """Отправляет длинное сообщение, разбивая его на части, если превышает max_length."""
+
+async def send_output_document(update: Update, text: str, name: str = "output"):
+    """Отправляет вывод сжатым вложением с краткой сводкой в подписи."""
+    data, filename = compress_output(text, name)
+    first_line = text.split("\n", 1)[0]
+    summary = (f"{first_line}\n"
+               f"Вывод слишком большой ({text.count(chr(10)) + 1} строк, {len(text.encode()) // 1024} КБ), "
+               f"полностью во вложении {filename} ({len(data) // 1024} КБ).")
+    outbound_queue.put_document(update.get_bot(), update.effective_chat.id, data, filename,
+                                summary[:MAX_CAPTION_LENGTH])
+
+
+async def send_paginated_message(update: Update, text: str, max_length: int = 4000, name: str = "output"):
+    """Отправляет длинное сообщение, разбивая его на части, если превышает max_length.
+    Вывод больше OUTPUT_ATTACHMENT_THRESHOLD символов отправляется одним сжатым вложением."""
     if not isinstance(text, str):
-        await update.message.reply_text("Ошибка: Неверный формат данных для отправки.")
+        await reply(update, "Ошибка: Неверный формат данных для отправки.")
         return
 
     if not text.strip():
         return
 
-    if len(text) <= max_length:
-        await update.message.reply_text(text)
+    if len(text) > OUTPUT_ATTACHMENT_THRESHOLD:
+        await send_output_document(update, text, name)
         return
 
-    lines = text.split("\n")
-    current_message = ""
-    for line in lines:
-        if len(current_message) + len(line) + 1 > max_length:
-            await update.message.reply_text(current_message.strip())
-            current_message = line + "\n"
-        else:
-            current_message += line + "\n"
-
-    if current_message:
-        await update.message.reply_text(current_message.strip())
\ No newline at end of file
+    for chunk in split_message(text, max_length):
+        await reply(update, chunk)